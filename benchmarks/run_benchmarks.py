@@ -0,0 +1,375 @@
+import os
+import sys
+import json
+import time
+import platform
+import resource
+import argparse
+import subprocess
+import multiprocessing as mp
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+# Both pipelines are flat script directories; their module names do not overlap
+sys.path.insert(0, os.path.join(REPO_DIR, "bucket-model"))
+sys.path.insert(0, os.path.join(REPO_DIR, "naive-catboost-strategy", "production"))
+
+from synthetic import generate, parse_count
+
+
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+DATA_DIR = os.path.join(BENCH_DIR, "data")
+BUCKET_SIZES = [100, 75, 50, 25]
+
+
+class StageClock:
+    """Times the measured part of a stage (setup such as loading inputs is excluded)."""
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.cpu_seconds = 0.0
+
+    @contextmanager
+    def measure(self):
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            self.seconds += time.perf_counter() - wall
+            self.cpu_seconds += time.process_time() - cpu
+
+
+def _bucket_inputs(ctx, max_hosts=None):
+    """Superhost frame, port matrix and notebook-style features of the ingested parts (optionally a host sample)."""
+    from port_store import read_port_matrix
+    from port_features import PortFeatureEngine
+
+    if not os.path.isdir(ctx["parts_dir"]):
+        raise FileNotFoundError(f"{ctx['parts_dir']} is missing; run the ingest stage first")
+    df, port_matrix = read_port_matrix(ctx["parts_dir"])
+    if max_hosts and len(df) > max_hosts:
+        keep = np.sort(np.random.default_rng(ctx["seed"]).choice(len(df), max_hosts, replace=False))
+        df, port_matrix = df.iloc[keep].reset_index(drop=True), port_matrix[keep]
+    engine = PortFeatureEngine(port_matrix)
+
+    X = pd.DataFrame(index=df.index)
+    X["org_name"] = df["org_name"].astype("category").cat.codes
+    X["asn"] = pd.to_numeric(df["asn"], errors="coerce").astype("Int64")
+    X["country_code"] = df["country_code"].astype("category").cat.codes
+    X["province"] = df["province"].astype("category").cat.codes
+    X["has_reverse_dns"] = df["has_reverse_dns"].astype(int)
+    X["udp_ratio"] = df["udp_ratio"]
+    X["unique_services"] = df["unique_services"]
+    X["num_svr"] = df["num_svr"]
+    X["num_ports_active"] = engine.num_ports_active()
+    X["port_entropy"] = engine.port_entropy()
+    return df, engine, X
+
+
+def stage_ingest(ctx, clock):
+    from ingest import ingest
+
+    with clock.measure():
+        results = ingest(ctx["dataset_dir"], ctx["parts_dir"], 100, workers=ctx["workers"])
+    failed = [r["shard"] for r in results if r["error"]]
+    if failed:
+        raise RuntimeError(f"ingest failed for {failed}")
+    return sum(r["hosts"] for r in results)
+
+
+def stage_bucket_labels(ctx, clock):
+    from port_store import read_port_matrix
+    from port_features import PortFeatureEngine
+
+    with clock.measure():
+        df, port_matrix = read_port_matrix(ctx["parts_dir"])
+        engine = PortFeatureEngine(port_matrix)
+        engine.bucket_labels_multi(BUCKET_SIZES)
+        engine.port_entropy()
+    return len(df)
+
+
+def stage_cooccurrence(ctx, clock):
+    from sklearn.model_selection import train_test_split
+    from cooccurrence import BucketCoOccurrence
+
+    df, engine, _ = _bucket_inputs(ctx)
+    labels = engine.bucket_labels(100)
+    idx_train, _ = train_test_split(np.arange(len(df)), test_size=0.3, random_state=42)
+    with clock.measure():
+        model = BucketCoOccurrence().fit(labels[idx_train])
+        model.transform(labels)
+    return len(df)
+
+
+def _bucket_split(ctx):
+    from sklearn.model_selection import train_test_split
+
+    df, engine, X = _bucket_inputs(ctx, ctx["train_hosts"])
+    y = engine.bucket_frame(100, index=df.index)
+    idx_train, idx_val = train_test_split(np.arange(len(df)), test_size=0.3, random_state=42)
+    return X.iloc[idx_train], y.iloc[idx_train], X.iloc[idx_val], y.iloc[idx_val]
+
+
+def stage_bucket_training(ctx, clock):
+    from multilabel import train_per_bucket
+    from ensemble import BucketEnsemble
+
+    X_train, y_train, X_val, y_val = _bucket_split(ctx)
+    with clock.measure():
+        params = {"iterations": ctx["iterations"], "train_dir": ctx["train_dir"]}
+        models = train_per_bucket(X_train, y_train, X_val, y_val, params=params, thread_budget=ctx["threads"],
+                                  log=lambda message: None)
+    BucketEnsemble.from_bucket_models(models).save(ctx["ensemble_path"])
+    return len(models.models)
+
+
+def stage_bucket_prediction(ctx, clock):
+    from ensemble import BucketEnsemble
+
+    if not os.path.exists(ctx["ensemble_path"]):
+        raise FileNotFoundError(f"{ctx['ensemble_path']} is missing; run the bucket_training stage first")
+    ensemble = BucketEnsemble.load(ctx["ensemble_path"])
+    _, _, X = _bucket_inputs(ctx)
+    with clock.measure():
+        ensemble.predict(X, output="packed", n_jobs=ctx["threads"])
+    return len(X)
+
+
+def stage_metrics_at_k(ctx, clock):
+    from metrics_at_k import compute_precision_recall_f1_at_k
+
+    y_true = pd.read_parquet(ctx["val_path"], columns=["label"])["label"].to_numpy()[:ctx["metrics_rows"]]
+    classes = np.unique(y_true)
+    rng = np.random.default_rng(ctx["seed"])
+    y_proba = rng.random((len(y_true), len(classes)), dtype=np.float32)
+    y_proba /= y_proba.sum(axis=1, keepdims=True)
+    with clock.measure():
+        for k in (1, 5, 30):
+            compute_precision_recall_f1_at_k(y_true, y_proba, k, classes)
+    return len(y_true)
+
+
+def _naive_config(ctx):
+    return {
+        "train_path": ctx["train_path"],
+        "val_path": ctx["val_path"],
+        "feature_columns": ["location_country_code_encoded", "whois_organization_encoded", "whois_network_encoded", "port", "ipv4"],
+        "label_column": "label",
+        "pool_cache_dir": os.path.join(ctx["work_dir"], "pools"),
+        "border_count": 254,
+    }
+
+
+def stage_pool_cache(ctx, clock):
+    from dataset_cache import prepare_pools
+
+    with clock.measure():
+        cache_path = prepare_pools(_naive_config(ctx), rebuild=True)
+    with open(os.path.join(cache_path, "meta.json"), 'r') as f:
+        return json.load(f)["train_rows"]
+
+
+def stage_sweep_objective(ctx, clock):
+    """One sweep trial as run_worker's objective runs it on CPU: fit on the cached pools, score, combine."""
+    from catboost import CatBoostClassifier
+    from dataset_cache import load_pools
+    from sweep_parameter import score_model, score_function
+
+    train_pool, val_pool, y_val = load_pools(_naive_config(ctx))
+    params = {
+        "iterations": ctx["iterations"],
+        "depth": 6,
+        "learning_rate": 0.1,
+        "l2_leaf_reg": 3.0,
+        "random_strength": 1.0,
+        "eval_metric": "Accuracy",
+        "loss_function": "MultiClass",
+        "task_type": "CPU",
+        "verbose": 0,
+        "train_dir": ctx["train_dir"],
+    }
+    with clock.measure():
+        start = time.time()
+        model = CatBoostClassifier(**params, thread_count=ctx["threads"])
+        model.fit(train_pool, eval_set=val_pool, use_best_model=True)
+        acc, f1, loss = score_model(model, val_pool, y_val)
+        score_function(acc, f1, loss, time.time() - start, model.tree_count_)
+    return train_pool.num_row()
+
+
+STAGES = {
+    "ingest": stage_ingest,
+    "bucket_labels": stage_bucket_labels,
+    "cooccurrence": stage_cooccurrence,
+    "bucket_training": stage_bucket_training,
+    "bucket_prediction": stage_bucket_prediction,
+    "metrics_at_k": stage_metrics_at_k,
+    "pool_cache": stage_pool_cache,
+    "sweep_objective": stage_sweep_objective,
+}
+
+
+def _stage_child(queue, name, ctx):
+    clock = StageClock()
+    # ru_maxrss is reported in KiB on Linux; the child starts with the (small) footprint of the parent
+    rss_at_start = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    start = time.perf_counter()
+    try:
+        items = STAGES[name](ctx, clock)
+    except Exception as e:
+        # Report instead of dying silently, otherwise the parent would wait on the queue forever
+        queue.put({"error": f"{type(e).__name__}: {e}"})
+        return
+    queue.put({
+        "seconds": round(clock.seconds, 4),
+        "cpu_seconds": round(clock.cpu_seconds, 4),
+        "total_seconds": round(time.perf_counter() - start, 4),
+        "items": int(items),
+        "items_per_second": round(items / max(clock.seconds, 1e-9), 1),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "rss_at_start_mb": round(rss_at_start, 1),
+        # Worker processes started by the stage (e.g. the ingest process pool)
+        "children_peak_rss_mb": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+    })
+
+
+def run_stage(name, ctx):
+    """Run one stage in a fresh process so its peak memory is its own."""
+    proc_ctx = mp.get_context("fork")
+    queue = proc_ctx.Queue()
+    proc = proc_ctx.Process(target=_stage_child, args=(queue, name, ctx))
+    proc.start()
+    result = queue.get()
+    proc.join()
+    return result
+
+
+def git_revision():
+    def git(*args):
+        try:
+            return subprocess.run(["git", *args], cwd=REPO_DIR, capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    status = git("status", "--porcelain", "--untracked-files=no")
+    return {"commit": git("rev-parse", "HEAD"), "dirty": bool(status) if status is not None else None}
+
+
+def machine_info():
+    return {
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "memory_gb": round(os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / 1024 ** 3, 1),
+    }
+
+
+def prepare_data(data_dir, n_hosts, seed):
+    """Generate the synthetic snapshot unless data_dir already holds one for the same size and seed."""
+    meta_path = os.path.join(data_dir, "meta.json")
+    if os.path.exists(meta_path):
+        with open(meta_path, 'r') as f:
+            meta = json.load(f)
+        if meta["hosts"] == n_hosts and meta["seed"] == seed and meta["shards"]:
+            return meta
+    print(f"Generating {n_hosts} synthetic hosts in {data_dir}...")
+    return generate(data_dir, n_hosts, seed, log=lambda message: None)
+
+
+def compare(current, baseline_path, tolerance):
+    """Print per-stage time and memory ratios against a previous results file; returns the regressed stages."""
+    with open(baseline_path, 'r') as f:
+        baseline = json.load(f)
+    print(f"\nAgainst {os.path.basename(baseline_path)} (commit {str(baseline['git']['commit'])[:10]}):")
+    regressed = []
+    for name, result in current["stages"].items():
+        before = baseline["stages"].get(name)
+        if not before or "error" in before or "error" in result:
+            continue
+        time_ratio = result["seconds"] / max(before["seconds"], 1e-9)
+        memory_ratio = result["peak_rss_mb"] / max(before["peak_rss_mb"], 1e-9)
+        flag = ""
+        if time_ratio > 1 + tolerance or memory_ratio > 1 + tolerance:
+            flag = "  <-- regression"
+            regressed.append(name)
+        print(f"{name:>18}: time x{time_ratio:.2f} ({before['seconds']:.2f}s -> {result['seconds']:.2f}s), "
+              f"peak RSS x{memory_ratio:.2f}{flag}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time and memory-profile the pipeline stages on synthetic superhost data.")
+    parser.add_argument("--hosts", default="10k", help="Synthetic hosts, e.g. 10k, 1M, 10M")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-dir", default=None, help="Default: benchmarks/data/<hosts>_seed<seed>")
+    parser.add_argument("--stages", nargs="*", default=list(STAGES), choices=list(STAGES))
+    parser.add_argument("--threads", type=int, default=os.cpu_count())
+    parser.add_argument("--workers", type=int, default=None, help="Ingest processes (default: one per core)")
+    parser.add_argument("--iterations", type=int, default=100, help="CatBoost iterations for the training stages")
+    parser.add_argument("--train-hosts", type=int, default=20000, help="Host sample for bucket training")
+    parser.add_argument("--metrics-rows", type=int, default=1_000_000, help="Validation rows scored by metrics_at_k")
+    parser.add_argument("--output", default=None, help=f"Results JSON (default: {RESULTS_DIR}/<time>_<commit>.json)")
+    parser.add_argument("--compare", default=None, help="Previous results JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Relative slowdown/memory growth flagged by --compare")
+    args = parser.parse_args()
+
+    n_hosts = parse_count(args.hosts)
+    data_dir = args.data_dir or os.path.join(DATA_DIR, f"{args.hosts}_seed{args.seed}")
+    data_meta = prepare_data(data_dir, n_hosts, args.seed)
+
+    work_dir = os.path.join(data_dir, "work")
+    os.makedirs(work_dir, exist_ok=True)
+    ctx = {
+        "seed": args.seed,
+        "threads": args.threads,
+        "workers": args.workers,
+        "iterations": args.iterations,
+        "train_hosts": args.train_hosts,
+        "metrics_rows": args.metrics_rows,
+        "dataset_dir": os.path.join(data_dir, "dataset"),
+        "parts_dir": os.path.join(work_dir, "superhost_parts"),
+        "train_path": os.path.join(data_dir, "processed", "train.parquet"),
+        "val_path": os.path.join(data_dir, "processed", "val.parquet"),
+        "ensemble_path": os.path.join(work_dir, "bucket_ensemble_100.cbe"),
+        "work_dir": work_dir,
+        "train_dir": os.path.join(work_dir, "catboost_info"),
+    }
+
+    results = {
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "git": git_revision(),
+        "machine": machine_info(),
+        "data": data_meta,
+        "settings": {k: ctx[k] for k in ("seed", "threads", "workers", "iterations", "train_hosts", "metrics_rows")},
+        "stages": {},
+    }
+    for name in args.stages:
+        result = run_stage(name, ctx)
+        results["stages"][name] = result
+        if "error" in result:
+            print(f"{name:>18}: failed ({result['error']})")
+        else:
+            print(f"{name:>18}: {result['seconds']:.2f}s ({result['items_per_second']:.0f} items/s), "
+                  f"peak RSS {result['peak_rss_mb']:.0f} MB")
+
+    commit = (results["git"]["commit"] or "nogit")[:10]
+    output = args.output or os.path.join(RESULTS_DIR, f"{datetime.now().strftime('%Y%m%d-%H%M%S')}_{commit}_{args.hosts}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        regressed = compare(results, args.compare, args.tolerance)
+        if regressed:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+import os
+import json
+import time
+import argparse
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENCODINGS_DIR = os.path.join(REPO_DIR, "naive-catboost-strategy", "encodings")
+GENERATOR_VERSION = 1
+
+MAX_PORT = 65535
+OTHER_CODE = 1
+
+# Well-known ports and the service Censys usually reports on them; earlier entries are more common
+COMMON_PORTS = [
+    (80, "HTTP"), (443, "HTTP"), (22, "SSH"), (8080, "HTTP"), (21, "FTP"), (25, "SMTP"), (53, "DNS"),
+    (23, "TELNET"), (3389, "RDP"), (8443, "HTTP"), (3306, "MYSQL"), (110, "POP3"), (143, "IMAP"),
+    (445, "SMB"), (7547, "CWMP"), (161, "SNMP"), (123, "NTP"), (1723, "PPTP"), (5060, "SIP"),
+    (1900, "SSDP"), (5432, "POSTGRES"), (6379, "REDIS"), (5900, "VNC"), (554, "RTSP"), (1883, "MQTT"),
+    (1433, "MSSQL"), (9200, "ELASTICSEARCH"), (27017, "MONGODB"), (11211, "MEMCACHED"), (5353, "MDNS"),
+]
+UDP_SERVICES = {"DNS", "NTP", "SNMP", "SSDP", "MDNS", "SIP"}
+PROVINCES = ["California", "Virginia", "Beijing", "Guangdong", "Hesse", "North Holland", "Ontario", "Tokyo", None]
+
+# Shape of the port-count distribution: most superhosts expose tens of ports, a few percent are
+# containerized hosts with hundreds to thousands of ports and only one or two services
+PORT_COUNT_MEDIAN = 12
+PORT_COUNT_SIGMA = 1.0
+CONTAINER_FRACTION = 0.03
+CONTAINER_PORTS = (100, 1000)
+COMMON_PORT_SHARE = 0.45
+UNKNOWN_SHARE = 0.6
+
+
+def parse_count(text):
+    """'10k', '2.5M' or '100000' -> int."""
+    text = str(text).strip().lower()
+    scale = {"k": 1_000, "m": 1_000_000}.get(text[-1:], 1)
+    return int(float(text[:-1] if scale > 1 else text) * scale)
+
+
+def _zipf_weights(n, exponent=1.1):
+    weights = 1.0 / np.arange(1, n + 1) ** exponent
+    return weights / weights.sum()
+
+
+def _read_other(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r', encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+class Vocabulary:
+    """Values of one categorical field with their sampling weights and naive-pipeline codes.
+
+    Values come from encodings/<field>_mapping.json (encoded as their code) plus a share drawn
+    from the field's OTHER list (encoded as OTHER), like the long tail of the real snapshot.
+    """
+
+    def __init__(self, encodings_dir, field, other_share=0.1):
+        with open(os.path.join(encodings_dir, f"{field}_mapping.json"), 'r', encoding="utf-8") as f:
+            mapping = {k: v for k, v in json.load(f).items() if v > OTHER_CODE}
+        other = _read_other(os.path.join(encodings_dir, f"{field}_OTHER.txt"))
+
+        known = sorted(mapping, key=mapping.get)
+        weights = _zipf_weights(len(known)) * (1 - other_share if other else 1.0)
+        if other:
+            weights = np.concatenate([weights, _zipf_weights(len(other)) * other_share])
+        self.values = np.array(known + other, dtype=object)
+        self.codes = np.array([mapping[v] for v in known] + [OTHER_CODE] * len(other), dtype=np.int32)
+        self.weights = weights / weights.sum()
+
+    def sample(self, rng, n):
+        return rng.choice(len(self.values), size=n, p=self.weights)
+
+
+def load_vocabularies(encodings_dir=ENCODINGS_DIR):
+    return {
+        "country": Vocabulary(encodings_dir, "location_country_code", other_share=0.05),
+        "organization": Vocabulary(encodings_dir, "whois_organization", other_share=0.3),
+        "network": Vocabulary(encodings_dir, "whois_network", other_share=0.4),
+        "service": Vocabulary(encodings_dir, "service_names", other_share=0.02),
+    }
+
+
+def host_addresses(first, n, seed):
+    """Distinct uint32 addresses for host indices first..first+n (an odd multiplier is a bijection mod 2^32)."""
+    index = np.arange(first, first + n, dtype=np.uint64) + np.uint64(seed) * np.uint64(0x10000)
+    return ((index * np.uint64(2654435761) + np.uint64(0x5BD1E995)) & np.uint64(0xFFFFFFFF)).astype(np.uint32)
+
+
+def format_ipv4(addresses):
+    return [f"{a >> 24}.{(a >> 16) & 255}.{(a >> 8) & 255}.{a & 255}" for a in addresses.tolist()]
+
+
+def generate_hosts(n, rng, vocab, first=0, seed=0):
+    """One chunk of hosts as flat numpy arrays: per-host metadata plus CSR-style (indptr) open ports and services."""
+    common_ports = np.array([p for p, _ in COMMON_PORTS], dtype=np.int64)
+    common_service = {name: i for i, name in enumerate(vocab["service"].values)}
+    common_codes = np.array([common_service[s] for _, s in COMMON_PORTS], dtype=np.int64)
+    unknown = common_service["UNKNOWN"]
+    http = common_service["HTTP"]
+
+    container = rng.random(n) < CONTAINER_FRACTION
+    counts = np.exp(rng.normal(np.log(PORT_COUNT_MEDIAN), PORT_COUNT_SIGMA, n)).astype(np.int64) + 1
+    counts = np.where(container, rng.integers(*CONTAINER_PORTS, n), np.minimum(counts, 2000))
+
+    rows = np.repeat(np.arange(n), counts)
+    total = len(rows)
+    is_common = (rng.random(total) < COMMON_PORT_SHARE) & ~container[rows]
+    pick = rng.choice(len(common_ports), size=total, p=_zipf_weights(len(common_ports)))
+    ports = np.where(is_common, common_ports[pick], rng.integers(1, MAX_PORT + 1, total))
+
+    # Containerized hosts publish a contiguous block of ports
+    starts = rng.integers(1024, MAX_PORT - CONTAINER_PORTS[1], n)
+    offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+    ports = np.where(container[rows], starts[rows] + offsets, ports)
+
+    # One service per distinct open port, hosts keep ports in ascending order
+    keys = np.unique(rows.astype(np.int64) * (MAX_PORT + 1) + ports)
+    rows, ports = keys // (MAX_PORT + 1), keys % (MAX_PORT + 1)
+    total = len(rows)
+    indptr = np.concatenate([[0], np.cumsum(np.bincount(rows, minlength=n))])
+
+    lookup = np.full(MAX_PORT + 1, -1, dtype=np.int64)
+    lookup[common_ports] = common_codes
+    sampled = vocab["service"].sample(rng, total)
+    other = np.where(rng.random(total) < UNKNOWN_SHARE, unknown, sampled)
+    services = np.where(lookup[ports] >= 0, lookup[ports], other)
+    host_service = np.where(rng.random(n) < 0.5, http, unknown)
+    services = np.where(container[rows] & (rng.random(total) < 0.95), host_service[rows], services)
+
+    udp_service = np.isin(vocab["service"].values[services], list(UDP_SERVICES))
+    udp = np.where(udp_service, rng.random(total) < 0.8, rng.random(total) < 0.05)
+
+    organization = vocab["organization"].sample(rng, n)
+    return {
+        "ipv4": host_addresses(first, n, seed),
+        "country": vocab["country"].sample(rng, n),
+        "organization": organization,
+        "network": vocab["network"].sample(rng, n),
+        "asn": (13000 + organization * 97 % 60000).astype(np.int64),
+        "province": rng.integers(0, len(PROVINCES), n),
+        "reverse_dns": rng.random(n) < 0.4,
+        "indptr": indptr,
+        "ports": ports.astype(np.int64),
+        "services": services.astype(np.int64),
+        "udp": udp,
+    }
+
+
+def host_records(hosts, vocab):
+    """Censys-style host records, the format bucket-model/ingest.py and score_hosts.py parse."""
+    ips = format_ipv4(hosts["ipv4"])
+    indptr = hosts["indptr"].tolist()
+    ports = hosts["ports"].tolist()
+    services = vocab["service"].values[hosts["services"]].tolist()
+    transports = np.where(hosts["udp"], "UDP", "TCP").tolist()
+    countries = vocab["country"].values[hosts["country"]].tolist()
+    organizations = vocab["organization"].values[hosts["organization"]].tolist()
+    networks = vocab["network"].values[hosts["network"]].tolist()
+
+    for i, ip in enumerate(ips):
+        lo, hi = indptr[i], indptr[i + 1]
+        record = {
+            "host_identifier": {"ipv4": ip},
+            "ports_list": [str(p) for p in ports[lo:hi]],
+            "services": [{"port": ports[j], "transport": transports[j], "service_name": services[j]} for j in range(lo, hi)],
+            "location": {"country_code": countries[i], "province": PROVINCES[hosts["province"][i]]},
+            "whois": {"organization": {"name": organizations[i]}, "network": {"name": networks[i]}},
+            "autonomous_system": {"asn": int(hosts["asn"][i])},
+            "dns": {"reverse_dns": {"names": [f"host-{i}.example.net"] if hosts["reverse_dns"][i] else []}},
+        }
+        yield record
+
+
+PROCESSED_SCHEMA = pa.schema([
+    ("location_country_code_encoded", pa.int32()),
+    ("whois_organization_encoded", pa.int32()),
+    ("whois_network_encoded", pa.int32()),
+    ("port", pa.int32()),
+    ("ipv4", pa.int64()),
+    ("label", pa.int32()),
+])
+
+
+def processed_rows(hosts, vocab):
+    """One row per (host, open port) with the naive pipeline's encoded features; the label is the service code."""
+    lengths = np.diff(hosts["indptr"])
+    per_row = lambda values: np.repeat(values, lengths)
+    return {
+        "location_country_code_encoded": per_row(vocab["country"].codes[hosts["country"]]),
+        "whois_organization_encoded": per_row(vocab["organization"].codes[hosts["organization"]]),
+        "whois_network_encoded": per_row(vocab["network"].codes[hosts["network"]]),
+        "port": hosts["ports"].astype(np.int32),
+        "ipv4": per_row(hosts["ipv4"].astype(np.int64)),
+        "label": vocab["service"].codes[hosts["services"]],
+    }
+
+
+def generate(output_dir, n_hosts, seed=0, shards=None, chunk_size=100_000, jsonl=True, processed=True,
+             split=(0.7, 0.15, 0.15), encodings_dir=ENCODINGS_DIR, log=print):
+    """Write a seeded synthetic snapshot: JSONL shards in <output_dir>/dataset and splits in <output_dir>/processed.
+
+    Hosts are generated chunk by chunk (a fixed chunk -> seed mapping), so memory stays bounded at any
+    size and the same (n_hosts, seed, chunk_size) always produces the same files.
+    """
+    start = time.perf_counter()
+    vocab = load_vocabularies(encodings_dir)
+    shards = shards or max(1, -(-n_hosts // 250_000))
+    dataset_dir = os.path.join(output_dir, "dataset")
+    processed_dir = os.path.join(output_dir, "processed")
+    os.makedirs(dataset_dir, exist_ok=True)
+    os.makedirs(processed_dir, exist_ok=True)
+
+    shard_files = [open(os.path.join(dataset_dir, f"shard_{s:04d}.json"), 'w', encoding="utf-8") for s in range(shards)] if jsonl else []
+    writers = {name: pq.ParquetWriter(os.path.join(processed_dir, f"{name}.parquet"), PROCESSED_SCHEMA)
+               for name in ("train", "val", "test")} if processed else {}
+    stats = {"hosts": 0, "open_ports": 0, "rows": {name: 0 for name in writers}}
+    try:
+        for chunk, first in enumerate(range(0, n_hosts, chunk_size)):
+            n = min(chunk_size, n_hosts - first)
+            rng = np.random.default_rng([seed, chunk])
+            hosts = generate_hosts(n, rng, vocab, first, seed)
+            stats["hosts"] += n
+            stats["open_ports"] += int(hosts["indptr"][-1])
+
+            if jsonl:
+                # Consecutive hosts go to the same shard so each shard is one contiguous host range
+                shard_of = (first + np.arange(n)) * shards // n_hosts
+                for i, record in enumerate(host_records(hosts, vocab)):
+                    shard_files[shard_of[i]].write(json.dumps(record) + "\n")
+
+            if processed:
+                rows = processed_rows(hosts, vocab)
+                # Split by host, so every port of a host lands in the same split
+                host_split = np.searchsorted(np.cumsum(split), rng.random(n), side="right").clip(0, 2)
+                row_split = np.repeat(host_split, np.diff(hosts["indptr"]))
+                for i, name in enumerate(("train", "val", "test")):
+                    mask = row_split == i
+                    table = pa.Table.from_pydict({k: v[mask] for k, v in rows.items()}, schema=PROCESSED_SCHEMA)
+                    writers[name].write_table(table)
+                    stats["rows"][name] += int(mask.sum())
+            log(f"Generated {stats['hosts']}/{n_hosts} hosts ({stats['open_ports']} open ports)")
+    finally:
+        for f in shard_files:
+            f.close()
+        for writer in writers.values():
+            writer.close()
+
+    meta = {
+        "generator_version": GENERATOR_VERSION,
+        "hosts": n_hosts,
+        "seed": seed,
+        "shards": shards if jsonl else 0,
+        "chunk_size": chunk_size,
+        "open_ports": stats["open_ports"],
+        "mean_ports_per_host": stats["open_ports"] / max(n_hosts, 1),
+        "processed_rows": stats["rows"],
+        "seconds": round(time.perf_counter() - start, 2),
+    }
+    with open(os.path.join(output_dir, "meta.json"), 'w') as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a seeded synthetic superhost snapshot (JSONL shards + processed splits).")
+    parser.add_argument("--hosts", default="10k", help="Number of hosts, e.g. 10k, 1M, 10M")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output-dir", default=None, help="Default: benchmarks/data/<hosts>_seed<seed>")
+    parser.add_argument("--shards", type=int, default=None, help="JSONL shards (default: one per 250k hosts)")
+    parser.add_argument("--chunk-size", type=int, default=100_000, help="Hosts generated per chunk (bounds memory)")
+    parser.add_argument("--no-jsonl", action="store_true", help="Only write the processed parquet splits")
+    parser.add_argument("--no-processed", action="store_true", help="Only write the JSONL shards")
+    args = parser.parse_args()
+
+    n_hosts = parse_count(args.hosts)
+    output_dir = args.output_dir or os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", f"{args.hosts}_seed{args.seed}")
+    meta = generate(output_dir, n_hosts, args.seed, args.shards, args.chunk_size,
+                    jsonl=not args.no_jsonl, processed=not args.no_processed)
+    print(f"Wrote {meta['hosts']} hosts ({meta['mean_ports_per_host']:.1f} ports/host) to {output_dir} in {meta['seconds']:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+import os
+import hashlib
+
+import numpy as np
+from scipy import sparse
+
+from port_store import as_csr
+
+
+def co_occurrence_column_names(bucket_col_names, top_k=5):
+    return [f"{name}_coactive_top{top_k}" for name in bucket_col_names]
+
+
+class BucketCoOccurrence:
+    """Bucket co-occurrence statistics and the "<bucket>_coactive_top5" features derived from them.
+
+    Fit on the training split's bucket labels, then transform any split with the same top-k map.
+    """
+
+    def __init__(self, top_k=5):
+        self.top_k = top_k
+        self.co_matrix = None
+        self.related = None
+
+    def fit(self, bucket_labels):
+        labels = as_csr(bucket_labels).astype(np.int32)
+        self.co_matrix = np.asarray((labels.T @ labels).todense(), dtype=np.int32)
+        num_buckets = self.co_matrix.shape[0]
+
+        # Top-k partners of each bucket, excluding itself; ties go to the higher bucket index
+        keys = self.co_matrix.astype(np.int64) * num_buckets + np.arange(num_buckets)
+        np.fill_diagonal(keys, -1)
+        k = min(self.top_k, num_buckets - 1)
+        top = np.argpartition(keys, num_buckets - k, axis=1)[:, num_buckets - k:]
+        order = np.argsort(np.take_along_axis(keys, top, axis=1), axis=1)[:, ::-1]
+        self.related = np.take_along_axis(top, order, axis=1)
+        return self
+
+    def transform(self, bucket_labels):
+        """Sparse host x bucket matrix: for each active bucket, the fraction of its top-k partners also active."""
+        labels = as_csr(bucket_labels).astype(np.float32)
+        num_buckets, k = self.related.shape
+
+        # partner_map[j, i] = 1 when bucket j is one of bucket i's top-k partners
+        partner_map = sparse.csr_matrix(
+            (np.ones(num_buckets * k, dtype=np.float32), (self.related.ravel(), np.repeat(np.arange(num_buckets), k))),
+            shape=(num_buckets, num_buckets),
+        )
+        partner_counts = labels @ partner_map
+        return sparse.csr_matrix(partner_counts.multiply(labels) / float(self.top_k))
+
+    def normalized(self):
+        """Co-occurrence matrix with each row scaled to sum to 1 (for the heatmap)."""
+        row_sums = self.co_matrix.sum(axis=1, keepdims=True)
+        return np.divide(
+            self.co_matrix, row_sums, out=np.zeros_like(self.co_matrix, dtype=float), where=row_sums != 0
+        )
+
+    def save(self, path):
+        np.savez(path, co_matrix=self.co_matrix, related=self.related, top_k=self.top_k)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            model = cls(top_k=int(data["top_k"]))
+            model.co_matrix = data["co_matrix"]
+            model.related = data["related"]
+        return model
+
+
+def load_or_fit_cooccurrence(train_labels, cache_dir, dataset_id, bucket_size, top_k=5):
+    """Fit on the training bucket labels once per (dataset, bucket_size) and reuse the saved statistics afterwards."""
+    train_labels = as_csr(train_labels)
+
+    # Key on the exact training labels so a different split or sample gets its own statistics
+    digest = hashlib.blake2b(digest_size=8)
+    digest.update(np.ascontiguousarray(train_labels.indptr).tobytes())
+    digest.update(np.ascontiguousarray(train_labels.indices).tobytes())
+
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, f"{dataset_id}_cooc_{bucket_size}_top{top_k}_{digest.hexdigest()}.npz")
+    if os.path.exists(path):
+        return BucketCoOccurrence.load(path)
+
+    model = BucketCoOccurrence(top_k).fit(train_labels)
+    model.save(path)
+    return model
@@ -0,0 +1,161 @@
+import os
+import json
+import struct
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from catboost import CatBoostClassifier, Pool
+
+
+MAGIC = b"BKTENS01"
+
+
+def unpack_labels(packed, num_buckets):
+    """Inverse of the "packed" output: bit-packed rows back to a dense uint8 label matrix."""
+    return np.unpackbits(packed, axis=1, count=num_buckets)
+
+
+class BucketEnsemble:
+    """All bucket classifiers behind one predict call.
+
+    Each chunk of rows is converted to a CatBoost Pool once and scored by every model; chunks are
+    processed in parallel threads (CatBoost releases the GIL while applying models).
+    """
+
+    def __init__(self, buckets, models=None, multi_model=None, multi_buckets=None, constants=None):
+        self.buckets = list(buckets)
+        self.models = models or {}
+        self.multi_model = multi_model
+        self.multi_buckets = list(multi_buckets or [])
+        self.constants = constants or {}
+
+        position = {bucket: i for i, bucket in enumerate(self.buckets)}
+        self._model_cols = np.array([position[b] for b in self.models], dtype=np.int64)
+        self._multi_cols = np.array([position[b] for b in self.multi_buckets], dtype=np.int64)
+        self._const_cols = np.array([position[b] for b in self.constants], dtype=np.int64)
+        self._const_values = np.array(list(self.constants.values()), dtype=np.float32)
+
+    @classmethod
+    def from_bucket_models(cls, bucket_models):
+        return cls(bucket_models.buckets, bucket_models.models, bucket_models.multi_model,
+                   bucket_models.multi_buckets, bucket_models.constants)
+
+    @property
+    def num_buckets(self):
+        return len(self.buckets)
+
+    def _proba_chunk(self, X_chunk):
+        pool = Pool(X_chunk)
+        proba = np.zeros((len(X_chunk), self.num_buckets), dtype=np.float32)
+        if len(self._const_cols):
+            proba[:, self._const_cols] = self._const_values
+        if self.multi_model is not None:
+            proba[:, self._multi_cols] = self.multi_model.predict_proba(pool, thread_count=1)
+        for col, model in zip(self._model_cols, self.models.values()):
+            proba[:, col] = model.predict_proba(pool, thread_count=1)[:, 1]
+        return proba
+
+    def _chunks(self, X, chunk_size):
+        return [X.iloc[start:start + chunk_size] for start in range(0, len(X), chunk_size)]
+
+    def predict_proba(self, X, chunk_size=20000, n_jobs=None):
+        """Positive-class probability of every bucket, shape (rows, buckets), float32."""
+        n_jobs = n_jobs or os.cpu_count()
+        with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+            parts = list(executor.map(self._proba_chunk, self._chunks(X, chunk_size)))
+        if not parts:
+            return np.zeros((0, self.num_buckets), dtype=np.float32)
+        return np.vstack(parts)
+
+    def predict(self, X, output="packed", threshold=0.5, chunk_size=20000, n_jobs=None, return_proba=False):
+        """Multi-label predictions as "packed" bits (np.packbits rows), a "sparse" CSR matrix or a "dense" uint8 array."""
+        n_jobs = n_jobs or os.cpu_count()
+
+        def label_chunk(X_chunk):
+            proba = self._proba_chunk(X_chunk)
+            labels = (proba > threshold).astype(np.uint8)
+            if output == "packed":
+                labels = np.packbits(labels, axis=1)
+            elif output == "sparse":
+                labels = sparse.csr_matrix(labels)
+            return labels, (proba if return_proba else None)
+
+        if output not in ("packed", "sparse", "dense"):
+            raise ValueError(f"Unknown output format: {output}")
+
+        with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+            parts = list(executor.map(label_chunk, self._chunks(X, chunk_size)))
+
+        if not parts:
+            width = (self.num_buckets + 7) // 8 if output == "packed" else self.num_buckets
+            labels = np.zeros((0, width), dtype=np.uint8)
+            labels = sparse.csr_matrix(labels) if output == "sparse" else labels
+            return (labels, np.zeros((0, self.num_buckets), dtype=np.float32)) if return_proba else labels
+
+        if output == "sparse":
+            labels = sparse.vstack([p[0] for p in parts], format="csr")
+        else:
+            labels = np.vstack([p[0] for p in parts])
+        if return_proba:
+            return labels, np.vstack([p[1] for p in parts])
+        return labels
+
+    def predict_frame(self, X, **kwargs):
+        labels = self.predict(X, output="dense", **kwargs)
+        return pd.DataFrame(labels, columns=self.buckets, index=X.index)
+
+    def save(self, path):
+        """Write every model into a single file: magic, header length, JSON header, concatenated .cbm blobs."""
+        blobs, entries = [], []
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            named = list(self.models.items())
+            if self.multi_model is not None:
+                named.append((None, self.multi_model))
+            for i, (bucket, model) in enumerate(named):
+                model_path = os.path.join(tmp_dir, f"{i}.cbm")
+                model.save_model(model_path)
+                with open(model_path, 'rb') as f:
+                    blobs.append(f.read())
+                entries.append({"bucket": bucket, "size": len(blobs[-1])})
+
+        header = json.dumps({
+            "buckets": self.buckets,
+            "multi_buckets": self.multi_buckets,
+            "constants": self.constants,
+            "models": entries,
+        }).encode("utf-8")
+
+        with open(path, 'wb') as f:
+            f.write(MAGIC)
+            f.write(struct.pack("<Q", len(header)))
+            f.write(header)
+            for blob in blobs:
+                f.write(blob)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            data = f.read()
+        if data[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a bucket ensemble file")
+
+        offset = len(MAGIC)
+        (header_len,) = struct.unpack_from("<Q", data, offset)
+        offset += 8
+        header = json.loads(data[offset:offset + header_len].decode("utf-8"))
+        offset += header_len
+
+        models, multi_model = {}, None
+        for entry in header["models"]:
+            model = CatBoostClassifier()
+            model.load_model(blob=data[offset:offset + entry["size"]])
+            offset += entry["size"]
+            if entry["bucket"] is None:
+                multi_model = model
+            else:
+                models[entry["bucket"]] = model
+
+        return cls(header["buckets"], models, multi_model, header["multi_buckets"], header["constants"])
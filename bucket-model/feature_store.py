@@ -0,0 +1,347 @@
+import os
+import json
+import time
+import shutil
+import argparse
+import tempfile
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from port_store import ports_to_csr, read_port_matrix
+
+
+# Columns read from a snapshot (ingest.py parts or a sparse superhost parquet)
+SNAPSHOT_COLUMNS = ["ip", "ports", "transports", "service_names", "org_name", "asn", "country_code", "os_name"]
+
+LIST_COLUMNS = ["ports", "transports", "service_names"]
+
+# Long (host, port, service) scan tables, e.g. the censys_scans.ipv4_services export used by the figures
+OBSERVATION_COLUMNS = {
+    "host_ip": "ip", "port": "ports", "transport": "transports", "service": "service_names",
+    "organization_name": "org_name", "asn": "asn", "country_code": "country_code", "os_name": "os_name",
+}
+
+# Per-host aggregates kept in the store
+FEATURE_COLUMNS = [
+    "open_port_count", "service_diversity", "unknown_service_count", "service_to_port_ratio",
+    "deployment_type", "udp_ratio", "num_svr",
+]
+
+# Names the training notebook uses for the same aggregates
+ALIASES = {"num_ports_active": "open_port_count", "unique_services": "service_diversity"}
+
+STORE_COLUMNS = ["ip", "ipv4", "org_name", "asn", "country_code", "os_name"] + FEATURE_COLUMNS + ["fingerprint", "updated"]
+
+DEFAULT_PARTITIONS = 16
+
+
+def ipv4_to_uint32(ips):
+    """(uint32 addresses, valid mask) for dotted-quad strings."""
+    octets = pd.Series(ips, dtype="string").str.split(".", expand=True)
+    if octets.shape[1] != 4:
+        return np.zeros(len(ips), dtype=np.uint32), np.zeros(len(ips), dtype=bool)
+    octets = octets.apply(pd.to_numeric, errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+    valid = np.all(np.isfinite(octets) & (octets >= 0) & (octets <= 255), axis=1)
+    octets = np.where(valid[:, None], octets, 0).astype(np.uint32)
+    return (octets[:, 0] << 24) | (octets[:, 1] << 16) | (octets[:, 2] << 8) | octets[:, 3], valid
+
+
+def partition_of(ipv4, num_partitions):
+    # Multiplicative hash so neighbouring addresses spread over partitions
+    mixed = (ipv4.astype(np.uint64) * np.uint64(2654435761)) & np.uint64(0xFFFFFFFF)
+    return (mixed * np.uint64(num_partitions) >> np.uint64(32)).astype(np.int64)
+
+
+def read_observations(path, names):
+    """One row per host from a long (host_ip, port, service, ...) table, with the lists in port order."""
+    columns = [c for c in OBSERVATION_COLUMNS if c in names]
+    table = pq.read_table(path, columns=columns).sort_by([("host_ip", "ascending"), ("port", "ascending")])
+    list_columns = [c for c in ["port", "transport", "service"] if c in columns]
+    first_columns = [c for c in columns if c not in list_columns and c != "host_ip"]
+    grouped = table.group_by("host_ip", use_threads=False).aggregate(
+        [(c, "list") for c in list_columns] + [(c, "first") for c in first_columns]
+    )
+    renamed = {f"{c}_list": OBSERVATION_COLUMNS[c] for c in list_columns}
+    renamed.update({f"{c}_first": OBSERVATION_COLUMNS[c] for c in first_columns})
+    renamed["host_ip"] = "ip"
+    return grouped.rename_columns([renamed[c] for c in grouped.column_names])
+
+
+def read_snapshot(path):
+    """Snapshot hosts as an Arrow table with SNAPSHOT_COLUMNS, one row per IP (the last record wins)."""
+    schema = pq.read_schema(path) if os.path.isfile(path) else pq.ParquetDataset(path).schema
+    if "host_ip" in schema.names:
+        table = read_observations(path, schema.names)
+    elif "ports" in schema.names:
+        table = pq.read_table(path, columns=[c for c in SNAPSHOT_COLUMNS if c in schema.names])
+    else:
+        # Legacy dense superhost files: rebuild the port lists from the port matrix
+        df, port_matrix = read_port_matrix(path)
+        ports = pa.ListArray.from_arrays(pa.array(port_matrix.indptr.astype(np.int32)),
+                                         pa.array(port_matrix.indices.astype(np.uint16) + 1))
+        table = pa.Table.from_pandas(df[[c for c in SNAPSHOT_COLUMNS if c in df.columns and c != "ports"]],
+                                     preserve_index=False).append_column("ports", ports)
+
+    for name in SNAPSHOT_COLUMNS:
+        if name not in table.column_names:
+            list_type = pa.list_(pa.uint16() if name == "ports" else pa.string())
+            table = table.append_column(name, pa.nulls(len(table), list_type if name in LIST_COLUMNS else pa.string()))
+
+    return _last_per_ip(table.select(SNAPSHOT_COLUMNS))
+
+
+def _last_per_ip(table):
+    ips = table.column("ip").to_pandas()
+    keep = ~ips.duplicated(keep="last").to_numpy()
+    return table.filter(pa.array(keep)) if not keep.all() else table
+
+
+def snapshot_parts(path):
+    """Files of a snapshot that can be read one at a time: the parts of a directory of one-row-per-host
+    parquet files (ingest.py output). Long observation tables and single files are one unit, since a
+    host's observations may span files.
+    """
+    if os.path.isdir(path):
+        files = sorted(os.path.join(path, f) for f in os.listdir(path) if f.endswith(".parquet"))
+        if files and "host_ip" not in pq.read_schema(files[0]).names:
+            return files
+    return [path]
+
+
+def _flat(list_column):
+    """(parent row, value) of every element of a list column."""
+    list_column = list_column.combine_chunks() if isinstance(list_column, pa.ChunkedArray) else list_column
+    return (pc.list_parent_indices(list_column).to_numpy(zero_copy_only=False),
+            pc.list_flatten(list_column).to_numpy(zero_copy_only=False))
+
+
+def _list_lengths(list_column):
+    return pc.fill_null(pc.list_value_length(list_column), 0).to_numpy(zero_copy_only=False).astype(np.int64)
+
+
+def _count_equal(parents, values, target, n):
+    return np.bincount(parents[values == target], minlength=n).astype(np.int32)
+
+
+def _combine_hashes(parents, values, n):
+    """Order-sensitive uint64 hash of each row's list (wrapping sum of position-salted element hashes)."""
+    out = np.zeros(n, dtype=np.uint64)
+    if len(values):
+        hashes = pd.util.hash_array(np.asarray(values))
+        starts = np.searchsorted(parents, parents, side="left")
+        salt = (np.arange(len(parents)) - starts).astype(np.uint64) * np.uint64(0x9E3779B97F4A7C15) + np.uint64(1)
+        np.add.at(out, parents, hashes * salt)
+    return out
+
+
+def host_fingerprints(table):
+    """uint64 per host over everything the features depend on, used to detect hosts that changed."""
+    n = len(table)
+    columns = {}
+    for name in LIST_COLUMNS:
+        parents, values = _flat(table.column(name))
+        columns[name] = _combine_hashes(parents, values, n) ^ _list_lengths(table.column(name)).astype(np.uint64)
+    for name in ["ip", "org_name", "asn", "country_code", "os_name"]:
+        columns[name] = table.column(name).to_pandas().astype("string")
+    return pd.util.hash_pandas_object(pd.DataFrame(columns), index=False).to_numpy()
+
+
+def compute_features(table):
+    """Per-host aggregates for every row of a snapshot table (vectorized over the flattened lists)."""
+    n = len(table)
+    # Distinct valid ports per host, same rule as the port matrix used by the bucket model
+    open_port_count = np.diff(ports_to_csr(table.column("ports")).indptr).astype(np.int32)
+
+    parents, services = _flat(table.column("service_names"))
+    present = pd.notna(services)
+    distinct = pd.DataFrame({"host": parents[present], "service": services[present]}).drop_duplicates()
+    service_diversity = np.bincount(distinct["host"].to_numpy(), minlength=n).astype(np.int32)
+    unknown_service_count = _count_equal(parents, services, "UNKNOWN", n)
+    num_svr = _count_equal(parents, services, "SVR", n)
+
+    transport_parents, transports = _flat(table.column("transports"))
+    n_transports = _list_lengths(table.column("transports"))
+    udp = _count_equal(transport_parents, transports, "UDP", n)
+    udp_ratio = np.divide(udp, n_transports, out=np.zeros(n), where=n_transports > 0)
+
+    service_to_port_ratio = np.divide(service_diversity, open_port_count, out=np.full(n, np.nan),
+                                      where=open_port_count > 0)
+
+    # Same rule as the deployment_type CASE in figures/figure13/code.sql
+    deployment_type = np.select(
+        [(open_port_count >= 35) & (service_diversity <= 2),
+         (open_port_count >= 15) & (open_port_count <= 25) & (service_diversity >= 8)],
+        ["Containerized", "Non-Containerized"],
+        default="Other",
+    )
+
+    ipv4, _ = ipv4_to_uint32(table.column("ip").to_pandas())
+    return pd.DataFrame({
+        "ip": table.column("ip").to_pandas().astype(object),
+        "ipv4": ipv4,
+        "org_name": table.column("org_name").to_pandas().astype(object),
+        "asn": pd.to_numeric(table.column("asn").to_pandas(), errors="coerce").astype("Int64"),
+        "country_code": table.column("country_code").to_pandas().astype(object),
+        "os_name": table.column("os_name").to_pandas().astype(object),
+        "open_port_count": open_port_count,
+        "service_diversity": service_diversity,
+        "unknown_service_count": unknown_service_count,
+        "service_to_port_ratio": service_to_port_ratio,
+        "deployment_type": deployment_type.astype(object),
+        "udp_ratio": udp_ratio,
+        "num_svr": num_svr,
+    })
+
+
+class FeatureStore:
+    """Host-keyed per-host aggregates, one parquet file per IP-hash partition.
+
+    update() takes a full scan snapshot, fingerprints every host and recomputes features only for
+    hosts that are new or whose ports/services/metadata changed; partitions without any change or
+    removal are left untouched on disk.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.manifest_path = os.path.join(root, "manifest.json")
+
+    @property
+    def manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return {"num_partitions": DEFAULT_PARTITIONS, "snapshots": []}
+        with open(self.manifest_path, 'r') as f:
+            return json.load(f)
+
+    def is_empty(self):
+        return not self.manifest["snapshots"]
+
+    @property
+    def glob(self):
+        """Glob of every partition file, e.g. for DuckDB's read_parquet."""
+        return os.path.join(self.root, "partition=*", "*.parquet")
+
+    def _partition_path(self, p):
+        return os.path.join(self.root, f"partition={p:03d}", "hosts.parquet")
+
+    def _write_partition(self, p, frame):
+        path = self._partition_path(p)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        frame.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+
+    def update(self, snapshot_path, snapshot_id=None, log=print):
+        """Bring the store up to date with a snapshot; returns counts of new/changed/unchanged/removed hosts."""
+        start = time.perf_counter()
+        manifest = self.manifest
+        num_partitions = manifest["num_partitions"]
+        snapshot_id = snapshot_id or os.path.basename(os.path.normpath(snapshot_path))
+
+        stats = {"snapshot": snapshot_id, "hosts": 0, "invalid_ip": 0,
+                 "new": 0, "changed": 0, "unchanged": 0, "removed": 0, "partitions_rewritten": 0}
+        os.makedirs(self.root, exist_ok=True)
+        staging_dir = tempfile.mkdtemp(prefix=".staging_", dir=self.root)
+        try:
+            # Split each part of the snapshot by partition on disk, so at most one part or one
+            # partition of the snapshot is in memory at a time
+            for i, part in enumerate(snapshot_parts(snapshot_path)):
+                table = read_snapshot(part)
+                empty = table.slice(0, 0)
+                ipv4, valid = ipv4_to_uint32(table.column("ip").to_pandas())
+                stats["invalid_ip"] += int((~valid).sum())
+                if not valid.all():
+                    table, ipv4 = table.filter(pa.array(valid)), ipv4[valid]
+                partitions = partition_of(ipv4, num_partitions)
+                for p in np.unique(partitions):
+                    pq.write_table(table.filter(pa.array(partitions == p)),
+                                   os.path.join(staging_dir, f"{p:03d}_{i:06d}.parquet"))
+            del table
+
+            for p in range(num_partitions):
+                self._update_partition(p, staging_dir, empty, snapshot_id, stats)
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+
+        stats["seconds"] = round(time.perf_counter() - start, 3)
+        manifest["snapshots"].append({**stats, "source": os.path.abspath(snapshot_path),
+                                      "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S")})
+        with open(self.manifest_path + ".tmp", 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(self.manifest_path + ".tmp", self.manifest_path)
+
+        log(f"Feature store {self.root} @ {snapshot_id}: {stats['new']} new, {stats['changed']} changed, "
+            f"{stats['unchanged']} unchanged, {stats['removed']} removed hosts; "
+            f"{stats['partitions_rewritten']}/{num_partitions} partitions rewritten in {stats['seconds']:.1f}s")
+        return stats
+
+    def _update_partition(self, p, staging_dir, empty, snapshot_id, stats):
+        staged = sorted(f for f in os.listdir(staging_dir) if f.startswith(f"{p:03d}_"))
+        # Parts are staged in order, so a host listed in several parts keeps its last record
+        table = pa.concat_tables([empty] + [pq.read_table(os.path.join(staging_dir, f)) for f in staged],
+                                 promote_options="permissive")
+        table = _last_per_ip(table)
+        stats["hosts"] += len(table)
+        fingerprints = host_fingerprints(table)
+        ips = table.column("ip").to_pandas().astype(object).to_numpy()
+        path = self._partition_path(p)
+        existing = pd.read_parquet(path) if os.path.exists(path) else pd.DataFrame(columns=STORE_COLUMNS)
+
+        position = pd.Index(existing["ip"]).get_indexer(ips)
+        known = position >= 0
+        same = np.zeros(len(ips), dtype=bool)
+        same[known] = existing["fingerprint"].to_numpy()[position[known]] == fingerprints[known]
+        removed = len(existing) - int(known.sum())
+
+        stats["new"] += int((~known).sum())
+        stats["changed"] += int((known & ~same).sum())
+        stats["unchanged"] += int(same.sum())
+        stats["removed"] += removed
+        if same.all() and removed == 0:
+            return
+
+        recompute = np.flatnonzero(~same)
+        fresh = compute_features(table.take(pa.array(recompute)))
+        fresh["fingerprint"] = fingerprints[recompute]
+        fresh["updated"] = snapshot_id
+        kept = existing.iloc[position[same]]
+        frame = pd.concat([kept, fresh[STORE_COLUMNS]], ignore_index=True) if len(kept) else fresh[STORE_COLUMNS]
+        self._write_partition(p, frame.sort_values("ipv4", kind="stable").reset_index(drop=True))
+        stats["partitions_rewritten"] += 1
+
+    def read(self, columns=None, ips=None):
+        """Stored hosts as a DataFrame; aliases (e.g. num_ports_active) are accepted as column names.
+
+        With ips, rows are aligned to that sequence (hosts missing from the store come back as NaN).
+        """
+        requested = list(columns) if columns is not None else STORE_COLUMNS
+        stored = [ALIASES.get(c, c) for c in requested]
+        read_columns = list(dict.fromkeys(["ip"] + stored))
+        files = sorted(os.path.join(self.root, d, "hosts.parquet") for d in os.listdir(self.root)
+                       if d.startswith("partition=")) if os.path.isdir(self.root) else []
+        if files:
+            frame = pd.concat([pd.read_parquet(f, columns=read_columns) for f in files], ignore_index=True)
+        else:
+            frame = pd.DataFrame(columns=read_columns)
+
+        if ips is not None:
+            frame = frame.set_index("ip").reindex(pd.Index(ips, dtype=object)).reset_index(names="ip")
+        result = pd.DataFrame({name: frame[source].to_numpy() for name, source in zip(requested, stored)})
+        return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Update the per-host feature store from a scan snapshot.")
+    parser.add_argument("--snapshot", required=True, help="Snapshot parquet file or directory (e.g. ./superhost_parts)")
+    parser.add_argument("--store", default="./feature_store")
+    parser.add_argument("--snapshot-id", default=None, help="Label for this snapshot, e.g. the scan date")
+    args = parser.parse_args()
+    FeatureStore(args.store).update(args.snapshot, args.snapshot_id)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+import os
+import json
+import random
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from tqdm import tqdm
+
+from port_store import MAX_PORT
+
+
+# Columns extracted from every host record
+HOST_SCHEMA = pa.schema([
+    ("ip", pa.string()),
+    ("ports", pa.list_(pa.uint16())),
+    ("transports", pa.list_(pa.string())),
+    ("service_names", pa.list_(pa.string())),
+    ("org_name", pa.string()),
+    ("asn", pa.int64()),
+    ("country_code", pa.string()),
+    ("province", pa.string()),
+    ("has_reverse_dns", pa.int8()),
+    ("udp_ratio", pa.float64()),
+    ("unique_services", pa.int32()),
+    ("num_svr", pa.int32()),
+])
+
+# Raised for a line that is not JSON (JSONDecodeError is a ValueError) or whose record has an
+# unexpected shape, e.g. a list instead of an object or a null asn
+MALFORMED_ERRORS = (ValueError, TypeError, AttributeError)
+
+
+def parse_host(row):
+    """Extract the preprocessing fields from one Censys host record, or None if it has no IP."""
+    host_identifier = row.get("host_identifier")
+    ip = host_identifier.get("ipv4") if isinstance(host_identifier, dict) else None
+    if not ip:
+        return None
+
+    ports = row.get("ports_list", [])
+    ports = [int(p) for p in ports if isinstance(p, str) and p.isdigit()]
+    ports = [p for p in ports if 1 <= p <= MAX_PORT]
+
+    services = row.get("services", [])
+    if isinstance(services, list):
+        transport_list = [s.get("transport") for s in services if isinstance(s, dict)]
+        service_name_list = [s.get("service_name") for s in services if isinstance(s, dict)]
+    else:
+        transport_list = []
+        service_name_list = []
+
+    whois = row.get("whois")
+    org_name = (
+        whois.get("organization", {}).get("name")
+        if isinstance(whois, dict) and isinstance(whois.get("organization"), dict)
+        else None
+    )
+
+    return {
+        "ip": ip,
+        "ports": ports,
+        "transports": transport_list,
+        "service_names": service_name_list,
+        "org_name": org_name,
+        "asn": (
+            int(row["autonomous_system"]["asn"])
+            if isinstance(row.get("autonomous_system"), dict) and "asn" in row["autonomous_system"]
+            else None),
+        "country_code": (row["location"].get("country_code") if isinstance(row.get("location"), dict) else None),
+        "province": (row["location"].get("province") if isinstance(row.get("location"), dict) else None),
+        "has_reverse_dns": (
+            int(bool(row.get("dns", {}).get("reverse_dns", {}).get("names")))
+            if isinstance(row.get("dns"), dict)
+            else 0),
+        "udp_ratio": (transport_list.count("UDP") / len(transport_list) if transport_list else 0),
+        "unique_services": (len(set(service_name_list)) if service_name_list else 0),
+        "num_svr": (service_name_list.count("SVR") if service_name_list else 0)
+    }
+
+
+def _read_shard(file_path, offsets=None):
+    if offsets is None:
+        with open(file_path, 'rb') as f:
+            yield from f
+    else:
+        from shard_index import read_lines
+        yield from read_lines(file_path, offsets)
+
+
+def ingest_shard(file_path, output_dir, batch_size=50000, offsets=None):
+    """Parse one JSONL shard into <output_dir>/<shard>.parquet, one record batch at a time.
+
+    With offsets (from a shard_index.ShardIndex sample), only the lines at those byte offsets are read.
+    """
+    shard = os.path.splitext(os.path.basename(file_path))[0]
+    out_path = os.path.join(output_dir, f"{shard}.parquet")
+    tmp_path = os.path.join(output_dir, f".{shard}.parquet.tmp")
+    stats = {"shard": shard, "path": out_path, "hosts": 0, "skipped_malformed": 0, "skipped_no_ip": 0, "error": None}
+
+    batch = []
+    writer = pq.ParquetWriter(tmp_path, HOST_SCHEMA)
+    try:
+        for line in _read_shard(file_path, offsets):
+            try:
+                record = parse_host(json.loads(line))
+            except MALFORMED_ERRORS:
+                stats["skipped_malformed"] += 1
+                continue
+            if record is None:
+                stats["skipped_no_ip"] += 1
+                continue
+
+            batch.append(record)
+            if len(batch) >= batch_size:
+                writer.write_batch(pa.RecordBatch.from_pylist(batch, schema=HOST_SCHEMA))
+                stats["hosts"] += len(batch)
+                batch = []
+
+        if batch:
+            writer.write_batch(pa.RecordBatch.from_pylist(batch, schema=HOST_SCHEMA))
+            stats["hosts"] += len(batch)
+    except Exception as e:
+        stats["error"] = str(e)
+    finally:
+        writer.close()
+
+    if stats["error"] is None:
+        os.replace(tmp_path, out_path)
+    else:
+        os.remove(tmp_path)
+    return stats
+
+
+def report_shard(stats):
+    if stats["error"] is not None:
+        print(f"Error reading {stats['shard']}: {stats['error']}")
+    else:
+        print(f"{stats['shard']}: {stats['hosts']} hosts, "
+              f"{stats['skipped_malformed']} malformed, {stats['skipped_no_ip']} missing IP")
+
+
+def select_shards(data_dir, percentage_to_load=100, seed=42):
+    json_files = sorted(f for f in os.listdir(data_dir) if f.endswith('.json'))
+    sample_size = max(1, int((percentage_to_load / 100.0) * len(json_files)))
+
+    random.seed(seed)
+    return random.sample(json_files, sample_size)
+
+
+def remove_stale_parts(output_dir, shard_files):
+    """Delete parquet parts of output_dir that do not belong to shard_files.
+
+    The dataset directory is read as a whole, so parts left by a run with another sample would be
+    trained on along with the current one.
+    """
+    keep = {f"{os.path.splitext(f)[0]}.parquet" for f in shard_files}
+    for name in os.listdir(output_dir):
+        if name.endswith('.parquet') and name not in keep:
+            os.remove(os.path.join(output_dir, name))
+
+
+def ingest(data_dir, output_dir, percentage_to_load=100, seed=42, workers=None, batch_size=50000):
+    """Parse the sampled shards of data_dir in a process pool into a parquet dataset directory."""
+    os.makedirs(output_dir, exist_ok=True)
+    selected_files = select_shards(data_dir, percentage_to_load, seed)
+    remove_stale_parts(output_dir, selected_files)
+
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(ingest_shard, os.path.join(data_dir, f), output_dir, batch_size)
+            for f in selected_files
+        ]
+        for future in tqdm(as_completed(futures), total=len(futures), desc=f"Loading {percentage_to_load}% of files"):
+            stats = future.result()
+            report_shard(stats)
+            results.append(stats)
+
+    results.sort(key=lambda s: s["shard"])
+    return results
+
+
+def ingest_indexed(data_dir, output_dir, index_dir, percentage_to_load=None, n_hosts=None, seed=42, stratify=None,
+                   workers=None, batch_size=50000):
+    """Parse an exact host-level sample of data_dir into a parquet dataset directory.
+
+    The shard index under index_dir is built on first use (and refreshed for new or changed shards);
+    each shard then reads only its sampled lines by seeking to their byte offsets. Malformed and
+    IP-less lines are dropped when the index is built, so their per-shard counts come from the index.
+    """
+    from shard_index import ShardIndex
+
+    index = ShardIndex(index_dir)
+    index.build(data_dir, workers)
+    positions = index.sample(n_hosts, percentage_to_load, seed, stratify)
+    locations = index.locations(positions)
+    indexed = {os.path.splitext(shard["file"])[0]: shard for shard in index.shards}
+
+    os.makedirs(output_dir, exist_ok=True)
+    remove_stale_parts(output_dir, locations)
+
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(ingest_shard, os.path.join(data_dir, f), output_dir, batch_size, offsets)
+            for f, offsets in locations.items()
+        ]
+        for future in tqdm(as_completed(futures), total=len(futures), desc=f"Loading {len(positions)} sampled hosts"):
+            stats = future.result()
+            for key in ("skipped_malformed", "skipped_no_ip"):
+                stats[key] += indexed[stats["shard"]][key]
+            report_shard(stats)
+            results.append(stats)
+
+    results.sort(key=lambda s: s["shard"])
+    return results
+
+
+def summarize(results):
+    print(f"Loaded {sum(s['hosts'] for s in results)} hosts from {len(results)} shards")
+    print(f"Skipped entries:")
+    print(f" - Malformed lines: {sum(s['skipped_malformed'] for s in results)}")
+    print(f" - Missing or invalid IP: {sum(s['skipped_no_ip'] for s in results)}")
+    failed = [s['shard'] for s in results if s['error'] is not None]
+    if failed:
+        print(f" - Unreadable shards: {len(failed)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parallel JSONL -> parquet ingest for the superhost dataset")
+    parser.add_argument("--data-dir", default="./dataset")
+    parser.add_argument("--output-dir", default="./superhost_parts")
+    parser.add_argument("--percentage", type=float, default=5)
+    parser.add_argument("--hosts", type=int, default=None, help="exact number of hosts to sample (needs --index)")
+    parser.add_argument("--index", default=None, help="shard index directory; sample hosts instead of whole shards")
+    parser.add_argument("--stratify", choices=["country", "port_count"], default=None)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=50000)
+    args = parser.parse_args()
+
+    if args.index:
+        results = ingest_indexed(args.data_dir, args.output_dir, args.index, args.percentage, args.hosts, args.seed,
+                                 args.stratify, args.workers, args.batch_size)
+    else:
+        results = ingest(args.data_dir, args.output_dir, args.percentage, args.seed, args.workers, args.batch_size)
+    summarize(results)
+
+    with open(os.path.join(args.output_dir, "_ingest_stats.json"), 'w') as f:
+        json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+import os
+import time
+import shutil
+import resource
+import tempfile
+import multiprocessing as mp
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from catboost import CatBoostClassifier, Pool
+
+from ensemble import BucketEnsemble
+
+
+DEFAULT_PARAMS = {
+    "iterations": 300,
+    "learning_rate": 0.1,
+    "depth": 6,
+    "task_type": "CPU",
+    "use_best_model": True,
+    "early_stopping_rounds": 30,
+    "verbose": 0,
+}
+
+
+class BucketModels:
+    """Trained bucket classifiers: one per non-constant bucket or one MultiLogloss model for all of them."""
+
+    def __init__(self, buckets, models=None, multi_model=None, multi_buckets=None, constants=None):
+        self.buckets = list(buckets)
+        self.models = models or {}
+        self.multi_model = multi_model
+        self.multi_buckets = list(multi_buckets or [])
+        self.constants = constants or {}
+
+    def predict(self, X):
+        return BucketEnsemble.from_bucket_models(self).predict_frame(X)
+
+
+def constant_buckets(y_train):
+    """Buckets whose training labels are all 0 or all 1 (nothing to learn)."""
+    col_min = y_train.min(axis=0)
+    col_max = y_train.max(axis=0)
+    return {bucket: int(col_min[bucket]) for bucket in y_train.columns if col_min[bucket] == col_max[bucket]}
+
+
+def _quantized_label_pool(X, border_count=254, borders_path=None):
+    """Quantize every row of X twice, labeled 0 then 1; slicing picks one copy per row for each bucket.
+
+    CatBoost pools cannot swap labels, but slices of a quantized pool stay quantized, so the
+    features are binarized once per split instead of once per bucket fit. The price is memory: while
+    quantizing, the pool holds a float32 matrix of 2 x len(X) rows (twice the split's float32 size,
+    filled in place from X without a further copy); afterwards the quantized pool takes 2 bytes per
+    row and feature, half of one float32 copy of the split.
+    """
+    n_rows = len(X)
+    data = np.empty((2 * n_rows, X.shape[1]), dtype=np.float32)
+    data[:n_rows] = X.to_numpy(dtype=np.float32, na_value=np.nan)
+    data[n_rows:] = data[:n_rows]
+    pool = Pool(data, label=np.repeat([0, 1], n_rows), feature_names=list(X.columns))
+    del data
+    if borders_path is None:
+        pool.quantize(border_count=border_count)
+    else:
+        pool.quantize(input_borders=borders_path)
+    return pool
+
+
+def _bucket_pool(label_pool, labels):
+    """Slice of a _quantized_label_pool with each row labeled by this bucket."""
+    labels = np.asarray(labels, dtype=np.int64)
+    return label_pool.slice(np.arange(len(labels)) + len(labels) * labels)
+
+
+def train_multi_target(X_train, y_train, X_val, y_val, params=None, thread_count=-1, border_count=254):
+    """One MultiLogloss model for all non-constant buckets."""
+    constants = constant_buckets(y_train)
+    targets = [b for b in y_train.columns if b not in constants]
+
+    model_params = dict(DEFAULT_PARAMS, **(params or {}))
+    model_params.update(loss_function="MultiLogloss", eval_metric="MultiLogloss", thread_count=thread_count,
+                        border_count=border_count)
+    model = CatBoostClassifier(**model_params)
+    if targets:
+        train_pool = Pool(X_train, label=y_train[targets].values)
+        val_pool = Pool(X_val, label=y_val[targets].values)
+        model.fit(train_pool, eval_set=val_pool)
+    else:
+        model = None
+
+    return BucketModels(y_train.columns, multi_model=model, multi_buckets=targets, constants=constants)
+
+
+def train_per_bucket(X_train, y_train, X_val, y_val, params=None, thread_budget=None, threads_per_fit=4,
+                     border_count=254, log=print):
+    """One Logloss model per non-constant bucket, all sliced from one quantized pool per split.
+
+    thread_budget cores are split into thread_budget // threads_per_fit concurrent fits, so the
+    total number of CatBoost threads never exceeds the budget.
+    """
+    thread_budget = thread_budget or os.cpu_count()
+    threads_per_fit = max(1, min(threads_per_fit, thread_budget))
+    n_workers = max(1, thread_budget // threads_per_fit)
+
+    constants = constant_buckets(y_train)
+    targets = [b for b in y_train.columns if b not in constants]
+    log(f"Training {len(targets)} buckets ({len(constants)} constant in training split skipped) "
+        f"with {n_workers} workers x {threads_per_fit} threads")
+
+    model_params = dict(DEFAULT_PARAMS, **(params or {}))
+    # Concurrent fits would share and corrupt one catboost_info training directory
+    model_params.update(loss_function="Logloss", eval_metric="Logloss", thread_count=threads_per_fit,
+                        allow_writing_files=False)
+
+    pool_dir = tempfile.mkdtemp(prefix="bucket_pool_")
+    try:
+        # Quantize each split once; validation reuses the training borders
+        train_pool = _quantized_label_pool(X_train, border_count)
+        borders_path = os.path.join(pool_dir, "borders.tsv")
+        train_pool.save_quantization_borders(borders_path)
+        val_pool = _quantized_label_pool(X_val, borders_path=borders_path)
+
+        worker_targets = [targets[w::n_workers] for w in range(n_workers)]
+
+        def run_worker(bucket_names):
+            fitted = {}
+            for bucket in bucket_names:
+                model = CatBoostClassifier(**model_params)
+                model.fit(_bucket_pool(train_pool, y_train[bucket].values),
+                          eval_set=_bucket_pool(val_pool, y_val[bucket].values))
+                fitted[bucket] = model
+            return fitted
+
+        models = {}
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
+            for fitted in executor.map(run_worker, worker_targets):
+                models.update(fitted)
+    finally:
+        shutil.rmtree(pool_dir, ignore_errors=True)
+
+    return BucketModels(y_train.columns, models={b: models[b] for b in targets}, constants=constants)
+
+
+def train_bucket_models(X_train, y_train, X_val, y_val, mode="per_bucket", **kwargs):
+    if mode == "multi":
+        return train_multi_target(X_train, y_train, X_val, y_val, **kwargs)
+    if mode == "per_bucket":
+        return train_per_bucket(X_train, y_train, X_val, y_val, **kwargs)
+    raise ValueError(f"Unknown training mode: {mode}")
+
+
+def train_legacy(X_train, y_train, X_val, y_val, params=None):
+    """The original notebook approach: one fit per bucket on raw frames, joblib threads with n_jobs=-1."""
+    from joblib import Parallel, delayed
+
+    model_params = dict(DEFAULT_PARAMS, **(params or {}))
+    model_params.update(loss_function="Logloss", eval_metric="Logloss")
+
+    def fit_one(bucket):
+        model = CatBoostClassifier(**model_params)
+        model.fit(X_train, y_train[bucket], eval_set=(X_val, y_val[bucket]))
+        return bucket, model
+
+    # Single-class buckets would make CatBoost raise, so they are skipped here too
+    constants = constant_buckets(y_train)
+    targets = [b for b in y_train.columns if b not in constants]
+    results = Parallel(n_jobs=-1, backend="threading")(delayed(fit_one)(b) for b in targets)
+    return BucketModels(y_train.columns, models=dict(results), constants=constants)
+
+
+def _profile_child(queue, mode, data, kwargs):
+    X_train, y_train, X_val, y_val = data
+    start = time.perf_counter()
+    try:
+        if mode == "legacy":
+            train_legacy(X_train, y_train, X_val, y_val, **kwargs)
+        else:
+            train_bucket_models(X_train, y_train, X_val, y_val, mode=mode, **kwargs)
+    except Exception as e:
+        # Report instead of dying silently, otherwise the parent would wait on the queue forever
+        queue.put({"mode": mode, "error": f"{type(e).__name__}: {e}"})
+        return
+    wall = time.perf_counter() - start
+    # ru_maxrss is reported in KiB on Linux
+    queue.put({"mode": mode, "wall_seconds": wall, "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024})
+
+
+def compare_training_modes(X_train, y_train, X_val, y_val, modes=("legacy", "per_bucket", "multi"), mode_kwargs=None):
+    """Wall time and peak RSS of each training mode, each run in a fresh process so peaks do not overlap."""
+    mode_kwargs = mode_kwargs or {}
+    ctx = mp.get_context("fork")
+    rows = []
+    for mode in modes:
+        queue = ctx.Queue()
+        proc = ctx.Process(target=_profile_child, args=(queue, mode, (X_train, y_train, X_val, y_val), mode_kwargs.get(mode, {})))
+        proc.start()
+        result = queue.get()
+        proc.join()
+        if "error" in result:
+            print(f"{mode:>10}: failed ({result['error']})")
+        else:
+            print(f"{mode:>10}: {result['wall_seconds']:.1f}s, peak RSS {result['peak_rss_mb']:.0f} MB")
+        rows.append(result)
+    return pd.DataFrame(rows)
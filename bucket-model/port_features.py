@@ -0,0 +1,94 @@
+import os
+import hashlib
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from port_store import MAX_PORT, as_csr
+
+
+def num_buckets_for(bucket_size, max_port=MAX_PORT):
+    return ((max_port - 1) // bucket_size) + 1
+
+
+def bucket_column_names(bucket_size, max_port=MAX_PORT):
+    return [
+        f"bucket_{i * bucket_size + 1}-{min((i + 1) * bucket_size, max_port)}"
+        for i in range(num_buckets_for(bucket_size, max_port))
+    ]
+
+
+class PortFeatureEngine:
+    """Bucket labels and port statistics computed from a single scan of the host x port matrix.
+
+    Results are cached per bucket size in memory and, when cache_dir is set, on disk as .npz files.
+    """
+
+    def __init__(self, port_matrix, cache_dir=None, dataset_id="superhost"):
+        csr = as_csr(port_matrix)
+        self.n_hosts, self.max_port = csr.shape
+
+        # Flattened (row, port) pairs of every open port; this is the only pass over the port matrix
+        self.indptr = csr.indptr
+        self.ports = csr.indices.astype(np.int64) + 1
+        self.rows = np.repeat(np.arange(self.n_hosts), np.diff(self.indptr))
+
+        # Cache files are keyed by the port matrix contents, so a regenerated sample never reuses stale labels
+        digest = hashlib.blake2b(digest_size=8)
+        digest.update(np.ascontiguousarray(csr.indptr).tobytes())
+        digest.update(np.ascontiguousarray(csr.indices).tobytes())
+        self.fingerprint = digest.hexdigest()
+
+        self.cache_dir = cache_dir
+        self.dataset_id = dataset_id
+        self._labels = {}
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _cache_path(self, bucket_size):
+        return os.path.join(self.cache_dir, f"{self.dataset_id}_{self.fingerprint}_buckets_{bucket_size}.npz")
+
+    def bucket_labels(self, bucket_size):
+        """Binary host x bucket CSR matrix; port p falls in bucket p // bucket_size."""
+        return self.bucket_labels_multi([bucket_size])[bucket_size]
+
+    def bucket_labels_multi(self, bucket_sizes):
+        """Bucket labels for several bucket sizes, reusing the same flattened port arrays."""
+        for bucket_size in bucket_sizes:
+            if bucket_size in self._labels:
+                continue
+            if self.cache_dir is not None and os.path.exists(self._cache_path(bucket_size)):
+                self._labels[bucket_size] = sparse.load_npz(self._cache_path(bucket_size)).tocsr()
+                continue
+
+            num_buckets = num_buckets_for(bucket_size, self.max_port)
+            data = np.ones(len(self.ports), dtype=np.uint8)
+            labels = sparse.csr_matrix(
+                (data, (self.rows, self.ports // bucket_size)), shape=(self.n_hosts, num_buckets)
+            )
+            labels.sum_duplicates()
+            labels.data[:] = 1
+
+            self._labels[bucket_size] = labels
+            if self.cache_dir is not None:
+                sparse.save_npz(self._cache_path(bucket_size), labels)
+
+        return {bucket_size: self._labels[bucket_size] for bucket_size in bucket_sizes}
+
+    def bucket_frame(self, bucket_size, index=None):
+        labels = self.bucket_labels(bucket_size)
+        return pd.DataFrame(labels.toarray(), columns=bucket_column_names(bucket_size, self.max_port), index=index)
+
+    def num_ports_active(self):
+        return np.diff(self.indptr)
+
+    def port_entropy(self, modulo=1000):
+        """Shannon entropy (base 2) of each host's ports binned by port % modulo."""
+        keys = self.rows * modulo + self.ports % modulo
+        uniq, counts = np.unique(keys, return_counts=True)
+        bin_rows = uniq // modulo
+
+        totals = self.num_ports_active()
+        probs = counts / totals[bin_rows]
+        return np.bincount(bin_rows, weights=-probs * np.log2(probs), minlength=self.n_hosts)
@@ -0,0 +1,197 @@
+import os
+import json
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from scipy import sparse
+
+
+# Column convention shared with the legacy dense format: port p lives in column p - 1 ("port_p")
+MAX_PORT = 65535
+PORT_DTYPE = np.uint16
+
+
+class PortSets:
+    """Read-only CSR view (indptr/indices) of per-host open ports, usually memory-mapped from disk."""
+
+    def __init__(self, indptr, indices, max_port=MAX_PORT):
+        self.indptr = indptr
+        self.indices = indices
+        self.shape = (len(indptr) - 1, max_port)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def ports(self, i):
+        return self.indices[self.indptr[i]:self.indptr[i + 1]].astype(np.int64) + 1
+
+    def to_scipy(self):
+        data = np.ones(len(self.indices), dtype=np.uint8)
+        return sparse.csr_matrix((data, np.asarray(self.indices), np.asarray(self.indptr)), shape=self.shape)
+
+
+def _csr_from_lengths(lengths, flat_ports, max_port=MAX_PORT):
+    flat_ports = np.asarray(flat_ports, dtype=np.int64)
+    lengths = np.asarray(lengths, dtype=np.int64)
+
+    # Drop out-of-range ports (same rule as the dense matrix: 1 <= p <= MAX_PORT)
+    valid = (flat_ports >= 1) & (flat_ports <= max_port)
+    rows = np.repeat(np.arange(len(lengths)), lengths)
+    rows, cols = rows[valid], flat_ports[valid] - 1
+
+    data = np.ones(len(cols), dtype=np.uint8)
+    csr = sparse.csr_matrix((data, (rows, cols)), shape=(len(lengths), max_port))
+    csr.sum_duplicates()
+    csr.data[:] = 1
+    return csr
+
+
+def ports_to_csr(ports, max_port=MAX_PORT):
+    """Build a binary host x port CSR matrix from a list column (Arrow array or sequence of lists)."""
+    if isinstance(ports, pd.Series):
+        ports = pa.array(ports, type=pa.list_(pa.int32()), from_pandas=True)
+    elif not isinstance(ports, (pa.Array, pa.ChunkedArray)):
+        ports = pa.array(list(ports), type=pa.list_(pa.int32()))
+
+    lengths = pc.fill_null(pc.list_value_length(ports), 0).to_numpy()
+    flat_ports = pc.list_flatten(ports).to_numpy(zero_copy_only=False)
+    return _csr_from_lengths(lengths, flat_ports, max_port)
+
+
+def dense_to_csr(port_matrix):
+    return sparse.csr_matrix(np.asarray(port_matrix, dtype=np.uint8))
+
+
+def as_csr(port_matrix):
+    """Accept any supported port representation and return a scipy CSR matrix."""
+    if sparse.issparse(port_matrix):
+        return port_matrix.tocsr()
+    if isinstance(port_matrix, PortSets):
+        return port_matrix.to_scipy()
+    if isinstance(port_matrix, pd.DataFrame):
+        port_cols = [c for c in port_matrix.columns if c.startswith("port_")]
+        return dense_to_csr(port_matrix[port_cols].values)
+    return dense_to_csr(port_matrix)
+
+
+def port_columns(max_port=MAX_PORT):
+    return [f"port_{p}" for p in range(1, max_port + 1)]
+
+
+def read_port_matrix(path, batch_size=2000):
+    """Load a superhost parquet (sparse or legacy dense) as (metadata DataFrame, CSR port matrix)."""
+    schema = pq.read_schema(path) if os.path.isfile(path) else pq.ParquetDataset(path).schema
+    names = schema.names
+
+    if "ports" in names:
+        table = pq.read_table(path)
+        port_matrix = ports_to_csr(table.column("ports"))
+        return table.to_pandas(), port_matrix
+
+    port_cols = [c for c in names if c.startswith("port_")]
+    meta_cols = [c for c in names if not c.startswith("port_")]
+
+    # Legacy dense files that kept the raw port list ("plist") do not need the port_N columns at all
+    if "plist" in names:
+        table = pq.read_table(path, columns=meta_cols)
+        port_matrix = ports_to_csr(table.column("plist"))
+        return table.to_pandas().rename(columns={"plist": "ports"}), port_matrix
+
+    # Legacy dense format: convert port_N columns a batch of rows at a time
+    col_index = np.array([int(c.split("_")[1]) - 1 for c in port_cols])
+
+    lengths, flat_ports = [], []
+    parquet_file = pq.ParquetFile(path)
+    for batch in parquet_file.iter_batches(batch_size=batch_size, columns=port_cols):
+        block = np.column_stack([col.to_numpy(zero_copy_only=False) for col in batch.columns])
+        rows, cols = np.nonzero(block)
+        lengths.append(np.bincount(rows, minlength=block.shape[0]))
+        flat_ports.append(col_index[cols] + 1)
+
+    port_matrix = _csr_from_lengths(
+        np.concatenate(lengths) if lengths else np.zeros(0, dtype=np.int64),
+        np.concatenate(flat_ports) if flat_ports else np.zeros(0, dtype=np.int64),
+    )
+    return pd.read_parquet(path, columns=meta_cols), port_matrix
+
+
+def superhost_table(df, port_format="sparse"):
+    """Preprocessed hosts as an Arrow table with ports as a list<uint16> column ("sparse") or 65,535 port_N columns ("dense")."""
+    if port_format == "sparse":
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        i = table.schema.get_field_index("ports")
+        return table.set_column(i, "ports", table.column(i).cast(pa.list_(pa.uint16())))
+
+    if port_format != "dense":
+        raise ValueError(f"Unknown port_format: {port_format}")
+
+    port_matrix = ports_to_csr(df["ports"]).toarray()
+    port_df = pd.DataFrame(port_matrix, columns=port_columns())
+    df_final = pd.concat([df.drop(columns=["ports"]).reset_index(drop=True), port_df], axis=1)
+    return pa.Table.from_pandas(df_final, preserve_index=False)
+
+
+def write_superhost(df, output_path, port_format="sparse"):
+    """Write the preprocessed hosts with ports as a list<uint16> column ("sparse") or 65,535 port_N columns ("dense")."""
+    pq.write_table(superhost_table(df, port_format), output_path)
+
+
+def part_files(parts_dir):
+    """Parquet parts of an ingest output directory, in shard order."""
+    return sorted(os.path.join(parts_dir, f) for f in os.listdir(parts_dir) if f.endswith(".parquet"))
+
+
+def write_superhost_parts(parts, output_path, port_format="sparse"):
+    """write_superhost over parquet parts (e.g. part_files(parts_dir)), one part in memory at a time; returns the row count."""
+    writer = None
+    rows = 0
+    try:
+        for path in parts:
+            table = superhost_table(pd.read_parquet(path), port_format)
+            if writer is None:
+                writer = pq.ParquetWriter(output_path, table.schema)
+            writer.write_table(table.cast(writer.schema))
+            rows += len(table)
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+def save_port_csr(port_matrix, output_dir):
+    """Save indptr/indices as .npy files so load_port_csr can memory-map them."""
+    csr = as_csr(port_matrix)
+    os.makedirs(output_dir, exist_ok=True)
+    np.save(os.path.join(output_dir, "indptr.npy"), csr.indptr.astype(np.int64))
+    np.save(os.path.join(output_dir, "indices.npy"), csr.indices.astype(PORT_DTYPE))
+    with open(os.path.join(output_dir, "meta.json"), 'w') as f:
+        json.dump({"rows": csr.shape[0], "max_port": csr.shape[1], "nnz": int(csr.nnz)}, f)
+
+
+def load_port_csr(input_dir, mmap=True, as_scipy=False):
+    mmap_mode = 'r' if mmap else None
+    indptr = np.load(os.path.join(input_dir, "indptr.npy"), mmap_mode=mmap_mode)
+    indices = np.load(os.path.join(input_dir, "indices.npy"), mmap_mode=mmap_mode)
+    with open(os.path.join(input_dir, "meta.json"), 'r') as f:
+        meta = json.load(f)
+
+    view = PortSets(indptr, indices, meta["max_port"])
+    return view.to_scipy() if as_scipy else view
+
+
+def host_port_counts(port_matrix):
+    """Number of open ports per host (row sums)."""
+    if isinstance(port_matrix, PortSets):
+        return np.diff(port_matrix.indptr)
+    return np.diff(as_csr(port_matrix).indptr)
+
+
+def port_totals(port_matrix):
+    """Number of hosts with each port open, indexed by port - 1 (column sums)."""
+    if isinstance(port_matrix, PortSets):
+        return np.bincount(port_matrix.indices, minlength=port_matrix.shape[1])
+    csr = as_csr(port_matrix)
+    return np.bincount(csr.indices, minlength=csr.shape[1])
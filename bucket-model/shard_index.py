@@ -0,0 +1,227 @@
+import os
+import json
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+
+from ingest import parse_host, MALFORMED_ERRORS
+from feature_store import ipv4_to_uint32
+
+
+# One entry per indexed host, in shard order then file order; shards.json maps shard ids to files
+ARRAYS = {
+    "offsets": np.uint64,       # byte offset of the host's line in its shard
+    "ips": np.uint32,
+    "port_counts": np.uint16,   # valid open ports (1..65535), as counted by ingest.parse_host
+    "countries": "S2",          # ISO country code, b"" when missing
+    "shard_ids": np.uint32,
+}
+
+STRATIFY_COLUMNS = ("country", "port_count")
+
+
+def scan_shard(file_path):
+    """Offsets and key fields of every host line in one JSONL shard (malformed and IP-less lines are counted, not indexed)."""
+    offsets, ips, port_counts, countries = [], [], [], []
+    stats = {"lines": 0, "skipped_malformed": 0, "skipped_no_ip": 0}
+    with open(file_path, 'rb') as f:
+        offset = 0
+        for line in f:
+            stats["lines"] += 1
+            try:
+                record = parse_host(json.loads(line))
+            except MALFORMED_ERRORS:
+                record = None
+                stats["skipped_malformed"] += 1
+            else:
+                if record is None:
+                    stats["skipped_no_ip"] += 1
+            if record is not None:
+                offsets.append(offset)
+                ips.append(record["ip"])
+                port_counts.append(len(record["ports"]))
+                countries.append((record["country_code"] or "")[:2])
+            offset += len(line)
+
+    ipv4, valid = ipv4_to_uint32(ips)
+    if not valid.all():
+        print(f"{os.path.basename(file_path)}: {int((~valid).sum())} hosts without a dotted-quad IPv4 indexed as 0.0.0.0")
+    arrays = {
+        "offsets": np.asarray(offsets, dtype=np.uint64),
+        "ips": ipv4,
+        "port_counts": np.minimum(np.asarray(port_counts, dtype=np.int64), np.iinfo(np.uint16).max).astype(np.uint16),
+        "countries": np.asarray(countries, dtype="S2"),
+    }
+    return arrays, stats
+
+
+def _file_signature(path):
+    info = os.stat(path)
+    return {"size": info.st_size, "mtime_ns": info.st_mtime_ns}
+
+
+class ShardIndex:
+    """Byte offsets and ip / port count / country of every host in a directory of JSONL shards.
+
+    Stored as one .npy file per field under root plus shards.json. Building rescans only shards whose
+    size or modification time changed, so the full scan is paid once; sampling then draws an exact,
+    optionally stratified number of hosts and reads just their lines by seeking.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.shards = []
+        self.arrays = {name: np.empty(0, dtype=dtype) for name, dtype in ARRAYS.items()}
+        if os.path.exists(os.path.join(root, "shards.json")):
+            self._load()
+
+    def _load(self):
+        with open(os.path.join(self.root, "shards.json"), 'r') as f:
+            manifest = json.load(f)
+        arrays = {name: np.load(os.path.join(self.root, f"{name}.npy"), mmap_mode="r") for name in ARRAYS}
+        # A build interrupted between renames leaves arrays that do not match shards.json; rebuild from scratch
+        if any(len(values) != manifest["hosts"] for values in arrays.values()):
+            print(f"Shard index {self.root} is inconsistent, it will be rebuilt")
+            return
+        self.shards, self.arrays = manifest["shards"], arrays
+
+    def __len__(self):
+        return len(self.arrays["offsets"])
+
+    def frame(self):
+        """Index as a DataFrame (one row per host), e.g. for custom strata."""
+        return pd.DataFrame({
+            "shard_id": self.arrays["shard_ids"],
+            "offset": self.arrays["offsets"],
+            "ipv4": self.arrays["ips"],
+            "port_count": self.arrays["port_counts"],
+            "country": pd.Series(self.arrays["countries"]).str.decode("ascii"),
+        })
+
+    def build(self, data_dir, workers=None, log=print):
+        """Index the .json shards of data_dir, reusing entries of unchanged shards; returns the shards rescanned."""
+        files = sorted(f for f in os.listdir(data_dir) if f.endswith('.json'))
+        previous = {s["file"]: s for s in self.shards}
+        stale = [f for f in files if f not in previous
+                 or {k: previous[f][k] for k in ("size", "mtime_ns")} != _file_signature(os.path.join(data_dir, f))]
+        if not stale and len(files) == len(self.shards):
+            log(f"Shard index {self.root} is up to date ({len(self)} hosts in {len(files)} shards)")
+            return []
+
+        scanned = {}
+        if stale:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = {pool.submit(scan_shard, os.path.join(data_dir, f)): f for f in stale}
+                for future in tqdm(as_completed(futures), total=len(futures), desc="Indexing shards"):
+                    scanned[futures[future]] = future.result()
+
+        shards, parts = [], {name: [] for name in ARRAYS}
+        for shard_id, file_name in enumerate(files):
+            if file_name in scanned:
+                arrays, stats = scanned[file_name]
+            else:
+                old = previous[file_name]
+                rows = slice(old["start"], old["start"] + old["hosts"])
+                arrays = {name: np.asarray(self.arrays[name][rows]) for name in ARRAYS if name != "shard_ids"}
+                stats = {k: old[k] for k in ("lines", "skipped_malformed", "skipped_no_ip")}
+            hosts = len(arrays["offsets"])
+            shards.append({"id": shard_id, "file": file_name, "start": sum(s["hosts"] for s in shards),
+                           "hosts": hosts, **stats, **_file_signature(os.path.join(data_dir, file_name))})
+            for name in ARRAYS:
+                parts[name].append(np.full(hosts, shard_id, dtype=np.uint32) if name == "shard_ids" else arrays[name])
+
+        self.shards = shards
+        self.arrays = {name: (np.concatenate(parts[name]) if parts[name] else np.empty(0, dtype=dtype)).astype(dtype, copy=False)
+                       for name, dtype in ARRAYS.items()}
+        self._save(data_dir)
+        log(f"Indexed {len(self)} hosts in {len(files)} shards ({len(stale)} scanned, {len(files) - len(stale)} reused)")
+        return stale
+
+    def _save(self, data_dir):
+        os.makedirs(self.root, exist_ok=True)
+        # Arrays first, shards.json last; _load checks that both agree on the host count
+        for name in ARRAYS:
+            tmp_path = os.path.join(self.root, f".{name}.npy.tmp")
+            with open(tmp_path, 'wb') as f:
+                np.save(f, self.arrays[name])
+            os.replace(tmp_path, os.path.join(self.root, f"{name}.npy"))
+        tmp_path = os.path.join(self.root, ".shards.json.tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump({"data_dir": os.path.abspath(data_dir), "hosts": len(self), "shards": self.shards}, f, indent=2)
+        os.replace(tmp_path, os.path.join(self.root, "shards.json"))
+
+    def strata(self, stratify):
+        """Stratum label per host: country code, or port count rounded down to a power of two."""
+        if stratify == "country":
+            return np.asarray(self.arrays["countries"])
+        if stratify == "port_count":
+            return np.floor(np.log2(np.maximum(np.asarray(self.arrays["port_counts"]), 1))).astype(np.int8)
+        raise ValueError(f"Unknown stratify column: {stratify} (expected one of {STRATIFY_COLUMNS})")
+
+    def sample(self, n_hosts=None, percentage=None, seed=42, stratify=None):
+        """Positions of exactly n_hosts (or percentage % of the indexed hosts), sorted by shard and offset.
+
+        With stratify, every stratum gets its proportional share (largest remainders round up), so
+        small countries or port-count ranges are represented as in the full dataset.
+        """
+        total = len(self)
+        if n_hosts is None:
+            n_hosts = int(round(total * (percentage if percentage is not None else 100) / 100.0))
+        n_hosts = min(max(int(n_hosts), 0), total)
+        rng = np.random.default_rng(seed)
+        if stratify is None:
+            return np.sort(rng.choice(total, n_hosts, replace=False))
+
+        codes, _ = pd.factorize(self.strata(stratify))
+        counts = np.bincount(codes)
+        quota = counts * (n_hosts / total)
+        take = np.floor(quota).astype(np.int64)
+        remainder = n_hosts - take.sum()
+        take[np.argsort(-(quota - take), kind="stable")[:remainder]] += 1
+
+        # Random key per host, then the lowest keys of each stratum
+        keys = rng.random(total)
+        order = np.lexsort((keys, codes))
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        chosen = np.concatenate([order[start:start + k] for start, k in zip(starts, take)])
+        return np.sort(chosen)
+
+    def locations(self, positions):
+        """{shard file: byte offsets} for the sampled positions, offsets ascending within each shard."""
+        shard_ids = np.asarray(self.arrays["shard_ids"])[positions]
+        offsets = np.asarray(self.arrays["offsets"])[positions]
+        return {self.shards[shard_id]["file"]: offsets[shard_ids == shard_id]
+                for shard_id in np.unique(shard_ids)}
+
+
+def read_lines(file_path, offsets):
+    """Yield the raw lines at the given byte offsets of one shard."""
+    with open(file_path, 'rb') as f:
+        for offset in offsets:
+            f.seek(int(offset))
+            yield f.readline()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a host-level byte-offset index of the superhost JSONL shards")
+    parser.add_argument("--data-dir", default="./dataset")
+    parser.add_argument("--index", default="./shard_index")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--hosts", type=int, default=None, help="print the strata of a sample of this many hosts")
+    parser.add_argument("--stratify", choices=STRATIFY_COLUMNS, default=None)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    index = ShardIndex(args.index)
+    index.build(args.data_dir, args.workers)
+    if args.hosts:
+        sample = index.frame().iloc[index.sample(args.hosts, seed=args.seed, stratify=args.stratify)]
+        print(f"Sampled {len(sample)} hosts from {sample['shard_id'].nunique()} shards")
+        print(sample["country"].value_counts().head(10).to_string())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+import json
+
+import pandas as pd
+
+from ingest import ingest, ingest_indexed
+
+
+def host(ip, ports=("22", "80")):
+    return {"host_identifier": {"ipv4": ip}, "ports_list": list(ports),
+            "services": [{"port": int(p), "transport": "TCP", "service_name": "HTTP"} for p in ports],
+            "location": {"country_code": "US"}, "autonomous_system": {"asn": 64500}}
+
+
+def write_shards(data_dir):
+    data_dir.mkdir()
+    with open(data_dir / "shard_0000.json", 'w') as f:
+        for i in range(5):
+            f.write(json.dumps(host(f"10.0.0.{i}")) + "\n")
+    # One line of each kind the ingest drops: not JSON, an array, a null asn, no IP
+    with open(data_dir / "shard_0001.json", 'w') as f:
+        f.write(json.dumps(host("10.0.1.1")) + "\n")
+        f.write("{not json\n")
+        f.write("[1, 2]\n")
+        f.write(json.dumps({**host("10.0.1.2"), "autonomous_system": {"asn": None}}) + "\n")
+        f.write(json.dumps({"ports_list": ["80"]}) + "\n")
+        f.write(json.dumps(host("10.0.1.3")) + "\n")
+
+
+def by_shard(results):
+    return {s["shard"]: (s["hosts"], s["skipped_malformed"], s["skipped_no_ip"]) for s in results}
+
+
+def test_ingest_counts_skipped_lines_per_shard(tmp_path):
+    write_shards(tmp_path / "dataset")
+    results = ingest(str(tmp_path / "dataset"), str(tmp_path / "parts"), 100, workers=1)
+    assert by_shard(results) == {"shard_0000": (5, 0, 0), "shard_0001": (2, 3, 1)}
+
+
+def test_indexed_ingest_reports_lines_dropped_by_the_index(tmp_path):
+    write_shards(tmp_path / "dataset")
+    results = ingest_indexed(str(tmp_path / "dataset"), str(tmp_path / "parts"), str(tmp_path / "index"),
+                             percentage_to_load=100, workers=1)
+    assert by_shard(results) == {"shard_0000": (5, 0, 0), "shard_0001": (2, 3, 1)}
+    assert len(pd.read_parquet(tmp_path / "parts")) == 7
+
+
+def test_rerun_with_another_sample_replaces_old_parts(tmp_path):
+    write_shards(tmp_path / "dataset")
+    (tmp_path / "parts").mkdir()
+    (tmp_path / "parts" / "shard_9999.parquet").write_bytes(b"stale")
+    ingest_indexed(str(tmp_path / "dataset"), str(tmp_path / "parts"), str(tmp_path / "index"), n_hosts=3, workers=1)
+    assert len(pd.read_parquet(tmp_path / "parts")) == 3
@@ -2,18 +2,10 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 import numpy as np
+from local_sql import figure_frame
 
-# Load the new dataset
-df = pd.read_csv('/mnt/data/dm1.csv')
-
-# Simulate missing 'geo_country' if not present
-if 'geo_country' not in df.columns:
-    np.random.seed(0)
-    df['geo_country'] = np.random.choice(['US', 'DE', 'CN', 'JP', 'RU', 'FR'], size=len(df))
-
-# Simulate 'unknown_service_count' if not present
-if 'unknown_service_count' not in df.columns:
-    df['unknown_service_count'] = np.random.randint(0, 5, size=len(df))
+# Load the per-host aggregates from the feature store (store.sql; code.sql is the original BigQuery query)
+df = figure_frame('figure13', sql_file='store.sql')
 
 # Aggregate by country
 summary = df.groupby('geo_country').agg({
@@ -6,6 +6,7 @@ SELECT
   COUNT(DISTINCT service) / NULLIF(COUNT(DISTINCT port), 0) AS service_to_port_ratio,
   os_name,
   organization_name,
+  country_code AS geo_country,
   CASE
     WHEN COUNT(DISTINCT port) >= 35 AND COUNT(DISTINCT service) <= 2 THEN 'Containerized'
     WHEN COUNT(DISTINCT port) BETWEEN 15 AND 25 AND COUNT(DISTINCT service) >= 8 THEN 'Non-Containerized'
@@ -13,6 +14,6 @@ SELECT
   END AS deployment_type
 FROM `censys_scans.ipv4_services`
 WHERE scan_date BETWEEN '2025-04-01' AND '2025-04-07'
-GROUP BY host_ip, os_name, organization_name
+GROUP BY host_ip, os_name, organization_name, country_code
 HAVING deployment_type IN ('Containerized', 'Non-Containerized')
 LIMIT 40
\ No newline at end of file
@@ -0,0 +1,14 @@
+SELECT 
+  ip AS host_ip,
+  open_port_count,
+  service_diversity,
+  unknown_service_count,
+  service_to_port_ratio,
+  os_name,
+  org_name AS organization_name,
+  country_code AS geo_country,
+  deployment_type
+FROM `feature_store.hosts`
+WHERE deployment_type IN ('Containerized', 'Non-Containerized')
+ORDER BY ipv4
+LIMIT 40
@@ -1,9 +1,10 @@
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
+from local_sql import figure_frame
 
-# Load Dataset 2
-df = pd.read_csv('dm2.csv')
+# Load Dataset 2 from the feature store (store.sql; code.sql is the original BigQuery query)
+df = figure_frame('figure14', sql_file='store.sql')
 
 # Label containerized vs non-containerized if not already present
 if 'deployment_type' not in df.columns:
@@ -2,13 +2,10 @@ import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 from sklearn.model_selection import train_test_split
+from local_sql import figure_frame
 
-# Load dataset (simulated file2-1.csv)
-df = pd.read_csv('/mnt/data/file2-1.csv')
-
-# Simulate 'open_port_count' since it's missing in file2-1
-np.random.seed(0)
-df['open_port_count'] = np.random.randint(20, 41, size=len(df))
+# Load dataset (code.sql, run locally against the parquet snapshot)
+df = figure_frame('figure15')
 
 # Label high diversity hosts using 80th percentile
 threshold = np.percentile(df['service_to_port_ratio'], 80)
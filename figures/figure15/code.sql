@@ -1,5 +1,6 @@
 SELECT 
   host_ip,
+  COUNT(DISTINCT port) AS open_port_count,
   COUNT(DISTINCT service) AS service_diversity,
   COUNT(DISTINCT service) / NULLIF(COUNT(DISTINCT port), 0) AS service_to_port_ratio,
   organization_name
@@ -1,7 +1,8 @@
 import matplotlib.pyplot as plt
+from local_sql import figure_frame
 
-# Load the previously created dataset
-df = pd.read_csv("/mnt/data/file3-1.csv")
+# Load the dataset (code.sql, run locally against the parquet snapshot)
+df = figure_frame('figure19')
 
 # Plot: Count of Service-Port Pairs by ASN Type
 plt.figure(figsize=(10, 6))
@@ -12,7 +12,7 @@ WHERE scan_date BETWEEN '2025-04-01' AND '2025-04-07'
   AND host_ip IN (
     SELECT host_ip 
     FROM `censys_scans.ipv4_services`
-    WHERE scan_date BETWEEN '2025-04-01' AND '2025-04-07`
+    WHERE scan_date BETWEEN '2025-04-01' AND '2025-04-07'
     GROUP BY host_ip
     HAVING COUNT(DISTINCT port) >= 50
   )
@@ -1,9 +1,10 @@
 import pandas as pd
 import matplotlib.pyplot as plt
 import numpy as np
+from local_sql import figure_frame
 
-# Load the uploaded file
-df = pd.read_csv("/mnt/data/file4-1.csv")
+# Load the per-host aggregates from the feature store (store.sql; code.sql is the original BigQuery query)
+df = figure_frame('figure23', sql_file='store.sql')
 
 # Plotting: service_to_port_ratio vs open_port_count, colored by high_diversity
 plt.figure(figsize=(10, 6))
@@ -0,0 +1,23 @@
+WITH superhosts AS (
+  SELECT 
+    ip AS host_ip,
+    open_port_count,
+    service_diversity,
+    service_to_port_ratio
+  FROM `feature_store.hosts`
+  WHERE open_port_count >= 50
+),
+threshold AS (
+  SELECT DISTINCT
+    PERCENTILE_CONT(service_to_port_ratio, 0.8) OVER() AS ratio_threshold
+  FROM superhosts
+)
+SELECT 
+  s.host_ip,
+  s.open_port_count,
+  s.service_diversity,
+  s.service_to_port_ratio,
+  IF(s.service_to_port_ratio > t.ratio_threshold, 1, 0) AS high_diversity
+FROM superhosts s
+CROSS JOIN threshold t
+LIMIT 50
@@ -0,0 +1,268 @@
+import os
+import re
+import sys
+import glob
+import json
+import runpy
+import hashlib
+import argparse
+import duckdb
+import yaml
+import pandas as pd
+
+
+FIGURES_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CONFIG = os.path.join(FIGURES_DIR, "tables.yaml")
+
+# String literals, comments and backtick identifiers are masked before rewriting so their contents are never touched
+_TOKEN = re.compile(r"(?P<raw>[rR]'[^']*')|(?P<string>'(?:[^'\\]|\\.)*')|(?P<comment>--[^\n]*)|(?P<ident>`[^`]*`)")
+
+# BigQuery -> DuckDB rewrites, applied in order to the masked query text
+_REWRITES = [
+    # port IN UNNEST([21, 22, ...]) -> port IN (21, 22, ...)
+    (re.compile(r"\bIN\s+UNNEST\s*\(\s*\[(.*?)\]\s*\)", re.I | re.S), r"IN (\1)"),
+    # FROM t, UNNEST(list) AS x -> the unnested column is named x, as in BigQuery
+    (re.compile(r"\bUNNEST\s*\(([^()]*)\)\s+AS\s+(\w+)", re.I), r"UNNEST(\1) AS \2_unnest(\2)"),
+    (re.compile(r"\bCOUNTIF\s*\(", re.I), "count_if("),
+    (re.compile(r"\bREGEXP_CONTAINS\s*\(", re.I), "regexp_matches("),
+    (re.compile(r"\bPERCENTILE_CONT\s*\(", re.I), "quantile_cont("),
+    (re.compile(r"\bAS\s+STRING\b", re.I), "AS VARCHAR"),
+    (re.compile(r"\bAS\s+INT64\b", re.I), "AS BIGINT"),
+    (re.compile(r"\bAS\s+FLOAT64\b", re.I), "AS DOUBLE"),
+    # BigQuery DAYOFWEEK is 1 (Sunday) .. 7, DuckDB DOW is 0 (Sunday) .. 6
+    (re.compile(r"\bEXTRACT\s*\(\s*DAYOFWEEK\s+FROM\s+([^()]+?)\s*\)", re.I), r"(EXTRACT(DOW FROM \1) + 1)"),
+    (re.compile(r"\bEXTRACT\s*\(\s*DATE\s+FROM\s+([^()]+?)\s*\)", re.I), r"CAST(\1 AS DATE)"),
+]
+
+
+def _mask(sql):
+    literals = []
+
+    def replace(match):
+        kind, text = match.lastgroup, match.group(0)
+        if kind == "raw":
+            # r'...' has no escapes in BigQuery; DuckDB strings do not process backslashes either
+            text = text[1:]
+        elif kind == "ident":
+            text = '"' + text[1:-1] + '"'
+        literals.append(text)
+        return f"\x00{len(literals) - 1}\x00"
+
+    return _TOKEN.sub(replace, sql), literals
+
+
+def _unmask(sql, literals):
+    return re.sub(r"\x00(\d+)\x00", lambda m: literals[int(m.group(1))], sql)
+
+
+def split_statements(sql):
+    """Statements of a (possibly multi-statement) SQL file; comment-only pieces are dropped."""
+    masked, literals = _mask(sql)
+    statements = []
+    for piece in masked.split(";"):
+        code = re.sub(r"\x00(\d+)\x00", lambda m: "" if literals[int(m.group(1))].startswith("--") else "x", piece)
+        if code.strip():
+            statements.append(_unmask(piece, literals).strip())
+    return statements
+
+
+def translate(sql):
+    """Rewrite one BigQuery Standard SQL statement into DuckDB SQL."""
+    masked, literals = _mask(sql)
+    for pattern, replacement in _REWRITES:
+        masked = pattern.sub(replacement, masked)
+    return _unmask(masked, literals).strip().rstrip(";")
+
+
+def load_config(path=DEFAULT_CONFIG):
+    with open(path, 'r') as f:
+        config = yaml.safe_load(f)
+    base = os.path.dirname(os.path.abspath(path))
+    tables = {name: os.path.join(base, pattern) for name, pattern in (config.get("tables") or {}).items()}
+    cache_dir = os.path.join(base, config.get("cache_dir", ".cache"))
+    output_dir = os.path.join(base, config.get("output_dir", "output"))
+    return {"tables": tables, "cache_dir": cache_dir, "output_dir": output_dir}
+
+
+class LocalSQL:
+    """DuckDB over the parquet snapshot, with every BigQuery table exposed as a view of the same name.
+
+    Query results are materialized to parquet under cache_dir, keyed by the translated SQL and the
+    size/mtime of the parquet files of every table it reads, so reruns only hit DuckDB when data changed.
+    """
+
+    def __init__(self, config_path=DEFAULT_CONFIG, threads=None):
+        self.config = load_config(config_path)
+        self.con = duckdb.connect()
+        # Default for query(); run_all --no-cache turns it off for the figure_frame() calls in code.py
+        self.use_cache = True
+        if threads:
+            self.con.execute(f"SET threads = {int(threads)}")
+        self.missing = []
+        for name, pattern in self.config["tables"].items():
+            if not glob.glob(pattern, recursive=True):
+                # DuckDB binds views eagerly; queries on this table fail with a clear message instead
+                self.missing.append(name)
+                continue
+            # Views cannot take prepared parameters, so the path is inlined as an escaped literal
+            literal = pattern.replace("'", "''")
+            self.con.execute(
+                f"CREATE VIEW \"{name}\" AS SELECT * FROM read_parquet('{literal}', hive_partitioning = true, union_by_name = true)"
+            )
+
+    def _table_stamps(self, sql):
+        stamps = {}
+        for name, pattern in self.config["tables"].items():
+            if f'"{name}"' in sql:
+                files = sorted(glob.glob(pattern, recursive=True))
+                stamps[name] = [[f, os.path.getsize(f), os.stat(f).st_mtime_ns] for f in files]
+        return stamps
+
+    def cache_path(self, sql):
+        key = json.dumps({"sql": sql, "tables": self._table_stamps(sql)}, sort_keys=True)
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()[:20]
+        return os.path.join(self.config["cache_dir"], f"{digest}.parquet")
+
+    def query(self, sql, use_cache=None):
+        """Run one BigQuery-dialect statement and return the result as a DataFrame."""
+        use_cache = self.use_cache if use_cache is None else use_cache
+        sql = translate(sql)
+        missing = [name for name in self.missing if f'"{name}"' in sql]
+        if missing:
+            raise FileNotFoundError(f"No parquet files for {', '.join(missing)}; check {DEFAULT_CONFIG} or --config")
+        path = self.cache_path(sql)
+        if use_cache and os.path.exists(path):
+            return pd.read_parquet(path)
+
+        os.makedirs(self.config["cache_dir"], exist_ok=True)
+        tmp_path = path + ".tmp"
+        literal = tmp_path.replace("'", "''")
+        self.con.execute(f"COPY ({sql}) TO '{literal}' (FORMAT PARQUET)")
+        os.replace(tmp_path, path)
+        return pd.read_parquet(path)
+
+    def run_file(self, sql_path, use_cache=None):
+        with open(sql_path, 'r') as f:
+            return [self.query(statement, use_cache) for statement in split_statements(f.read())]
+
+
+_ENGINE = None
+
+
+def get_engine(config_path=DEFAULT_CONFIG):
+    global _ENGINE
+    if _ENGINE is None:
+        _ENGINE = LocalSQL(config_path)
+    return _ENGINE
+
+
+def figure_sql_files(figure):
+    figure_dir = os.path.join(FIGURES_DIR, figure)
+    return sorted(glob.glob(os.path.join(figure_dir, "*.sql")))
+
+
+def figure_frame(figure, statement=0, sql_file=None):
+    """Result of a figure's SQL (statement `statement` of sql_file, default its first .sql file), run locally and cached."""
+    files = [os.path.join(FIGURES_DIR, figure, sql_file)] if sql_file else figure_sql_files(figure)
+    if not files or not os.path.exists(files[0]):
+        raise FileNotFoundError(f"No {sql_file or '.sql file'} in {os.path.join(FIGURES_DIR, figure)}")
+    with open(files[0], 'r') as f:
+        statements = split_statements(f.read())
+    return get_engine().query(statements[statement])
+
+
+def _figure_key(name):
+    digits = re.sub(r"\D", "", name)
+    return int(digits) if digits else 0
+
+
+def run_all(output_dir=None, use_cache=True, only=None):
+    """Rerun every code.py (or those of `only`) headlessly, saving its figures as PNG; query-only figures get their results as CSV.
+
+    code.py scripts load their own queries with `from local_sql import figure_frame`, which this runner makes
+    importable, so only what they use is materialized.
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    # code.py scripts import this module by name, whether it was started as a script or imported
+    sys.modules.setdefault("local_sql", sys.modules[__name__])
+    engine = get_engine()
+    engine.use_cache = use_cache
+    output_dir = output_dir or engine.config["output_dir"]
+    os.makedirs(output_dir, exist_ok=True)
+
+    figures = sorted((d for d in os.listdir(FIGURES_DIR) if d.startswith("figure") and os.path.isdir(os.path.join(FIGURES_DIR, d))),
+                     key=_figure_key)
+    if only:
+        unknown = sorted(set(only) - set(figures))
+        if unknown:
+            raise ValueError(f"Unknown figure(s): {', '.join(unknown)}")
+        figures = [figure for figure in figures if figure in only]
+    show = plt.show
+    plt.show = lambda *args, **kwargs: None
+    try:
+        for figure in figures:
+            figure_dir = os.path.join(FIGURES_DIR, figure)
+            sql_files = figure_sql_files(figure)
+            code_path = os.path.join(figure_dir, "code.py")
+            if not sql_files:
+                continue
+            try:
+                if not os.path.exists(code_path):
+                    # Query-only figures: keep the result tables next to the rendered ones
+                    results = [frame for path in sql_files for frame in engine.run_file(path, use_cache)]
+                    for i, frame in enumerate(results):
+                        frame.to_csv(os.path.join(output_dir, f"{figure}_{i + 1}.csv"), index=False)
+                    print(f"{figure}: {len(results)} result table(s)")
+                    continue
+
+                plt.close("all")
+                runpy.run_path(code_path, run_name="__main__")
+                saved = []
+                for i, number in enumerate(plt.get_fignums()):
+                    suffix = "" if i == 0 else f"_{i + 1}"
+                    path = os.path.join(output_dir, f"{figure}{suffix}.png")
+                    plt.figure(number).savefig(path, dpi=150)
+                    saved.append(os.path.basename(path))
+                plt.close("all")
+                print(f"{figure}: {', '.join(saved) or 'no figure drawn'}")
+            except Exception as e:
+                print(f"{figure}: failed ({type(e).__name__}: {e})")
+    finally:
+        plt.show = show
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the figure queries locally with DuckDB over the parquet snapshot.")
+    parser.add_argument("sql_file", nargs="?", help="A figure .sql file to run and print")
+    parser.add_argument("--config", default=DEFAULT_CONFIG, help="Table -> parquet mapping (default: figures/tables.yaml)")
+    parser.add_argument("--all", action="store_true", help="Regenerate every figure into the output directory")
+    parser.add_argument("--figure", action="append", help="Regenerate only this figure (e.g. figure13); repeatable")
+    parser.add_argument("--output-dir", default=None)
+    parser.add_argument("--translate", action="store_true", help="Print the DuckDB translation instead of running it")
+    parser.add_argument("--no-cache", action="store_true", help="Recompute even if a cached result exists")
+    args = parser.parse_args()
+    if not args.all and not args.figure and not args.sql_file:
+        parser.error("give a .sql file, --figure or --all")
+    if not args.translate:
+        # Later figure_frame() calls (from the code.py scripts) reuse this engine
+        get_engine(args.config)
+
+    if args.all or args.figure:
+        run_all(args.output_dir, use_cache=not args.no_cache, only=None if args.all else args.figure)
+        return
+
+    with open(args.sql_file, 'r') as f:
+        statements = split_statements(f.read())
+    for statement in statements:
+        if args.translate:
+            print(translate(statement) + ";\n")
+        else:
+            with pd.option_context("display.max_columns", None, "display.width", 200):
+                print(get_engine().query(statement, use_cache=not args.no_cache))
+
+
+if __name__ == "__main__":
+    main()
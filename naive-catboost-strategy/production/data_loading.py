@@ -0,0 +1,191 @@
+import os
+import resource
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+
+# Columns with a known range get a fixed compact type; other integer columns are sized from parquet statistics
+FIXED_DTYPES = {"ipv4": np.uint32, "port": np.uint16}
+
+# Every class keeps at least this many rows (or all of its rows) when a split is subsampled
+MIN_ROWS_PER_CLASS = 50
+
+# CatBoost copies the features to float32 and then quantizes them to one byte each
+POOL_BYTES_PER_FEATURE = 4 + 1
+LABEL_BYTES = 8
+
+
+def rss_mb():
+    """Current resident set size of this process in MB (peak RSS where /proc is not available)."""
+    try:
+        with open("/proc/self/statm", 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+    except (OSError, ValueError, IndexError):
+        # ru_maxrss is KiB on Linux, bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1024 ** 2 if os.uname().sysname == "Darwin" else peak / 1024
+
+
+def resolve_budget_mb(value):
+    """memory_budget_mb from the config: a number of MB, "auto" (half the physical memory) or null (no limit)."""
+    if value in (None, "", "none"):
+        return None
+    if value == "auto":
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / 1024 ** 2 / 2
+    return float(value)
+
+
+def _integer_dtype(low, high):
+    for dtype in (np.uint8, np.uint16, np.uint32) if low >= 0 else (np.int8, np.int16, np.int32):
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return dtype
+    return np.int64
+
+
+def compact_dtypes(path, columns):
+    """Smallest numpy dtype per column from the parquet row-group min/max statistics."""
+    parquet_file = pq.ParquetFile(path)
+    schema = parquet_file.schema_arrow
+    metadata = parquet_file.metadata
+    dtypes = {}
+    for name in columns:
+        field_type = schema.field(name).type
+        if name in FIXED_DTYPES:
+            dtypes[name] = FIXED_DTYPES[name]
+        elif str(field_type).startswith(("int", "uint")):
+            j = schema.get_field_index(name)
+            stats = [metadata.row_group(i).column(j).statistics for i in range(metadata.num_row_groups)]
+            if stats and all(s is not None and s.has_min_max for s in stats):
+                dtypes[name] = _integer_dtype(min(s.min for s in stats), max(s.max for s in stats))
+            else:
+                dtypes[name] = np.int32
+        elif str(field_type) in ("double", "float"):
+            dtypes[name] = np.float32
+    return dtypes
+
+
+def _nullable_dtype(dtype):
+    """Float type that holds every value of dtype exactly: float32 has a 24-bit mantissa, so only up to 16-bit integers."""
+    dtype = np.dtype(dtype)
+    if dtype.kind == "f" or dtype.itemsize <= 2:
+        return np.float32
+    return np.float64
+
+
+def _downcast(frame, dtypes):
+    for name, dtype in dtypes.items():
+        column = frame[name]
+        if column.isna().any():
+            # Compact types cannot hold nulls; CatBoost treats NaN as missing
+            frame[name] = column.astype(_nullable_dtype(dtype))
+        else:
+            frame[name] = column.to_numpy().astype(dtype, copy=False)
+    return frame
+
+
+def bytes_per_row(dtypes, n_features):
+    """Estimated peak bytes per row while building a Pool: compact frame + float32 copy + quantized features."""
+    compact = sum(np.dtype(dtype).itemsize for dtype in dtypes.values())
+    return compact + n_features * POOL_BYTES_PER_FEATURE + LABEL_BYTES
+
+
+def sample_fraction(paths, columns, n_features, memory_budget_mb, log=print):
+    """Fraction of rows (<= 1) that fits the budget when every path is loaded with the same fraction."""
+    if memory_budget_mb is None:
+        return 1.0
+    total = 0
+    for path in paths:
+        rows = pq.ParquetFile(path).metadata.num_rows
+        total += rows * bytes_per_row(compact_dtypes(path, columns), n_features)
+    # Memory the process already holds counts against the budget too
+    available = max(memory_budget_mb - rss_mb(), 0) * 1024 ** 2
+    if available == 0:
+        log(f"Memory budget of {memory_budget_mb:.0f} MB is already used by the process ({rss_mb():.0f} MB RSS); "
+            f"keeping only the per-class minimum of {MIN_ROWS_PER_CLASS} rows")
+    return min(1.0, available / max(total, 1))
+
+
+def class_sample_rates(label_counts, fraction, min_rows=MIN_ROWS_PER_CLASS):
+    """Per-class keep probability for a stratified sample of about `fraction` of the rows.
+
+    Classes keep their share of the data, except that small classes keep min(count, min_rows) rows
+    so rare services are not sampled away.
+    """
+    counts = label_counts.astype(np.float64)
+    wanted = np.maximum(np.ceil(counts * fraction), np.minimum(counts, min_rows))
+    return pd.Series(np.minimum(wanted / counts, 1.0), index=label_counts.index)
+
+
+def stratified_indices(labels, fraction, seed=42):
+    """Sorted row indices of a stratified `fraction` of labels; every label keeps at least one row.
+
+    Rows are ranked per label by one seeded random key, so with the same seed a smaller fraction is a
+    subset of a larger one.
+    """
+    codes, uniques = pd.factorize(np.asarray(labels))
+    keys = np.random.default_rng(seed).random(len(codes))
+    order = np.lexsort((keys, codes))
+    counts = np.bincount(codes, minlength=len(uniques))
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    rank = np.empty(len(codes), dtype=np.int64)
+    rank[order] = np.arange(len(codes)) - np.repeat(starts, counts)
+    keep = rank < np.maximum(np.ceil(counts * fraction), 1)[codes]
+    return np.flatnonzero(keep)
+
+
+def load_split(path, columns, label_col, fraction=1.0, batch_size=500_000, seed=42, log=print):
+    """DataFrame of `columns` from one parquet split, read in row batches and downcast to compact dtypes.
+
+    With fraction < 1, a stratified subsample is drawn in two passes: label counts first, then each
+    batch keeps its rows with the per-class rate, so the full split is never in memory.
+    """
+    columns = list(dict.fromkeys(list(columns) + [label_col]))
+    dtypes = compact_dtypes(path, columns)
+    parquet_file = pq.ParquetFile(path)
+    start_rss = rss_mb()
+
+    rates = None
+    if fraction < 1.0:
+        label_counts = pd.Series(dtype=np.float64)
+        for batch in parquet_file.iter_batches(batch_size=batch_size, columns=[label_col]):
+            counts = pd.Series(batch.column(0).to_numpy(zero_copy_only=False)).value_counts()
+            label_counts = label_counts.add(counts, fill_value=0)
+        rates = class_sample_rates(label_counts, fraction)
+
+    rng = np.random.default_rng(seed)
+    parts = []
+    for batch in parquet_file.iter_batches(batch_size=batch_size, columns=columns):
+        frame = _downcast(batch.to_pandas(), dtypes)
+        if rates is not None:
+            keep = rng.random(len(frame)) < rates.reindex(frame[label_col].to_numpy()).to_numpy()
+            frame = frame[keep]
+        parts.append(frame)
+    df = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=columns)
+    del parts
+
+    sample_note = f" (stratified {fraction:.1%} sample)" if rates is not None else ""
+    log(f"Loaded {os.path.basename(path)}: {len(df)}/{parquet_file.metadata.num_rows} rows{sample_note}, "
+        f"{df.memory_usage(deep=True).sum() / 1024 ** 2:.1f} MB in memory, "
+        f"process RSS {start_rss:.0f} -> {rss_mb():.0f} MB")
+    return df
+
+
+def load_dataset(path, feature_cols, label_col, memory_budget_mb=None, seed=42, log=print):
+    """X, y for one split within memory_budget_mb (stratified subsample when the whole split would not fit)."""
+    columns = list(feature_cols) + [label_col]
+    fraction = sample_fraction([path], columns, len(feature_cols), resolve_budget_mb(memory_budget_mb))
+    df = load_split(path, feature_cols, label_col, fraction, seed=seed, log=log)
+    return df[list(feature_cols)], df[label_col]
+
+
+def resolve_task_type(task_type, log=print):
+    """task_type for CatBoost, falling back from GPU to CPU on machines without a CUDA device."""
+    if task_type != "GPU":
+        return task_type or "CPU"
+    from catboost.utils import get_gpu_device_count
+    if get_gpu_device_count() == 0:
+        log("No GPU found, training on CPU instead")
+        return "CPU"
+    return task_type
@@ -0,0 +1,159 @@
+import os
+import glob
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+import yaml
+from catboost import Pool
+from data_loading import load_split, sample_fraction, resolve_budget_mb
+
+
+DEFAULT_CACHE_DIR = "cache/pools"
+DEFAULT_BORDER_COUNT = 254
+DEFAULT_SAMPLE_SEED = 42
+
+
+def load_config(yaml_path="config.yaml"):
+    with open(yaml_path, 'r') as f:
+        return yaml.safe_load(f)
+
+
+def file_digest(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def host_feature_columns(config):
+    """Feature store columns added to the features, or [] when no host_feature_store is configured."""
+    if not config.get('host_feature_store'):
+        return []
+    return list(config.get('host_feature_columns') or [])
+
+
+def read_host_features(store_dir, columns):
+    """Per-host aggregates from the bucket-model feature store (bucket-model/feature_store.py), indexed by ipv4."""
+    files = sorted(glob.glob(os.path.join(store_dir, "partition=*", "*.parquet")))
+    if not files:
+        raise FileNotFoundError(f"No feature store partitions in {store_dir}")
+    df = pd.concat([pd.read_parquet(f, columns=["ipv4"] + list(columns)) for f in files], ignore_index=True)
+    return df.set_index(df["ipv4"].astype(np.int64)).drop(columns="ipv4")
+
+
+def join_host_features(X, ipv4, host_features):
+    """X with the host feature columns looked up by address; hosts missing from the store get NaN."""
+    addresses = pd.to_numeric(pd.Series(ipv4), errors="coerce").astype("Int64")
+    joined = host_features.reindex(addresses.to_numpy(dtype=np.int64, na_value=-1))
+    return pd.concat([X, joined.set_axis(X.index)], axis=1)
+
+
+def cache_key(config, border_count):
+    """Hash of the train/val file contents, feature/label columns and quantization settings."""
+    key = {
+        "train": file_digest(config['train_path']),
+        "val": file_digest(config['val_path']),
+        "features": list(config['feature_columns']),
+        "label": config['label_column'],
+        "border_count": border_count,
+    }
+    if config.get('memory_budget_mb') is not None:
+        # A different budget can mean a different subsample
+        key["memory_budget_mb"] = config['memory_budget_mb']
+        key["sample_seed"] = config.get('sample_seed', DEFAULT_SAMPLE_SEED)
+    host_cols = host_feature_columns(config)
+    if host_cols:
+        # The store manifest changes with every snapshot update
+        key["host_features"] = host_cols
+        key["host_feature_store"] = file_digest(os.path.join(config['host_feature_store'], "manifest.json"))
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def _split_columns(feature_cols, label_col, host_features=None):
+    extra = ["ipv4"] if host_features is not None else []
+    return list(dict.fromkeys(list(feature_cols) + extra + [label_col]))
+
+
+def _read_split(path, feature_cols, label_col, host_features=None, fraction=1.0, seed=DEFAULT_SAMPLE_SEED):
+    df = load_split(path, _split_columns(feature_cols, label_col, host_features), label_col, fraction, seed=seed)
+    X = df[feature_cols]
+    if host_features is not None:
+        X = join_host_features(X, df["ipv4"], host_features)
+    return X, df[label_col]
+
+
+def build_pools(config, cache_path, border_count=DEFAULT_BORDER_COUNT):
+    feature_cols, label_col = config['feature_columns'], config['label_column']
+    host_cols = host_feature_columns(config)
+    host_features = read_host_features(config['host_feature_store'], host_cols) if host_cols else None
+
+    # Train and validation are subsampled with the same fraction when both would not fit memory_budget_mb
+    budget = resolve_budget_mb(config.get('memory_budget_mb'))
+    seed = config.get('sample_seed', DEFAULT_SAMPLE_SEED)
+    fraction = sample_fraction([config['train_path'], config['val_path']],
+                               _split_columns(feature_cols, label_col, host_features),
+                               len(feature_cols) + len(host_cols), budget)
+    if budget is not None:
+        print(f"Memory budget {budget:.0f} MB: loading {fraction:.1%} of the rows")
+    X_train, y_train = _read_split(config['train_path'], feature_cols, label_col, host_features, fraction, seed)
+    X_val, y_val = _read_split(config['val_path'], feature_cols, label_col, host_features, fraction, seed + 1)
+
+    # Validation rows whose label never appears in training cannot be scored by a MultiClass model
+    valid_mask = y_val.isin(y_train.unique())
+    X_val, y_val = X_val[valid_mask], y_val[valid_mask]
+
+    os.makedirs(cache_path, exist_ok=True)
+    borders_path = os.path.join(cache_path, "borders.tsv")
+
+    train_pool = Pool(X_train, label=y_train)
+    train_pool.quantize(border_count=border_count)
+    train_pool.save_quantization_borders(borders_path)
+    train_pool.save(os.path.join(cache_path, "train.quantized"))
+    del train_pool
+
+    # Validation uses the training borders so both pools share one quantization
+    val_pool = Pool(X_val, label=y_val)
+    val_pool.quantize(input_borders=borders_path)
+    val_pool.save(os.path.join(cache_path, "val.quantized"))
+    np.save(os.path.join(cache_path, "y_val.npy"), y_val.to_numpy())
+
+    with open(os.path.join(cache_path, "meta.json"), 'w') as f:
+        json.dump({
+            "train_path": config['train_path'],
+            "val_path": config['val_path'],
+            "feature_columns": list(X_train.columns),
+            "label_column": label_col,
+            "border_count": border_count,
+            "sample_fraction": fraction,
+            "train_rows": int(len(X_train)),
+            "val_rows": int(len(X_val)),
+            "val_rows_dropped": int((~valid_mask).sum()),
+        }, f, indent=2)
+
+
+def prepare_pools(config, rebuild=False):
+    """Return the cache directory for this config, building the quantized pools first if needed."""
+    border_count = config.get('border_count', DEFAULT_BORDER_COUNT)
+    cache_dir = config.get('pool_cache_dir', DEFAULT_CACHE_DIR)
+    cache_path = os.path.join(cache_dir, cache_key(config, border_count))
+
+    if rebuild or not os.path.exists(os.path.join(cache_path, "meta.json")):
+        print(f"Building quantized pools in {cache_path}...")
+        build_pools(config, cache_path, border_count)
+    return cache_path
+
+
+def load_pools(config, rebuild=False):
+    """Quantized (train_pool, val_pool, y_val) for the datasets in config, from the on-disk cache."""
+    cache_path = prepare_pools(config, rebuild)
+    train_pool = Pool("quantized://" + os.path.join(cache_path, "train.quantized"))
+    val_pool = Pool("quantized://" + os.path.join(cache_path, "val.quantized"))
+    y_val = np.load(os.path.join(cache_path, "y_val.npy"), allow_pickle=True)
+    return train_pool, val_pool, y_val
+
+
+if __name__ == "__main__":
+    config = load_config("config.yaml")
+    print(f"Quantized pools ready in {prepare_pools(config, rebuild=True)}")
@@ -0,0 +1,210 @@
+import os
+import json
+import time
+import numpy as np
+import pandas as pd
+
+
+ENCODINGS_DIR = "encodings"
+COMPILED_DIR = "cache/encoders"
+
+STRING_FIELDS = ["location_country_code", "whois_organization", "whois_network", "service_names"]
+PORT_FIELD = "ports"
+MAX_PORT = 65535
+
+MISSING_CODE = 0
+OTHER_CODE = 1
+
+
+def _source_files(encodings_dir, field):
+    files = [os.path.join(encodings_dir, f"{field}_mapping.json")]
+    other_path = os.path.join(encodings_dir, f"{field}_OTHER.txt")
+    if os.path.exists(other_path):
+        files.append(other_path)
+    return files
+
+
+def _source_stamp(paths):
+    # Size + mtime is enough to notice an edited mapping without hashing it on every start
+    return {os.path.basename(p): [os.path.getsize(p), os.stat(p).st_mtime_ns] for p in paths}
+
+
+def read_other_list(path):
+    with open(path, 'r', encoding="utf-8") as f:
+        return [line.rstrip("\r\n") for line in f]
+
+
+def compile_string_field(encodings_dir, field, output_dir):
+    """Sorted fixed-width UTF-8 keys and their codes; OTHER-list values map to OTHER unless the mapping has them."""
+    with open(os.path.join(encodings_dir, f"{field}_mapping.json"), 'r', encoding="utf-8") as f:
+        mapping = json.load(f)
+
+    table = {}
+    other_path = os.path.join(encodings_dir, f"{field}_OTHER.txt")
+    if os.path.exists(other_path):
+        table.update({value: OTHER_CODE for value in read_other_list(other_path)})
+    table.update(mapping)
+
+    encoded = {key.encode("utf-8"): code for key, code in table.items()}
+    width = max(1, max((len(k) for k in encoded), default=1))
+    keys = np.array(sorted(encoded), dtype=f"S{width}")
+    codes = np.array([encoded[k] for k in keys.tolist()], dtype=np.int32)
+
+    # Code -> name for decoding predictions (the mapping itself; OTHER-list values all share code 1)
+    names = np.zeros(max(mapping.values()) + 1, dtype=f"S{width}")
+    for key, code in mapping.items():
+        names[code] = key.encode("utf-8")
+
+    np.save(os.path.join(output_dir, f"{field}.keys.npy"), keys)
+    np.save(os.path.join(output_dir, f"{field}.codes.npy"), codes)
+    np.save(os.path.join(output_dir, f"{field}.names.npy"), names)
+    return {"kind": "string", "keys": int(len(keys)), "width": width}
+
+
+def compile_port_field(encodings_dir, output_dir, field=PORT_FIELD):
+    """Dense port -> code lookup array; ports absent from the mapping encode as 0."""
+    with open(os.path.join(encodings_dir, f"{field}_mapping.json"), 'r') as f:
+        mapping = json.load(f)
+    lookup = np.full(MAX_PORT + 1, MISSING_CODE, dtype=np.int32)
+    for port, code in mapping.items():
+        lookup[int(port)] = code
+    np.save(os.path.join(output_dir, f"{field}.lookup.npy"), lookup)
+    return {"kind": "port", "keys": len(mapping)}
+
+
+def compile_encoders(encodings_dir=ENCODINGS_DIR, output_dir=COMPILED_DIR):
+    """Compile every mapping (and OTHER list) in encodings_dir into .npy lookup tables plus a manifest."""
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = {"fields": {}, "sources": {}}
+    for field in STRING_FIELDS:
+        manifest["fields"][field] = compile_string_field(encodings_dir, field, output_dir)
+        manifest["sources"][field] = _source_stamp(_source_files(encodings_dir, field))
+    manifest["fields"][PORT_FIELD] = compile_port_field(encodings_dir, output_dir)
+    manifest["sources"][PORT_FIELD] = _source_stamp(_source_files(encodings_dir, PORT_FIELD))
+
+    # Manifest last, so an interrupted compile is never picked up as complete
+    tmp_path = os.path.join(output_dir, "manifest.json.tmp")
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, os.path.join(output_dir, "manifest.json"))
+    return manifest
+
+
+def _as_series(values):
+    if hasattr(values, "to_pandas"):
+        # pyarrow Array / ChunkedArray
+        return values.to_pandas()
+    return pd.Series(values) if not isinstance(values, pd.Series) else values
+
+
+class StringEncoder:
+    """Vectorized value -> code lookup over memory-mapped sorted keys.
+
+    Each distinct value in a column is looked up once (binary search); nulls encode as 0 and
+    values not in the table as OTHER.
+    """
+
+    def __init__(self, keys, codes, names):
+        self.keys = keys
+        self.codes = codes
+        self.names = names
+        self.width = keys.dtype.itemsize
+
+    def lookup(self, uniques):
+        encoded = [str(u).encode("utf-8") for u in uniques]
+        if not encoded or not len(self.keys):
+            return np.full(len(encoded), OTHER_CODE, dtype=np.int32)
+        query = np.array(encoded, dtype=self.keys.dtype)
+        pos = np.minimum(np.searchsorted(self.keys, query), len(self.keys) - 1)
+        # Values wider than the table are truncated by the cast, so they must not count as matches
+        fits = np.fromiter((len(e) <= self.width for e in encoded), dtype=bool, count=len(encoded))
+        found = fits & (self.keys[pos] == query)
+        return np.where(found, self.codes[pos], OTHER_CODE).astype(np.int32)
+
+    def encode(self, values):
+        """int32 codes for a whole column (pandas Series, numpy array, list or Arrow array)."""
+        codes, uniques = pd.factorize(_as_series(values))
+        unique_codes = self.lookup(uniques)
+        if not len(unique_codes):
+            return np.full(len(codes), MISSING_CODE, dtype=np.int32)
+        return np.where(codes < 0, MISSING_CODE, unique_codes[codes]).astype(np.int32)
+
+    def decode(self, codes):
+        """Names for codes (object array of str); codes outside the mapping decode to their number."""
+        codes = np.asarray(codes, dtype=np.int64)
+        valid = (codes >= 0) & (codes < len(self.names))
+        names = np.char.decode(self.names[np.where(valid, codes, 0)], "utf-8").astype(object)
+        names[~valid] = codes[~valid].astype(str)
+        return names
+
+
+class PortEncoder:
+    """Port -> code through a dense lookup array; missing or out-of-range ports encode as 0."""
+
+    def __init__(self, lookup):
+        self.lookup = lookup
+
+    def encode(self, values):
+        ports = pd.to_numeric(_as_series(values), errors="coerce").to_numpy(dtype=np.float64)
+        valid = np.isfinite(ports) & (ports >= 0) & (ports < len(self.lookup))
+        return np.where(valid, self.lookup[np.where(valid, ports, 0).astype(np.int64)], MISSING_CODE).astype(np.int32)
+
+
+def load_encoders(compiled_dir=COMPILED_DIR, mmap=True):
+    """{field: encoder} from a compiled directory; arrays are memory-mapped read-only, so worker processes share pages."""
+    mmap_mode = "r" if mmap else None
+    with open(os.path.join(compiled_dir, "manifest.json"), 'r') as f:
+        manifest = json.load(f)
+
+    encoders = {}
+    for field, info in manifest["fields"].items():
+        path = os.path.join(compiled_dir, field)
+        if info["kind"] == "port":
+            encoders[field] = PortEncoder(np.load(f"{path}.lookup.npy", mmap_mode=mmap_mode))
+        else:
+            encoders[field] = StringEncoder(
+                np.load(f"{path}.keys.npy", mmap_mode=mmap_mode),
+                np.load(f"{path}.codes.npy", mmap_mode=mmap_mode),
+                np.load(f"{path}.names.npy", mmap_mode=mmap_mode),
+            )
+    return encoders
+
+
+def is_stale(encodings_dir=ENCODINGS_DIR, compiled_dir=COMPILED_DIR):
+    manifest_path = os.path.join(compiled_dir, "manifest.json")
+    if not os.path.exists(manifest_path):
+        return True
+    with open(manifest_path, 'r') as f:
+        sources = json.load(f)["sources"]
+    for field in STRING_FIELDS + [PORT_FIELD]:
+        if sources.get(field) != _source_stamp(_source_files(encodings_dir, field)):
+            return True
+    return False
+
+
+def load_or_compile(encodings_dir=ENCODINGS_DIR, compiled_dir=COMPILED_DIR):
+    """Compiled encoders for encodings_dir, recompiling first when a mapping or OTHER list changed."""
+    if is_stale(encodings_dir, compiled_dir):
+        compile_encoders(encodings_dir, compiled_dir)
+    return load_encoders(compiled_dir)
+
+
+if __name__ == "__main__":
+    start = time.perf_counter()
+    manifest = compile_encoders()
+    print(f"Compiled {len(manifest['fields'])} encoders into {COMPILED_DIR} in {time.perf_counter() - start:.2f}s")
+    for field, info in manifest["fields"].items():
+        print(f"  {field}: {info}")
+
+    start = time.perf_counter()
+    encoders = load_or_compile()
+    print(f"Loaded compiled encoders in {1000 * (time.perf_counter() - start):.1f} ms")
+
+    start = time.perf_counter()
+    for field in STRING_FIELDS:
+        with open(os.path.join(ENCODINGS_DIR, f"{field}_mapping.json"), 'r', encoding="utf-8") as f:
+            json.load(f)
+        read_other_list(os.path.join(ENCODINGS_DIR, f"{field}_OTHER.txt"))
+    with open(os.path.join(ENCODINGS_DIR, f"{PORT_FIELD}_mapping.json"), 'r') as f:
+        json.load(f)
+    print(f"Parsing the JSON mappings and OTHER lists takes {1000 * (time.perf_counter() - start):.1f} ms")
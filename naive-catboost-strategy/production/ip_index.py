@@ -0,0 +1,224 @@
+import os
+import json
+import time
+import argparse
+import ipaddress
+import numpy as np
+import pandas as pd
+from encoders import ENCODINGS_DIR, COMPILED_DIR, MISSING_CODE, load_or_compile
+
+
+INDEX_DIR = "cache/ip_index"
+ARRAYS = ["starts", "ends", "prefix_lengths", "network_codes", "organization_codes"]
+
+
+def parse_ipv4(values):
+    """(uint32 addresses, valid mask) for dotted-quad strings or integers."""
+    values = pd.Series(values)
+    if pd.api.types.is_numeric_dtype(values):
+        numeric = values.to_numpy(dtype=np.float64, na_value=np.nan)
+        valid = np.isfinite(numeric) & (numeric >= 0) & (numeric < 2**32)
+        return np.where(valid, numeric, 0).astype(np.uint32), valid
+
+    octets = values.astype("string").str.split(".", expand=True)
+    if octets.shape[1] != 4:
+        return np.zeros(len(values), dtype=np.uint32), np.zeros(len(values), dtype=bool)
+    octets = octets.apply(pd.to_numeric, errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+    valid = np.all(np.isfinite(octets) & (octets >= 0) & (octets <= 255), axis=1)
+    octets = np.where(valid[:, None], octets, 0).astype(np.uint32)
+    addresses = (octets[:, 0] << 24) | (octets[:, 1] << 16) | (octets[:, 2] << 8) | octets[:, 3]
+    return addresses, valid
+
+
+def _cidr_rows(cidrs, network, organization):
+    rows = []
+    for cidr in cidrs if isinstance(cidrs, (list, tuple, np.ndarray)) else [cidrs]:
+        try:
+            net = ipaddress.ip_network(str(cidr).strip(), strict=False)
+        except ValueError:
+            continue
+        if net.version == 4:
+            rows.append((int(net.network_address), int(net.broadcast_address), net.prefixlen, network, organization))
+    return rows
+
+
+def read_prefix_dump(path):
+    """Prefix rows (start, end, prefix length, network name, organization name) from a WHOIS/prefix dump.
+
+    CSV/TSV/parquet files need a `cidr` column plus optional `network` and `organization` name columns.
+    JSONL lines can be flat the same way or Censys-style WHOIS objects ({"network": {"name", "cidrs"},
+    "organization": {"name"}}). IPv6 prefixes are skipped.
+    """
+    rows = []
+    if path.endswith(".jsonl") or path.endswith(".json"):
+        with open(path, 'r', encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                record = record.get("whois", record)
+                network, organization = record.get("network"), record.get("organization")
+                if isinstance(network, dict):
+                    cidrs = network.get("cidrs") or []
+                    network = network.get("name")
+                else:
+                    cidrs = record.get("cidr") or []
+                if isinstance(organization, dict):
+                    organization = organization.get("name")
+                rows.extend(_cidr_rows(cidrs, network, organization))
+    else:
+        if path.endswith(".parquet"):
+            df = pd.read_parquet(path)
+        else:
+            df = pd.read_csv(path, sep="\t" if path.endswith((".tsv", ".txt")) else ",", dtype=str, keep_default_na=False)
+        df = df.reindex(columns=["cidr", "network", "organization"])
+        for cidr, network, organization in df.itertuples(index=False, name=None):
+            rows.extend(_cidr_rows(cidr, network or None, organization or None))
+
+    return pd.DataFrame(rows, columns=["start", "end", "prefix_length", "network", "organization"])
+
+
+def flatten_prefixes(starts, ends):
+    """Disjoint [start, end] intervals where each address keeps the value of its most specific (longest) prefix.
+
+    CIDR blocks are either nested or disjoint, so one pass over the blocks sorted by (start, widest
+    first) with a stack of enclosing blocks is enough. Returns (starts, ends, index of the owning prefix).
+    """
+    order = np.lexsort((-(ends.astype(np.int64) - starts.astype(np.int64)), starts))
+    out_starts, out_ends, out_owner = [], [], []
+    stack = []
+    cursor = 0
+
+    def emit(lo, hi, owner):
+        if lo <= hi:
+            out_starts.append(lo)
+            out_ends.append(hi)
+            out_owner.append(owner)
+
+    for i in order.tolist():
+        start, end = int(starts[i]), int(ends[i])
+        # Close the enclosing blocks that end before this one starts
+        while stack and ends[stack[-1]] < start:
+            top = stack.pop()
+            emit(cursor, int(ends[top]), top)
+            cursor = int(ends[top]) + 1
+        if stack:
+            emit(cursor, start - 1, stack[-1])
+        cursor = start
+        stack.append(i)
+    while stack:
+        top = stack.pop()
+        emit(cursor, int(ends[top]), top)
+        cursor = int(ends[top]) + 1
+
+    return (np.array(out_starts, dtype=np.uint32), np.array(out_ends, dtype=np.uint32),
+            np.array(out_owner, dtype=np.int64))
+
+
+class IPv4Index:
+    """Longest-prefix match over sorted disjoint intervals; a lookup is one binary search per address.
+
+    Results are whois_network / whois_organization codes from the compiled encoders, so they line up
+    with the *_encoded training features; addresses outside every prefix get 0 (missing).
+    """
+
+    def __init__(self, starts, ends, prefix_lengths, network_codes, organization_codes, meta=None):
+        self.starts = starts
+        self.ends = ends
+        self.prefix_lengths = prefix_lengths
+        self.network_codes = network_codes
+        self.organization_codes = organization_codes
+        self.meta = meta or {}
+
+    def __len__(self):
+        return len(self.starts)
+
+    @classmethod
+    def build(cls, prefixes, encoders):
+        """Index from read_prefix_dump() rows, encoding names with the compiled encoders."""
+        network_codes = encoders["whois_network"].encode(prefixes["network"])
+        organization_codes = encoders["whois_organization"].encode(prefixes["organization"])
+        starts, ends, owner = flatten_prefixes(prefixes["start"].to_numpy(np.int64), prefixes["end"].to_numpy(np.int64))
+        return cls(starts, ends, prefixes["prefix_length"].to_numpy(np.uint8)[owner],
+                   network_codes[owner], organization_codes[owner],
+                   meta={"prefixes": int(len(prefixes)), "intervals": int(len(starts))})
+
+    def find(self, addresses):
+        """Interval position for every uint32 address, -1 where no prefix covers it."""
+        addresses = np.asarray(addresses, dtype=np.uint32)
+        pos = np.searchsorted(self.starts, addresses, side="right") - 1
+        hit = pos >= 0
+        hit[hit] = addresses[hit] <= self.ends[pos[hit]]
+        return np.where(hit, pos, -1)
+
+    def lookup(self, ips):
+        """(network codes, organization codes, prefix lengths) for dotted-quad strings or integer addresses."""
+        if isinstance(ips, np.ndarray) and ips.dtype == np.uint32:
+            addresses, valid = ips, np.ones(len(ips), dtype=bool)
+        else:
+            addresses, valid = parse_ipv4(ips)
+        pos = np.where(valid, self.find(addresses), -1)
+        hit = pos >= 0
+        safe = np.where(hit, pos, 0)
+        if not len(self):
+            empty = np.full(len(pos), MISSING_CODE, dtype=np.int32)
+            return empty, empty.copy(), np.zeros(len(pos), dtype=np.uint8)
+        return (np.where(hit, self.network_codes[safe], MISSING_CODE).astype(np.int32),
+                np.where(hit, self.organization_codes[safe], MISSING_CODE).astype(np.int32),
+                np.where(hit, self.prefix_lengths[safe], 0).astype(np.uint8))
+
+    def save(self, index_dir=INDEX_DIR):
+        os.makedirs(index_dir, exist_ok=True)
+        for name in ARRAYS:
+            np.save(os.path.join(index_dir, f"{name}.npy"), getattr(self, name))
+        with open(os.path.join(index_dir, "meta.json"), 'w') as f:
+            json.dump(self.meta, f, indent=2)
+
+    @classmethod
+    def load(cls, index_dir=INDEX_DIR, mmap=True):
+        arrays = {name: np.load(os.path.join(index_dir, f"{name}.npy"), mmap_mode="r" if mmap else None) for name in ARRAYS}
+        with open(os.path.join(index_dir, "meta.json"), 'r') as f:
+            meta = json.load(f)
+        return cls(meta=meta, **arrays)
+
+
+def build_index(dump_path, index_dir=INDEX_DIR, encodings_dir=ENCODINGS_DIR, compiled_dir=COMPILED_DIR):
+    prefixes = read_prefix_dump(dump_path)
+    index = IPv4Index.build(prefixes, load_or_compile(encodings_dir, compiled_dir))
+    index.meta["source"] = os.path.abspath(dump_path)
+    index.save(index_dir)
+    return index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query the IPv4 longest-prefix-match WHOIS index.")
+    parser.add_argument("--dump", help="WHOIS/prefix dump to build the index from (CSV, TSV, parquet or JSONL)")
+    parser.add_argument("--index-dir", default=INDEX_DIR)
+    parser.add_argument("--encodings-dir", default=ENCODINGS_DIR)
+    parser.add_argument("--lookup", nargs="*", default=[], help="Addresses to look up")
+    parser.add_argument("--benchmark", type=int, default=0, help="Time lookups of this many random addresses")
+    args = parser.parse_args()
+
+    if args.dump:
+        start = time.perf_counter()
+        index = build_index(args.dump, args.index_dir, args.encodings_dir)
+        print(f"Indexed {index.meta['prefixes']} prefixes as {len(index)} intervals in "
+              f"{time.perf_counter() - start:.1f}s -> {args.index_dir}")
+    else:
+        index = IPv4Index.load(args.index_dir)
+
+    if args.lookup:
+        networks, organizations, lengths = index.lookup(args.lookup)
+        for ip, net, org, length in zip(args.lookup, networks, organizations, lengths):
+            print(f"{ip}: whois_network_encoded={net} whois_organization_encoded={org} prefix=/{length}")
+
+    if args.benchmark:
+        addresses = np.random.default_rng(0).integers(0, 2**32, args.benchmark, dtype=np.uint64).astype(np.uint32)
+        start = time.perf_counter()
+        index.lookup(addresses)
+        elapsed = time.perf_counter() - start
+        print(f"{args.benchmark} lookups in {elapsed:.3f}s ({args.benchmark / elapsed / 1e6:.1f}M addresses/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+import numpy as np
+
+
+def get_top_k_predictions(proba, k):
+    """Column indices of the k highest probabilities per row, best first (argpartition, no full sort)."""
+    n_classes = proba.shape[1]
+    k = min(k, n_classes)
+    top = np.argpartition(proba, n_classes - k, axis=1)[:, n_classes - k:]
+    order = np.argsort(-np.take_along_axis(proba, top, axis=1), axis=1, kind="stable")
+    return np.take_along_axis(top, order, axis=1)
+
+
+def hit_ranks(y_true, proba, classes, k):
+    """0-based position of the true label among the top-k predicted classes, or -1 when it is not there.
+
+    Columns of proba are mapped through classes (model.classes_) before comparing with y_true.
+    """
+    top_labels = np.asarray(classes)[get_top_k_predictions(proba, k)]
+    match = top_labels == np.asarray(y_true)[:, None]
+    return np.where(match.any(axis=1), match.argmax(axis=1), -1)
+
+
+def _accumulate(totals, ranks, ks):
+    for k in ks:
+        hit = (ranks >= 0) & (ranks < k)
+        totals[k][0] += np.sum(1.0 / (ranks[hit] + 1))
+        totals[k][1] += np.count_nonzero(hit)
+
+
+def _finalize(totals, n_rows):
+    results = {}
+    for k, (precision_sum, hits) in totals.items():
+        avg_precision = precision_sum / n_rows if n_rows else 0.0
+        avg_recall = hits / n_rows if n_rows else 0.0
+        if avg_precision + avg_recall == 0:
+            f1 = 0.0
+        else:
+            f1 = 2 * (avg_precision * avg_recall) / (avg_precision + avg_recall)
+        results[k] = (avg_precision, avg_recall, f1)
+    return results
+
+
+def compute_precision_recall_f1_at_ks(y_true, y_proba, classes, ks=(1, 5, 30), chunk_size=50000):
+    """Precision/Recall/F1 @k for every k in ks from a single top-max(ks) pass over y_proba, chunk by chunk.
+
+    Precision@k credits 1 / rank of the true label when it is in the top k, Recall@k is the hit rate.
+    Returns {k: (precision, recall, f1)}.
+    """
+    y_true = np.asarray(y_true)
+    totals = {k: [0.0, 0] for k in ks}
+    for start in range(0, len(y_true), chunk_size):
+        stop = start + chunk_size
+        _accumulate(totals, hit_ranks(y_true[start:stop], y_proba[start:stop], classes, max(ks)), ks)
+    return _finalize(totals, len(y_true))
+
+
+def compute_precision_recall_f1_at_k(y_true, y_proba, k, classes):
+    return compute_precision_recall_f1_at_ks(y_true, y_proba, classes, ks=(k,))[k]
+
+
+def _row_chunk(X, start, stop):
+    if hasattr(X, "iloc"):
+        return X.iloc[start:stop]
+    # catboost.Pool (e.g. a cached quantized pool)
+    return X.slice(np.arange(start, min(stop, X.num_row())))
+
+
+def evaluate_model_at_ks(model, X, y_true, ks=(1, 5, 30), chunk_size=50000):
+    """Stream predict_proba over row chunks (DataFrame or Pool) so the full probability matrix is never materialized.
+
+    Returns ({k: (precision, recall, f1)}, top-1 predicted labels).
+    """
+    classes = np.asarray(model.classes_)
+    y_true = np.asarray(y_true)
+    totals = {k: [0.0, 0] for k in ks}
+    y_pred = np.empty(len(y_true), dtype=classes.dtype)
+
+    for start in range(0, len(y_true), chunk_size):
+        stop = start + chunk_size
+        proba = model.predict_proba(_row_chunk(X, start, stop))
+        top = get_top_k_predictions(proba, max(ks))
+        y_pred[start:stop] = classes[top[:, 0]]
+
+        match = classes[top] == y_true[start:stop, None]
+        ranks = np.where(match.any(axis=1), match.argmax(axis=1), -1)
+        _accumulate(totals, ranks, ks)
+
+    return _finalize(totals, len(y_true)), y_pred
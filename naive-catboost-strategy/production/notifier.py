@@ -0,0 +1,135 @@
+import time
+import queue
+import threading
+import traceback
+from collections import OrderedDict
+
+from text2 import send_telegram, MissingCredentialsError
+
+
+class Notifier:
+    """Background Telegram sender so training never waits on the network.
+
+    notify() only enqueues. A daemon thread coalesces pending messages with the same key (the
+    newest wins), waits out the rate limit, runs any render callback (e.g. plotting) and sends with
+    a timeout and exponential-backoff retries. A full queue drops the oldest message.
+    """
+
+    def __init__(self, send=send_telegram, max_queue=100, timeout=10.0, max_retries=3,
+                 backoff=2.0, min_interval=3.0, log=print):
+        self._send = send
+        self._queue = queue.Queue(maxsize=max_queue)
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.min_interval = min_interval
+        self._log = log
+        self._last_sent = 0.0
+        self._closed = False
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self.coalesced = 0
+
+        self._thread = threading.Thread(target=self._run, name="notifier", daemon=True)
+        self._thread.start()
+
+    def notify(self, subject, body="", image_path=None, render=None, key=None):
+        """Queue a message and return immediately.
+
+        render, if given, is called on the notifier thread and returns (body, image_path); use it
+        for anything slow such as querying the sweep log or drawing a plot.
+        """
+        if self._closed:
+            return
+        item = {"key": key or subject, "subject": subject, "body": body, "image_path": image_path, "render": render}
+        while True:
+            try:
+                self._queue.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    self._queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def close(self, timeout=30.0):
+        """Flush pending messages (up to timeout seconds) and stop the background thread."""
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _drain(self, first):
+        pending = OrderedDict()
+        stop = False
+        items = [first]
+        while True:
+            try:
+                items.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        for item in items:
+            if item is None:
+                stop = True
+                continue
+            if item["key"] in pending:
+                self.coalesced += 1
+                del pending[item["key"]]
+            pending[item["key"]] = item
+        return list(pending.values()), stop
+
+    def _deliver(self, item):
+        body, image_path = item["body"], item["image_path"]
+        if item["render"] is not None:
+            try:
+                body, image_path = item["render"]()
+            except Exception:
+                self._log(f"Notifier: render for '{item['subject']}' failed\n{traceback.format_exc(limit=3)}")
+
+        for attempt in range(self.max_retries + 1):
+            wait = self._last_sent + self.min_interval - time.time()
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                self._send(item["subject"], body, image_path, timeout=self.timeout)
+                self._last_sent = time.time()
+                self.sent += 1
+                return
+            except MissingCredentialsError as e:
+                # Missing credentials will not fix themselves; do not retry (other ValueErrors, e.g.
+                # requests' JSONDecodeError or InvalidURL, go through the retries)
+                self._log(f"Notifier: {e}")
+                break
+            except Exception as e:
+                self._last_sent = time.time()
+                if attempt < self.max_retries:
+                    time.sleep(self.backoff ** attempt)
+                else:
+                    self._log(f"Notifier: giving up on '{item['subject']}' after {attempt + 1} attempts: {e}")
+        self.failed += 1
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            # Wait out the rate limit before draining, so messages arriving meanwhile are coalesced too
+            wait = self._last_sent + self.min_interval - time.time()
+            if first is not None and wait > 0:
+                time.sleep(wait)
+            batch, stop = self._drain(first)
+            for item in batch:
+                self._deliver(item)
+            if stop:
+                return
+
@@ -0,0 +1,165 @@
+import os
+import json
+import time
+import resource
+import datetime
+import threading
+from contextlib import contextmanager
+
+
+PROFILING_DEFAULTS = {
+    "enabled": True,
+    "log_path": "results/profile.jsonl",
+    "textfile_dir": "results/metrics",
+}
+
+METRIC_PREFIX = "superhost_stage"
+
+
+def _read_status_kb(field):
+    with open("/proc/self/status", 'r') as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    raise ValueError(field)
+
+
+def reset_peak_rss():
+    """Reset the kernel's peak RSS (VmHWM) so the next reading covers one stage; False where unsupported."""
+    try:
+        with open("/proc/self/clear_refs", 'w') as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb():
+    """Peak RSS in MB since the last reset_peak_rss() (since process start where /proc is not available)."""
+    try:
+        return _read_status_kb("VmHWM") / 1024
+    except (OSError, ValueError):
+        # ru_maxrss is KiB on Linux, bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1024 ** 2 if os.uname().sysname == "Darwin" else peak / 1024
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels):
+    return ",".join(f'{name}="{_escape(value)}"' for name, value in sorted(labels.items()))
+
+
+class StageProfiler:
+    """Wall time, CPU time and peak RSS of named stages, exported as JSON lines and a Prometheus textfile.
+
+    Every stage appends one line to log_path, tagged with the stage's own labels (e.g. the trial
+    number). flush() rewrites the textfile with per-stage totals for the node_exporter textfile
+    collector; these carry only the profiler's constant labels. CPU time is process-wide, so it
+    includes CatBoost's worker threads. Stages should not be nested, except background stages.
+    """
+
+    def __init__(self, name, log_path=PROFILING_DEFAULTS["log_path"],
+                 textfile_dir=PROFILING_DEFAULTS["textfile_dir"], labels=None, enabled=True):
+        self.name = name
+        self.log_path = log_path
+        self.textfile_dir = textfile_dir
+        self.labels = {"script": name, **(labels or {})}
+        # One textfile per process, e.g. sweep_worker0.prom
+        self.textfile_name = name + "".join(f"_{key}{value}" for key, value in (labels or {}).items())
+        self.enabled = enabled
+        self.totals = {}
+        # Background stages record from other threads
+        self._lock = threading.Lock()
+        if enabled:
+            for path in (os.path.dirname(log_path), textfile_dir):
+                if path:
+                    os.makedirs(path, exist_ok=True)
+
+    @classmethod
+    def from_config(cls, config, name, labels=None):
+        settings = {**PROFILING_DEFAULTS, **(config.get("profiling") or {})}
+        return cls(name, settings["log_path"], settings["textfile_dir"], labels, settings["enabled"])
+
+    @contextmanager
+    def stage(self, stage, items=None, background=False, **labels):
+        """Measure the enclosed block.
+
+        `items` (e.g. rows scored) is exported as a throughput counter; the block can also set it
+        through the yielded dict once the count is known (e.g. trees fitted).
+        background=True is for blocks on a helper thread (e.g. the notifier) that overlap other
+        stages: CPU time is that thread's own, and peak RSS is neither reset nor recorded.
+        """
+        info = {"items": items}
+        if not self.enabled:
+            yield info
+            return
+        if not background:
+            reset_peak_rss()
+        clock = time.thread_time if background else time.process_time
+        wall, cpu = time.perf_counter(), clock()
+        try:
+            yield info
+        finally:
+            self.record(stage, time.perf_counter() - wall, clock() - cpu,
+                        None if background else peak_rss_mb(), info["items"], labels)
+
+    def record(self, stage, seconds, cpu_seconds, peak_mb, items=None, labels=None):
+        entry = {
+            "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            **self.labels,
+            **(labels or {}),
+            "pid": os.getpid(),
+            "stage": stage,
+            "seconds": round(seconds, 6),
+            "cpu_seconds": round(cpu_seconds, 6),
+        }
+        if peak_mb is not None:
+            entry["peak_rss_mb"] = round(peak_mb, 1)
+        if items is not None:
+            entry["items"] = int(items)
+        # One short write per line, so lines from concurrent workers do not interleave
+        with open(self.log_path, 'a') as f:
+            f.write(json.dumps(entry) + "\n")
+
+        with self._lock:
+            totals = self.totals.setdefault(stage, {"count": 0, "seconds": 0.0, "cpu_seconds": 0.0,
+                                                    "peak_rss_mb": 0.0, "items": 0, "last_seconds": 0.0})
+            totals["count"] += 1
+            totals["seconds"] += seconds
+            totals["cpu_seconds"] += cpu_seconds
+            totals["peak_rss_mb"] = max(totals["peak_rss_mb"], peak_mb or 0.0)
+            totals["last_seconds"] = seconds
+            totals["items"] += int(items or 0)
+
+    def render_textfile(self):
+        metrics = [
+            ("calls_total", "counter", "Completed stage runs", lambda t: t["count"]),
+            ("seconds_total", "counter", "Wall-clock seconds spent in the stage", lambda t: t["seconds"]),
+            ("cpu_seconds_total", "counter", "Process CPU seconds spent in the stage", lambda t: t["cpu_seconds"]),
+            ("items_total", "counter", "Items (rows, models) processed by the stage", lambda t: t["items"]),
+            ("last_seconds", "gauge", "Wall-clock seconds of the latest run of the stage", lambda t: t["last_seconds"]),
+            ("peak_rss_bytes", "gauge", "Highest peak RSS seen during the stage", lambda t: t["peak_rss_mb"] * 1024 ** 2),
+        ]
+        with self._lock:
+            snapshot = {stage: dict(totals) for stage, totals in self.totals.items()}
+        lines = []
+        for suffix, kind, help_text, value in metrics:
+            metric = f"{METRIC_PREFIX}_{suffix}"
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} {kind}")
+            for stage, totals in sorted(snapshot.items()):
+                lines.append(f"{metric}{{{_format_labels({**self.labels, 'stage': stage})}}} {value(totals):.10g}")
+        return "\n".join(lines) + "\n"
+
+    def flush(self):
+        """Rewrite the Prometheus textfile with the totals so far (atomically, so the collector never sees half a file)."""
+        if not self.enabled or not self.textfile_dir:
+            return
+        path = os.path.join(self.textfile_dir, f"{self.textfile_name}.prom")
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(self.render_textfile())
+        os.replace(tmp_path, path)
@@ -0,0 +1,338 @@
+import os
+import sys
+import glob
+import json
+import time
+import queue
+import argparse
+import threading
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from catboost import CatBoostClassifier
+from metrics_at_k import get_top_k_predictions
+from encoders import ENCODINGS_DIR, COMPILED_DIR, PORT_FIELD, MISSING_CODE, load_or_compile
+from ip_index import IPv4Index, parse_ipv4
+from dataset_cache import read_host_features
+
+
+MODELS_DIR = "final_models"
+
+# Raw field for every encoded feature; its lookup table is compiled from encodings/<raw field>_mapping.json
+ENCODED_FEATURES = {
+    "location_country_code_encoded": "location_country_code",
+    "whois_organization_encoded": "whois_organization",
+    "whois_network_encoded": "whois_network",
+}
+RAW_COLUMNS = ["ipv4", "port"] + list(ENCODED_FEATURES.values())
+
+
+def _get(record, *path):
+    for key in path:
+        if not isinstance(record, dict):
+            return None
+        record = record.get(key)
+    return record
+
+
+def flatten_record(record):
+    """(ipv4, port, country, organization, network) rows for one host, one row per open port.
+
+    Accepts flat records using the RAW_COLUMNS names (with "port" or a "ports" list) as well as
+    Censys host records (host_identifier.ipv4, services[].port or ports_list, location, whois).
+    """
+    ip = record.get("ipv4", record.get("ip")) or _get(record, "host_identifier", "ipv4")
+
+    if "port" in record:
+        ports = [record["port"]]
+    elif "ports" in record:
+        ports = record["ports"]
+    elif isinstance(record.get("services"), list):
+        ports = [s.get("port") for s in record["services"] if isinstance(s, dict)]
+    else:
+        ports = record.get("ports_list") or []
+    ports = sorted({int(p) for p in ports if str(p).isdigit() and 1 <= int(p) <= 65535})
+
+    country = record.get("location_country_code", _get(record, "location", "country_code"))
+    organization = record.get("whois_organization", _get(record, "whois", "organization", "name"))
+    network = record.get("whois_network", _get(record, "whois", "network", "name"))
+    return [(ip, port, country, organization, network) for port in ports]
+
+
+def records_to_frame(records):
+    rows = [row for record in records for row in flatten_record(record)]
+    return pd.DataFrame(rows, columns=["ipv4", "port", "location_country_code", "whois_organization", "whois_network"])
+
+
+# Features the IPv4 prefix index can fill in for records without WHOIS data
+INDEX_FEATURES = {"whois_network_encoded": 0, "whois_organization_encoded": 1}
+
+
+def encode_frame(raw, encoders, feature_names, ip_index=None, host_features=None):
+    """Model features in training order; already-encoded columns (e.g. processed splits) are used as they are.
+
+    With an ip_index, WHOIS codes that are missing (0) are looked up from the host address. Features
+    found in host_features (read_host_features(), indexed by ipv4) are looked up the same way.
+    """
+    features = {}
+    # Parse addresses once for both the ipv4 feature and the prefix lookups
+    addresses, valid = parse_ipv4(raw["ipv4"])
+    enriched = ip_index.lookup(addresses) if ip_index is not None else None
+    for feature in feature_names:
+        if feature == "ipv4":
+            features[feature] = np.where(valid, addresses.astype(np.float64), np.nan)
+        elif feature == "port":
+            features[feature] = encoders[PORT_FIELD].encode(raw["port"])
+        elif feature in raw.columns:
+            features[feature] = raw[feature].to_numpy()
+        elif feature in ENCODED_FEATURES:
+            features[feature] = encoders[ENCODED_FEATURES[feature]].encode(raw[ENCODED_FEATURES[feature]])
+        elif host_features is not None and feature in host_features.columns:
+            keys = np.where(valid, addresses.astype(np.int64), -1)
+            features[feature] = host_features[feature].reindex(keys).to_numpy(dtype=np.float64, na_value=np.nan)
+        else:
+            raise KeyError(f"No input column for model feature '{feature}'")
+        if enriched is not None and feature in INDEX_FEATURES:
+            codes = features[feature]
+            features[feature] = np.where(valid & (codes == MISSING_CODE), enriched[INDEX_FEATURES[feature]], codes)
+    return pd.DataFrame(features, index=raw.index)
+
+
+class HostScorer:
+    """Top-k service predictions per (host, port) from one final model, with encoders loaded once."""
+
+    def __init__(self, model_path, encodings_dir=ENCODINGS_DIR, top_k=5, thread_count=-1, compiled_dir=COMPILED_DIR,
+                 ip_index_dir=None, feature_store_dir=None):
+        self.model = CatBoostClassifier()
+        self.model.load_model(model_path)
+        self.feature_names = list(self.model.feature_names_)
+        # Memory-mapped lookup tables, compiled from encodings_dir on first use (production/encoders.py)
+        self.encoders = load_or_compile(encodings_dir, compiled_dir)
+        self.top_k = min(top_k, len(self.model.classes_))
+        self.thread_count = thread_count
+        # Optional WHOIS enrichment for scan output that only has IPs and ports (production/ip_index.py)
+        self.ip_index = IPv4Index.load(ip_index_dir) if ip_index_dir else None
+        # Per-host aggregates for models trained with host_feature_store (loaded once, indexed by ipv4)
+        host_columns = [f for f in self.feature_names if f not in ENCODED_FEATURES and f not in ("ipv4", "port")]
+        self.host_features = read_host_features(feature_store_dir, host_columns) if feature_store_dir and host_columns else None
+
+        # Labels are service_names codes
+        self._class_names = self.encoders["service_names"].decode(np.asarray(self.model.classes_))
+
+    def score_frame(self, raw):
+        """Score one chunk of raw rows (RAW_COLUMNS); returns ip, port and service_i/proba_i for i = 1..k."""
+        X = encode_frame(raw, self.encoders, self.feature_names, self.ip_index, self.host_features)
+        proba = self.model.predict_proba(X, thread_count=self.thread_count)
+        top = get_top_k_predictions(proba, self.top_k)
+        top_proba = np.take_along_axis(proba, top, axis=1).astype(np.float32)
+        names = self._class_names[top]
+
+        out = {"ip": raw["ipv4"].astype("string").to_numpy(), "port": raw["port"].to_numpy(dtype=np.int32)}
+        for i in range(self.top_k):
+            out[f"service_{i + 1}"] = names[:, i]
+            out[f"proba_{i + 1}"] = top_proba[:, i]
+        return pd.DataFrame(out)
+
+
+# Chunk iterators yield (hosts, skipped lines, raw rows); hosts is None when the input has one row per
+# (host, port) and the number of hosts is not known
+
+def iter_parquet(path, chunk_size):
+    parquet_file = pq.ParquetFile(path)
+    columns = [c for c in parquet_file.schema_arrow.names if c in RAW_COLUMNS + ["ip", "ports"] or c.endswith("_encoded")]
+    for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=columns):
+        frame = batch.to_pandas().rename(columns={"ip": "ipv4"})
+        n_hosts = None
+        if "port" not in frame.columns and "ports" in frame.columns:
+            # One row per host with a list of ports, e.g. the bucket-model superhost files
+            n_hosts = len(frame)
+            frame = frame.explode("ports").dropna(subset=["ports"]).rename(columns={"ports": "port"})
+            frame = frame.reset_index(drop=True)
+        yield n_hosts, 0, frame
+
+
+_EOF = object()
+
+
+def _read_lines(handle, max_buffered=10000):
+    """Queue filled with the lines of handle by a daemon thread, ending with _EOF."""
+    lines = queue.Queue(maxsize=max_buffered)
+
+    def read():
+        for line in handle:
+            lines.put(line)
+        lines.put(_EOF)
+
+    threading.Thread(target=read, name="line-reader", daemon=True).start()
+    return lines
+
+
+def iter_jsonl(handle, chunk_size, max_delay=None):
+    """Chunks of up to chunk_size host records; malformed lines are skipped and counted.
+
+    With max_delay, a chunk is also emitted once its first record has waited max_delay seconds,
+    so records from a slow stream are scored without waiting for the chunk to fill.
+    """
+    lines = _read_lines(handle) if max_delay is not None else None
+    source = iter(handle)
+    records, skipped, deadline = [], 0, None
+    while True:
+        if lines is None:
+            line = next(source, _EOF)
+        else:
+            try:
+                line = lines.get(timeout=None if deadline is None else max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                line = None
+        if line is _EOF:
+            break
+
+        if line is not None and line.strip():
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                record = None
+            if isinstance(record, dict):
+                records.append(record)
+                if deadline is None and max_delay is not None:
+                    deadline = time.monotonic() + max_delay
+            else:
+                skipped += 1
+
+        # line is None: max_delay passed with records pending
+        if records and (len(records) >= chunk_size or line is None):
+            yield len(records), skipped, records_to_frame(records)
+            records, skipped, deadline = [], 0, None
+    if records or skipped:
+        yield len(records), skipped, records_to_frame(records)
+
+
+class PredictionWriter:
+    """Appends scored chunks to a parquet file (one row group per chunk) or as JSON lines to stdout."""
+
+    def __init__(self, path):
+        self.path = path
+        self._writer = None
+
+    def write(self, frame):
+        if self.path == "-":
+            sys.stdout.write(frame.to_json(orient="records", lines=True))
+            sys.stdout.flush()
+            return
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+        if self._writer is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._writer = pq.ParquetWriter(self.path, table.schema)
+        self._writer.write_table(table)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+def best_model(models_dir=MODELS_DIR):
+    """Model with the best validation F1 in train_top_k_configs' manifest.json; raises when the choice is ambiguous."""
+    manifest_path = os.path.join(models_dir, "manifest.json")
+    if not os.path.exists(manifest_path):
+        models = glob.glob(os.path.join(models_dir, "*.cbm"))
+        if len(models) == 1:
+            return models[0]
+        raise FileNotFoundError(f"No manifest.json and {len(models)} .cbm models in {models_dir}; pass --model")
+    with open(manifest_path, 'r') as f:
+        manifest = json.load(f)
+
+    # Paths are recorded relative to the training run's working directory
+    entries = [(entry["f1"], os.path.join(models_dir, os.path.basename(entry["model_path"])))
+               for entry in manifest.values()]
+    entries = sorted((entry for entry in entries if os.path.exists(entry[1])), reverse=True)
+    if not entries:
+        raise FileNotFoundError(f"No model listed in {manifest_path} exists; pass --model")
+    best = [path for f1, path in entries if f1 == entries[0][0]]
+    if len(best) > 1:
+        raise ValueError(f"{len(best)} models share the best F1 {entries[0][0]:.4f} ({', '.join(sorted(best))}); pass --model")
+    return best[0]
+
+
+def throughput(stats):
+    """One-line summary of score() stats; hosts are only reported when the input counts them."""
+    seconds = max(stats["scoring_seconds"], 1e-9)
+    parts = [f"{stats['rows']} host/port rows ({stats['rows'] / seconds:.0f} rows/s)"]
+    if stats["hosts"] is not None:
+        parts.append(f"{stats['hosts']} hosts ({stats['hosts'] / seconds:.0f} hosts/s)")
+    if stats["skipped_lines"]:
+        parts.append(f"{stats['skipped_lines']} malformed lines skipped")
+    return ", ".join(parts)
+
+
+def score(scorer, chunks, writer, log=print):
+    """Score every chunk and write it out; returns hosts, rows, skipped lines and throughput of the run."""
+    stats = {"hosts": 0, "rows": 0, "skipped_lines": 0, "scoring_seconds": 0.0}
+    start = time.perf_counter()
+    for n_hosts, n_skipped, raw in chunks:
+        stats["skipped_lines"] += n_skipped
+        if n_hosts is None or stats["hosts"] is None:
+            stats["hosts"] = None
+        else:
+            stats["hosts"] += n_hosts
+        if raw.empty:
+            continue
+        t = time.perf_counter()
+        predictions = scorer.score_frame(raw)
+        stats["scoring_seconds"] += time.perf_counter() - t
+        writer.write(predictions)
+        stats["rows"] += len(predictions)
+        log(throughput(stats))
+    stats["wall_seconds"] = time.perf_counter() - start
+    seconds = max(stats["scoring_seconds"], 1e-9)
+    stats["rows_per_second"] = stats["rows"] / seconds
+    stats["hosts_per_second"] = stats["hosts"] / seconds if stats["hosts"] is not None else None
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score hosts with a final CatBoost model (top-k services per open port).")
+    parser.add_argument("--input", "-i", default="-", help="Parquet or JSONL file of hosts; '-' reads JSON lines from stdin")
+    parser.add_argument("--output", "-o", default="-", help="Output parquet path; '-' writes JSON lines to stdout")
+    parser.add_argument("--model", "-m", default=None, help=f"CatBoost .cbm model (default: best validation F1 in {MODELS_DIR}/manifest.json)")
+    parser.add_argument("--encodings-dir", default=ENCODINGS_DIR)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--chunk-size", type=int, default=50000, help="Host records per chunk (bounds memory)")
+    parser.add_argument("--max-delay", type=float, default=1.0,
+                        help="stdin only: seconds a record may wait for its chunk to fill before the chunk is scored")
+    parser.add_argument("--threads", type=int, default=-1, help="CatBoost prediction threads")
+    parser.add_argument("--ip-index", default=None, help="IPv4 prefix index directory; fills missing WHOIS network/organization")
+    parser.add_argument("--feature-store", default=None, help="bucket-model feature store directory, for models trained with host features")
+    args = parser.parse_args()
+
+    if args.input == "-" and args.chunk_size == parser.get_default("chunk_size"):
+        # Streaming: small chunks so predictions are emitted soon after records arrive
+        args.chunk_size = 1000
+
+    # Progress goes to stderr so stdout can carry predictions
+    def log(message):
+        print(message, file=sys.stderr)
+
+    model_path = args.model or best_model()
+    load_start = time.perf_counter()
+    scorer = HostScorer(model_path, args.encodings_dir, args.top_k, args.threads, ip_index_dir=args.ip_index,
+                        feature_store_dir=args.feature_store)
+    log(f"Loaded {model_path} and encoders in {time.perf_counter() - load_start:.2f}s")
+
+    writer = PredictionWriter(args.output)
+    try:
+        if args.input == "-":
+            stats = score(scorer, iter_jsonl(sys.stdin, args.chunk_size, args.max_delay), writer, log=log)
+        elif args.input.endswith(".parquet"):
+            stats = score(scorer, iter_parquet(args.input, args.chunk_size), writer, log=log)
+        else:
+            with open(args.input, 'r') as handle:
+                stats = score(scorer, iter_jsonl(handle, args.chunk_size), writer, log=log)
+    finally:
+        writer.close()
+
+    log(f"Scored in {stats['wall_seconds']:.1f}s on CPU: {throughput(stats)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+import os
+import sqlite3
+from contextlib import closing
+import pandas as pd
+
+
+DEFAULT_LOG_PATH = "results/sweep_log.db"
+LEGACY_CSV_PATH = "results/sweep_log.csv"
+
+# Columns of the legacy CSV; fidelity was added later and defaults to full data
+COLUMNS = ["trial", "config_hash", "score", "accuracy", "f1", "log_loss", "duration", "timestamp"]
+LOG_COLUMNS = COLUMNS + ["fidelity"]
+
+FULL_FIDELITY = 1.0
+
+TABLE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS trials (
+    trial INTEGER,
+    config_hash TEXT NOT NULL,
+    score REAL,
+    accuracy REAL,
+    f1 REAL,
+    log_loss REAL,
+    duration REAL,
+    timestamp TEXT,
+    fidelity REAL NOT NULL DEFAULT 1.0
+);
+"""
+
+# A configuration is logged once per fidelity (fraction of the training data it was trained on)
+INDEX_SCHEMA = """
+CREATE UNIQUE INDEX IF NOT EXISTS idx_trials_config_fidelity ON trials (config_hash, fidelity);
+CREATE INDEX IF NOT EXISTS idx_trials_score ON trials (score);
+CREATE INDEX IF NOT EXISTS idx_trials_timestamp ON trials (timestamp);
+"""
+
+
+def _normalize_timestamp(value):
+    # Older CSV rows mix "%y-%m-%d" and "%Y-%m-%d"; store everything as "%Y-%m-%d %H:%M:%S" so it sorts as text
+    for fmt in ("%y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M:%S"):
+        try:
+            return pd.to_datetime(value, format=fmt).strftime("%Y-%m-%d %H:%M:%S")
+        except (ValueError, TypeError):
+            continue
+    return str(value)
+
+
+def open_log(path=DEFAULT_LOG_PATH, legacy_csv=LEGACY_CSV_PATH):
+    """Open (and create if needed) the append-only trial log, importing the legacy CSV on first use."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    is_new = not os.path.exists(path)
+
+    # WAL lets several sweep workers append while others read; wait instead of failing on a busy lock
+    conn = sqlite3.connect(path, timeout=60)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(TABLE_SCHEMA)
+    _migrate(conn)
+    conn.executescript(INDEX_SCHEMA)
+
+    if is_new and legacy_csv and os.path.exists(legacy_csv):
+        legacy = pd.read_csv(legacy_csv)
+        legacy["timestamp"] = legacy["timestamp"].map(_normalize_timestamp)
+        # CSVs written by export_csv carry the fidelity; older ones are all full-data trials
+        columns = LOG_COLUMNS if "fidelity" in legacy.columns else COLUMNS
+        with conn:
+            conn.executemany(
+                f"INSERT OR IGNORE INTO trials ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                legacy[columns].itertuples(index=False, name=None),
+            )
+    return conn
+
+
+def _migrate(conn):
+    """Add the fidelity column to logs created before multi-fidelity sweeps; their trials all ran on full data."""
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(trials)")]
+    if "fidelity" in columns:
+        return
+    with conn:
+        conn.execute(f"ALTER TABLE trials ADD COLUMN fidelity REAL NOT NULL DEFAULT {FULL_FIDELITY}")
+        # The old index allowed one row per config_hash, which would block logging other fidelities
+        conn.execute("DROP INDEX IF EXISTS idx_trials_config_hash")
+
+
+def has_config(conn, config_hash, fidelity=FULL_FIDELITY):
+    return conn.execute(
+        "SELECT 1 FROM trials WHERE config_hash = ? AND fidelity = ? LIMIT 1", (config_hash, fidelity)
+    ).fetchone() is not None
+
+
+def append_trial(conn, trial, config_hash, score, accuracy, f1, log_loss, duration, timestamp, fidelity=FULL_FIDELITY):
+    """Insert one finished trial; returns False if the config was already logged at this fidelity (e.g. by another worker)."""
+    with conn:
+        cur = conn.execute(
+            f"INSERT OR IGNORE INTO trials ({', '.join(LOG_COLUMNS)}) VALUES ({', '.join('?' * len(LOG_COLUMNS))})",
+            (trial, config_hash, score, accuracy, f1, log_loss, duration, timestamp, fidelity),
+        )
+    return cur.rowcount == 1
+
+
+def top_k(conn, k, fidelity=FULL_FIDELITY):
+    """Best k trials by score at one fidelity (full data by default).
+
+    `rank_id` is the trial's row number in the log (1-based, as in the old CSV index + 1).
+    """
+    return pd.read_sql_query(
+        f"SELECT rowid AS rank_id, {', '.join(LOG_COLUMNS)} FROM trials WHERE fidelity = ? ORDER BY score DESC LIMIT ?",
+        conn, params=(fidelity, k),
+    )
+
+
+def recent_trials(conn, since, fidelity=FULL_FIDELITY):
+    """Trials at one fidelity logged at or after `since` (datetime), oldest first."""
+    df = pd.read_sql_query(
+        "SELECT trial, score, timestamp FROM trials WHERE timestamp >= ? AND fidelity = ? ORDER BY timestamp",
+        conn, params=(since.strftime("%Y-%m-%d %H:%M:%S"), fidelity),
+    )
+    df["timestamp"] = pd.to_datetime(df["timestamp"], format="%Y-%m-%d %H:%M:%S")
+    return df
+
+
+def export_csv(conn, path=LEGACY_CSV_PATH):
+    pd.read_sql_query(f"SELECT {', '.join(LOG_COLUMNS)} FROM trials ORDER BY rowid", conn).to_csv(path, index=False)
+
+
+if __name__ == "__main__":
+    with closing(open_log()) as conn:
+        print(top_k(conn, 10).to_string(index=False))
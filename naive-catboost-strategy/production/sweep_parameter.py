@@ -4,13 +4,18 @@ import yaml
 import time
 import traceback
 import datetime
+import multiprocessing as mp
+import numpy as np
 import pandas as pd
 import optuna
 from catboost import CatBoostClassifier
 from sklearn.metrics import accuracy_score, f1_score, log_loss
-from sklearn.model_selection import train_test_split
-from text2 import send_telegram as sendText
-import matplotlib.pyplot as plt
+from notifier import Notifier
+from profiling import StageProfiler
+from data_loading import resolve_task_type, stratified_indices
+from dataset_cache import prepare_pools, load_pools
+from sweep_log import open_log, has_config, append_trial, recent_trials, FULL_FIDELITY
+from matplotlib.figure import Figure
 
 
 def load_config(yaml_path="config.yaml"):
@@ -18,19 +23,16 @@ def load_config(yaml_path="config.yaml"):
         return yaml.safe_load(f)
 
 
-def load_dataset(path, feature_cols, label_col):
-    df = pd.read_parquet(path)
-    X = df[feature_cols]
-    y = df[label_col]
-    return X, y
-
-
-def score_model(model, X_val, y_val):
-    y_pred = model.predict(X_val)
-    y_proba = model.predict_proba(X_val)
-    acc = accuracy_score(y_val, y_pred)
-    f1 = f1_score(y_val, y_pred, average="weighted")
-    loss = log_loss(y_val, y_proba, labels=list(range(y_proba.shape[1])))
+def score_model(model, X_val, y_val, profiler=None, **labels):
+    profiler = profiler or StageProfiler("score_model", enabled=False)
+    with profiler.stage("predict", items=len(y_val), **labels):
+        y_pred = model.predict(X_val)
+        y_proba = model.predict_proba(X_val)
+    with profiler.stage("metrics", items=len(y_val), **labels):
+        acc = accuracy_score(y_val, y_pred)
+        f1 = f1_score(y_val, y_pred, average="weighted")
+        # Columns of y_proba follow model.classes_, which need not be 0..n_classes-1
+        loss = log_loss(y_val, y_proba, labels=model.classes_)
     return acc, f1, loss
 
 
@@ -39,25 +41,246 @@ def score_function(acc, f1, loss, duration, iterations):
     return 0.4 * acc + 0.4 * f1 - 0.1 * loss + 0.1 * (efficiency / 1000)
 
 
+SWEEP_DEFAULTS = {
+    "workers": 1,
+    "task_type": "GPU",
+    "threads_per_worker": -1,
+    "devices": None,
+    "pruner": "median",
+    "report_every": 25,
+    "n_trials": 99999,
+    "mode": "full",
+    "rungs": 3,
+    "reduction_factor": 3,
+    "configs_per_bracket": 27,
+    "min_iterations": 50,
+    "subset_seed": 42,
+}
+
+STORAGE_PATH = "sqlite:///results/optuna_study.db"
+STUDY_NAME = "catboost_sweep"
+
+
+class CatBoostPruningCallback:
+    """Reports the validation metric to Optuna every `report_every` iterations and stops the fit once the trial should be pruned."""
+
+    def __init__(self, trial, metric, report_every):
+        self.trial = trial
+        self.metric = metric
+        self.report_every = report_every
+        self.pruned = False
+
+    def after_iteration(self, info):
+        if info.iteration % self.report_every != 0:
+            return True
+        value = info.metrics["validation"][self.metric][-1]
+        self.trial.report(value, step=info.iteration)
+        if self.trial.should_prune():
+            self.pruned = True
+            return False
+        return True
+
+
+def make_pruner(sweep_cfg):
+    name = sweep_cfg["pruner"]
+    if name == "median":
+        return optuna.pruners.MedianPruner(n_startup_trials=5, n_warmup_steps=2 * sweep_cfg["report_every"])
+    if name == "hyperband":
+        return optuna.pruners.HyperbandPruner(min_resource=sweep_cfg["report_every"], max_resource=1000, reduction_factor=3)
+    if name in (None, "none"):
+        return optuna.pruners.NopPruner()
+    raise ValueError(f"Unknown pruner: {name}")
+
+
+def sweep_settings(config):
+    sweep_cfg = {**SWEEP_DEFAULTS, **(config.get("sweep") or {})}
+    # CPU-only machines run the same sweep on CPU instead of failing every GPU trial
+    sweep_cfg["task_type"] = resolve_task_type(sweep_cfg["task_type"])
+    # -1 splits the machine's cores evenly between the workers
+    if sweep_cfg["threads_per_worker"] == -1:
+        sweep_cfg["threads_per_worker"] = max(1, (os.cpu_count() or 1) // max(1, sweep_cfg["workers"]))
+    return sweep_cfg
+
+
+def render_heartbeat(best_score, plot_path="results/heartbeat_score_plot.png"):
+    """Heartbeat body and score plot for the last 4 hours; runs on the notifier thread."""
+    now = datetime.datetime.now().strftime("%y-%m-%d %H:%M:%S")
+
+    # Filter for last 4 hours (own connection: sqlite connections stay on the thread that opened them)
+    cutoff = pd.Timestamp.now() - pd.Timedelta(hours=4)
+    conn = open_log()
+    try:
+        recent = recent_trials(conn, cutoff)
+    finally:
+        conn.close()
+
+    # Plot recent scores (Figure API, no pyplot global state off the main thread)
+    fig = Figure(figsize=(10, 4))
+    ax = fig.add_subplot()
+    ax.plot(recent['timestamp'], recent['score'], marker='o', label="All Scores")
+    if not recent.empty:
+        best_recent = recent['score'].cummax()
+        ax.plot(recent['timestamp'], best_recent, linestyle='--', label="Best Score")
+    ax.tick_params(axis='x', labelrotation=45)
+    ax.set_title("Sweep Scores - Last 4 Hours")
+    ax.set_xlabel("Timestamp")
+    ax.set_ylabel("Score")
+    ax.legend()
+    fig.tight_layout()
+    fig.savefig(plot_path)
+
+    # Determine score delta
+    delta_msg = ""
+    if not recent.empty:
+        delta = best_recent.iloc[-1] - best_recent.iloc[0]
+        delta_msg = f"Best score change in last 4hr: {delta:+.4f}"
+
+    return f"Best score: {best_score:.4f} at {now}\n{delta_msg}", plot_path
+
+
 def run_sweep():
     config = load_config("config.yaml")
-    X_train, y_train = load_dataset(config['train_path'], config['feature_columns'], config['label_column'])
-    X_val, y_val = load_dataset(config['val_path'], config['feature_columns'], config['label_column'])
+    sweep_cfg = sweep_settings(config)
+    os.makedirs("results", exist_ok=True)
+
+    # Quantize the datasets once (or reuse the cache) before any worker starts
+    profiler = StageProfiler.from_config(config, "sweep")
+    with profiler.stage("prepare_pools"):
+        prepare_pools(config)
+    profiler.flush()
+
+    # Create the study once up front so workers only ever load it
+    optuna.create_study(direction="maximize", study_name=STUDY_NAME, storage=STORAGE_PATH, load_if_exists=True)
 
-    log_path = "results/sweep_log.csv"
+    if sweep_cfg["workers"] <= 1:
+        run_worker(0, config)
+        return
+
+    print(f"Launching {sweep_cfg['workers']} sweep workers against {STORAGE_PATH}...")
+    ctx = mp.get_context("spawn")
+    procs = [ctx.Process(target=run_worker, args=(worker_id, config)) for worker_id in range(sweep_cfg["workers"])]
+    for proc in procs:
+        proc.start()
+    try:
+        for proc in procs:
+            proc.join()
+    except KeyboardInterrupt:
+        for proc in procs:
+            proc.join()
+
+
+def halving_fidelities(sweep_cfg):
+    """Training-set fractions of the successive-halving rungs, e.g. [0.1111, 0.3333, 1.0] for 3 rungs and factor 3."""
+    eta, rungs = sweep_cfg["reduction_factor"], sweep_cfg["rungs"]
+    return [round(float(eta) ** (rung - rungs + 1), 4) for rung in range(rungs)]
+
+
+def fidelity_pool(train_pool, labels, fidelity, seed):
+    """Stratified subset of the quantized training pool; subsets of one seed are nested across fidelities."""
+    if fidelity >= FULL_FIDELITY:
+        return train_pool
+    return train_pool.slice(stratified_indices(labels, fidelity, seed))
+
+
+def fidelity_iterations(params, fidelity, sweep_cfg):
+    """Iterations a configuration trains for at one fidelity: scaled by the data fraction, but at least min_iterations."""
+    if fidelity >= FULL_FIDELITY:
+        return params["iterations"]
+    return max(sweep_cfg["min_iterations"], round(params["iterations"] * fidelity))
+
+
+def run_halving(study, sweep_cfg, train_pool, suggest_params, train_and_log, profiler):
+    """Successive halving: brackets of configurations start on a small stratified subset with scaled
+    iterations; the best 1/reduction_factor of each rung moves on to the next fidelity, up to the full data.
+
+    Trials go through Optuna's ask/tell API. A trial reports its score at every rung it reached, with
+    the rung's iteration budget as the step, the same scale as CatBoostPruningCallback's steps in a
+    shared study. Only trials that reach full data complete; the others are told as pruned, or as
+    failed when a fit raises anything but TrialPruned.
+    """
+    fidelities = halving_fidelities(sweep_cfg)
+    eta = sweep_cfg["reduction_factor"]
+    labels = np.asarray(train_pool.get_label())
+    pools = {}
+    sampled = 0
+
+    while sampled < sweep_cfg["n_trials"]:
+        n_configs = min(sweep_cfg["configs_per_bracket"], sweep_cfg["n_trials"] - sampled)
+        candidates = []
+        for _ in range(n_configs):
+            trial = study.ask()
+            candidates.append((trial, suggest_params(trial)))
+        sampled += n_configs
+        # Steps already reported per trial of this bracket
+        reported = {}
+
+        for rung, fidelity in enumerate(fidelities):
+            if fidelity not in pools:
+                pools[fidelity] = fidelity_pool(train_pool, labels, fidelity, sweep_cfg["subset_seed"])
+            scored = []
+            pending = {trial.number: trial for trial, _ in candidates}
+            try:
+                for trial, params in candidates:
+                    try:
+                        score = train_and_log(trial, params, pools[fidelity], fidelity)
+                    except optuna.exceptions.TrialPruned:
+                        study.tell(trial, state=optuna.trial.TrialState.PRUNED)
+                        del pending[trial.number]
+                        continue
+                    step = fidelity_iterations(params, fidelity, sweep_cfg)
+                    # min_iterations can give two rungs the same budget; Optuna keeps only the first value of a step
+                    if step not in reported.setdefault(trial.number, set()):
+                        trial.report(score, step=step)
+                        reported[trial.number].add(step)
+                    scored.append((score, trial, params))
+            except BaseException:
+                # Untold trials of the bracket would otherwise stay RUNNING in the study storage
+                for trial in pending.values():
+                    study.tell(trial, state=optuna.trial.TrialState.FAIL)
+                raise
+            profiler.flush()
+
+            scored.sort(key=lambda item: item[0], reverse=True)
+            if fidelity == FULL_FIDELITY:
+                for score, trial, _ in scored:
+                    study.tell(trial, score)
+                break
+
+            keep = max(1, len(scored) // eta)
+            print(f"Rung {rung} (fidelity {fidelity}): promoting {keep} of {len(scored)} configurations")
+            for _, trial, _ in scored[keep:]:
+                study.tell(trial, state=optuna.trial.TrialState.PRUNED)
+            candidates = [(trial, params) for _, trial, params in scored[:keep]]
+
+
+def run_worker(worker_id, config):
+    sweep_cfg = sweep_settings(config)
+    # Per-stage wall/CPU time and peak RSS of every trial (results/profile.jsonl + Prometheus textfile)
+    profiler = StageProfiler.from_config(config, "sweep", {"worker": worker_id})
+
+    # Pre-quantized pools shared by every trial; validation is already restricted to labels seen in training
+    with profiler.stage("load_pools"):
+        train_pool, val_pool, y_val = load_pools(config)
+
+    # Device and per-worker compute budget; kept out of params so they do not change the config hash
+    runtime_params = {"task_type": sweep_cfg["task_type"]}
+    if sweep_cfg["task_type"] == "CPU":
+        runtime_params["thread_count"] = sweep_cfg["threads_per_worker"]
+    elif sweep_cfg["devices"]:
+        runtime_params["devices"] = str(sweep_cfg["devices"][worker_id % len(sweep_cfg["devices"])])
+
+    # Append-only trial log (SQLite, indexed on config_hash); imports results/sweep_log.csv on first use
     os.makedirs("results", exist_ok=True)
-    log_exists = os.path.exists(log_path)
-    all_trials = pd.read_csv(log_path) if log_exists else pd.DataFrame(columns=[
-        "trial", "config_hash", "score", "accuracy", "f1", "log_loss", "duration", "timestamp"])
+    log_conn = open_log()
+
+    notifier = Notifier()
 
     best_score = -999.0
     last_heartbeat = time.time()
     trial_idx = 0
 
-    def objective(trial):
-        nonlocal best_score, trial_idx, all_trials, last_heartbeat
-
-        params = {
+    def suggest_params(trial):
+        return {
             "iterations": trial.suggest_int("iterations", 100, 1000),
             "depth": trial.suggest_int("depth", 4, 11),
             "learning_rate": trial.suggest_float("learning_rate", 0.01, 0.3),
@@ -65,107 +288,118 @@ def run_sweep():
             "random_strength": trial.suggest_float("random_strength", 1e-3, 5.0, log=True),
             "eval_metric": "Accuracy",
             "loss_function": "MultiClass",
-            "task_type": "GPU",
             "verbose": 0
         }
 
-        model = CatBoostClassifier(**params)
-        start = time.time()
+    def train_and_log(trial, params, pool=train_pool, fidelity=FULL_FIDELITY, pruning_callback=None):
+        """Fit params (iterations scaled to the fidelity) on pool, score on validation and log the result.
 
-        valid_mask = y_val.isin(y_train.unique())
-        X_val_filtered = X_val[valid_mask]
-        y_val_filtered = y_val[valid_mask]
+        Raises TrialPruned for configurations already logged at this fidelity, failed fits and pruned fits.
+        """
+        nonlocal best_score, trial_idx, last_heartbeat
+
+        # The hash is always that of the full-fidelity params, so one configuration has one hash per fidelity
+        config_hash = json.dumps(params, sort_keys=True)
+        # Legacy runs were GPU-only and logged task_type as part of the hash
+        legacy_hash = json.dumps({**params, "task_type": "GPU"}, sort_keys=True)
+        if has_config(log_conn, config_hash, fidelity) or has_config(log_conn, legacy_hash, fidelity):
+            raise optuna.exceptions.TrialPruned()
+
+        fit_params = {**params, "iterations": fidelity_iterations(params, fidelity, sweep_cfg)}
+        model = CatBoostClassifier(**fit_params, **runtime_params)
+        labels = {"trial": trial.number, "fidelity": fidelity}
+        start = time.time()
 
         try:
-            model.fit(X_train, y_train, eval_set=(X_val_filtered, y_val_filtered), use_best_model=True)
+            with profiler.stage("fit", **labels) as fit_stage:
+                model.fit(pool, eval_set=val_pool, use_best_model=True,
+                          callbacks=[pruning_callback] if pruning_callback else None)
+                fit_stage["items"] = model.tree_count_
         except Exception as fit_err:
             tb = traceback.format_exc()
-            sendText("CUDA Error", f"Trial {trial_idx} failed.\nDepth={params['depth']} Iter={params['iterations']} L2={params['l2_leaf_reg']:.5f}\nError: {str(fit_err)[:240]}")
+            notifier.notify("CUDA Error", f"Trial {trial_idx} failed.\nDepth={params['depth']} Iter={fit_params['iterations']} L2={params['l2_leaf_reg']:.5f}\nError: {str(fit_err)[:240]}")
+            raise optuna.exceptions.TrialPruned()
+
+        if pruning_callback is not None and pruning_callback.pruned:
             raise optuna.exceptions.TrialPruned()
 
-        acc, f1, loss = score_model(model, X_val_filtered, y_val_filtered)
+        acc, f1, loss = score_model(model, val_pool, y_val, profiler, **labels)
         duration = time.time() - start
         final_score = score_function(acc, f1, loss, duration, model.tree_count_)
 
-        config_hash = json.dumps(params, sort_keys=True)
-
-        if not all_trials.empty and config_hash in all_trials['config_hash'].values:
+        now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        # Another worker may have finished the same configuration in the meantime
+        with profiler.stage("log_write", **labels):
+            appended = append_trial(log_conn, trial.number, config_hash, final_score, acc, f1, loss, duration, now, fidelity)
+        if not appended:
             raise optuna.exceptions.TrialPruned()
 
-        now = datetime.datetime.now().strftime("%y-%m-%d %H:%M:%S")
-        all_trials.loc[len(all_trials)] = [trial_idx, config_hash, final_score, acc, f1, loss, duration, now]
-        all_trials.to_csv(log_path, index=False)
+        trial_idx += 1
+        # Subset scores only rank configurations within their rung
+        if fidelity < FULL_FIDELITY:
+            return final_score
 
         if final_score > best_score:
             best_score = final_score
 
         date = datetime.datetime.now().strftime("%y-%m-%d %H:%M:%S")
         config_id = f"{date}_score{final_score:.4f}"
-        with open(os.path.join("results", f"{config_id}_config.json"), 'w') as f:
-            json.dump(params, f, indent=2)
-
-        if (time.time() - last_heartbeat) > 1800/2:
-            now = datetime.datetime.now().strftime("%y-%m-%d %H:%M:%S")
-
-            # Filter for last 4 hours
-            all_trials['timestamp'] = pd.to_datetime(all_trials['timestamp'], format="%y-%m-%d %H:%M:%S")
-            cutoff = pd.Timestamp.now() - pd.Timedelta(hours=4)
-            recent = all_trials[all_trials['timestamp'] > cutoff]
-
-            # Plot recent scores
-            plt.figure(figsize=(10, 4))
-            plt.plot(recent['timestamp'], recent['score'], marker='o', label="All Scores")
-            if not recent.empty:
-                best_recent = recent['score'].cummax()
-                plt.plot(recent['timestamp'], best_recent, linestyle='--', label="Best Score")
-            plt.xticks(rotation=45, ha='right')
-            plt.title("Sweep Scores - Last 4 Hours")
-            plt.xlabel("Timestamp")
-            plt.ylabel("Score")
-            plt.legend()
-            plt.tight_layout()
-            plot_path = "results/heartbeat_score_plot.png"
-            plt.savefig(plot_path)
-            plt.close()
-
-            # Determine score delta
-            delta_msg = ""
-            if not recent.empty:
-                delta = best_recent.iloc[-1] - best_recent.iloc[0]
-                delta_msg = f"Best score change in last 4hr: {delta:+.4f}"
-
-            sendText("Sweep Heartbeat", f"Best score: {best_score:.4f} at {now}\n{delta_msg}", plot_path)
+        with profiler.stage("config_write", **labels):
+            with open(os.path.join("results", f"{config_id}_config.json"), 'w') as f:
+                json.dump(params, f, indent=2)
+
+        if worker_id == 0 and (time.time() - last_heartbeat) > 1800/2:
+            # Querying the log and plotting happen on the notifier thread, not in the trial loop;
+            # "notify" times the enqueue, "heartbeat_render" the render on the notifier thread
+            def render(score=best_score, labels=labels):
+                with profiler.stage("heartbeat_render", background=True, **labels):
+                    return render_heartbeat(score)
+
+            with profiler.stage("notify", **labels):
+                notifier.notify("Sweep Heartbeat", render=render)
             last_heartbeat = time.time()
 
-        trial_idx += 1
         return final_score
 
+    def objective(trial):
+        # Python callbacks are CPU-only in CatBoost, so GPU trials are scored only at the end
+        pruning_callback = None
+        if sweep_cfg["task_type"] == "CPU":
+            pruning_callback = CatBoostPruningCallback(trial, "Accuracy", sweep_cfg["report_every"])
+        return train_and_log(trial, suggest_params(trial), pruning_callback=pruning_callback)
+
     try:
-        print("Starting hyperparameter sweep with resume support...")
-        storage_path = "sqlite:///results/optuna_study.db"
-        study_name = "catboost_sweep"
-
-        study = optuna.create_study(
-            direction="maximize",
-            study_name=study_name,
-            storage=storage_path,
-            load_if_exists=True
+        print(f"Worker {worker_id}: starting hyperparameter sweep with resume support...")
+
+        study = optuna.load_study(
+            study_name=STUDY_NAME,
+            storage=STORAGE_PATH,
+            pruner=make_pruner(sweep_cfg)
         )
 
-        study.optimize(objective, n_trials=99999)
+        if sweep_cfg["mode"] == "halving":
+            run_halving(study, sweep_cfg, train_pool, suggest_params, train_and_log, profiler)
+        else:
+            # Export the stage totals after every trial, pruned ones included
+            study.optimize(objective, n_trials=sweep_cfg["n_trials"],
+                           callbacks=[lambda study, trial: profiler.flush()])
 
     except KeyboardInterrupt:
         now = datetime.datetime.now().strftime("%y%m%d_%H:%M:%S")
-        sendText("Sweep Interrupted", f"Stopped manually. Best score: {best_score:.4f} at {now}")
+        notifier.notify("Sweep Interrupted", f"Stopped manually. Best score: {best_score:.4f} at {now}")
 
     except Exception as e:
         tb = traceback.format_exc()
-        sendText("Sweep Crashed", tb[-500:])
+        notifier.notify("Sweep Crashed", tb[-500:])
         raise
 
     else:
         now = datetime.datetime.now().strftime("%y%m%d_%H:%M:%S")
-        sendText("Sweep Finished", f"Completed successfully at {now}. Best score: {best_score:.4f}")
+        notifier.notify("Sweep Finished", f"Completed successfully at {now}. Best score: {best_score:.4f}")
+
+    finally:
+        notifier.close()
+        log_conn.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,224 @@
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from notifier import Notifier
+from text2 import MissingCredentialsError
+
+
+class StubSender:
+    """Records every send; `gate` holds the notifier thread inside its first send, `failures` raise first."""
+
+    def __init__(self, failures=(), gate=None):
+        self.calls = []
+        self.failures = list(failures)
+        self.gate = gate
+        self.entered = threading.Event()
+
+    def __call__(self, subject, body, image_path=None, timeout=None):
+        self.calls.append((time.time(), subject, body))
+        self.entered.set()
+        if self.gate is not None:
+            self.gate.wait(5)
+            self.gate = None
+        if self.failures:
+            raise self.failures.pop(0)
+
+
+def quiet_notifier(send, **kwargs):
+    return Notifier(send=send, min_interval=0.0, backoff=0.01, log=lambda message: None, **kwargs)
+
+
+def test_notify_does_not_wait_for_send():
+    gate = threading.Event()
+    send = StubSender(gate=gate)
+    notifier = quiet_notifier(send)
+    start = time.time()
+    for i in range(20):
+        notifier.notify("Heartbeat", str(i), key=f"k{i}")
+    assert time.time() - start < 0.5
+    gate.set()
+    notifier.close()
+    assert notifier.sent == 20
+
+
+def test_full_queue_drops_oldest():
+    gate = threading.Event()
+    send = StubSender(gate=gate)
+    notifier = quiet_notifier(send, max_queue=2)
+    notifier.notify("first")
+    assert send.entered.wait(5)
+    for subject in ("a", "b", "c", "d"):
+        notifier.notify(subject)
+    gate.set()
+    notifier.close()
+    assert notifier.dropped == 2
+    assert [subject for _, subject, _ in send.calls] == ["first", "c", "d"]
+
+
+def test_pending_messages_with_same_key_coalesce():
+    gate = threading.Event()
+    send = StubSender(gate=gate)
+    notifier = quiet_notifier(send)
+    notifier.notify("first")
+    assert send.entered.wait(5)
+    for i in range(5):
+        notifier.notify("Sweep Heartbeat", f"Best score: {i}")
+    notifier.notify("Model Training Update", "done")
+    gate.set()
+    notifier.close()
+    assert notifier.coalesced == 4
+    assert [body for _, _, body in send.calls] == ["", "Best score: 4", "done"]
+
+
+def test_sends_respect_min_interval():
+    send = StubSender()
+    notifier = Notifier(send=send, min_interval=0.2, log=lambda message: None)
+    for subject in ("a", "b", "c"):
+        notifier.notify(subject)
+    notifier.close()
+    times = [sent_at for sent_at, _, _ in send.calls]
+    assert len(times) == 3
+    assert all(later - earlier >= 0.19 for earlier, later in zip(times, times[1:]))
+
+
+def test_failed_send_is_retried():
+    send = StubSender(failures=[RuntimeError("503"), ValueError("bad json")])
+    notifier = quiet_notifier(send, max_retries=3)
+    notifier.notify("retry me")
+    notifier.close()
+    assert len(send.calls) == 3
+    assert (notifier.sent, notifier.failed) == (1, 0)
+
+
+def test_gives_up_after_max_retries():
+    send = StubSender(failures=[RuntimeError("503")] * 3)
+    notifier = quiet_notifier(send, max_retries=2)
+    notifier.notify("never delivered")
+    notifier.close()
+    assert len(send.calls) == 3
+    assert (notifier.sent, notifier.failed) == (0, 1)
+
+
+def test_missing_credentials_are_not_retried():
+    send = StubSender(failures=[MissingCredentialsError("no token")])
+    notifier = quiet_notifier(send, max_retries=3)
+    notifier.notify("no credentials")
+    notifier.close()
+    assert len(send.calls) == 1
+    assert (notifier.sent, notifier.failed) == (0, 1)
+
+
+def test_render_runs_on_notifier_thread():
+    send = StubSender()
+    notifier = quiet_notifier(send)
+    threads = []
+
+    def render():
+        threads.append(threading.current_thread().name)
+        return "rendered", None
+
+    notifier.notify("Heartbeat", render=render)
+    notifier.close()
+    assert threads == ["notifier"]
+    assert send.calls[0][2] == "rendered"
+
+
+class TelegramStub:
+    """Local stand-in for the Telegram API: answers each request with the next (status, delay) of `responses`."""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                stub.requests.append((time.time(), self.path, json.loads(body)))
+                status, delay = stub.responses.pop(0) if stub.responses else (200, 0)
+                time.sleep(delay)
+                try:
+                    self.send_response(status)
+                    self.send_header("Content-Type", "application/json")
+                    self.end_headers()
+                    self.wfile.write(json.dumps({"ok": status == 200}).encode())
+                except OSError:
+                    # The client timed out and closed the connection
+                    pass
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def telegram(monkeypatch):
+    stubs = []
+
+    def start(responses=()):
+        stub = TelegramStub(responses)
+        stubs.append(stub)
+        monkeypatch.setenv("TELEGRAM_API_URL", stub.url)
+        monkeypatch.setenv("TELEGRAM_BOT_TOKEN", "stub-token")
+        monkeypatch.setenv("TELEGRAM_CHAT_ID", "stub-chat")
+        return stub
+
+    yield start
+    for stub in stubs:
+        stub.close()
+
+
+def test_send_telegram_retries_after_server_error(telegram):
+    stub = telegram([(500, 0)])
+    notifier = Notifier(min_interval=0.0, backoff=2.0, log=lambda message: None)
+    notifier.notify("Sweep Heartbeat", "Best score: 1")
+    notifier.close()
+    assert (notifier.sent, notifier.failed) == (1, 0)
+    assert [path for _, path, _ in stub.requests] == ["/botstub-token/sendMessage"] * 2
+    assert stub.requests[1][2]["chat_id"] == "stub-chat"
+    # First retry waits backoff ** 0 = 1 second
+    assert stub.requests[1][0] - stub.requests[0][0] >= 0.95
+
+
+def test_send_telegram_retries_after_timeout(telegram):
+    stub = telegram([(200, 1.0)])
+    notifier = Notifier(timeout=0.2, min_interval=0.0, log=lambda message: None)
+    start = time.time()
+    notifier.notify("Model Training Update", "done")
+    notifier.close()
+    assert (notifier.sent, notifier.failed) == (1, 0)
+    assert len(stub.requests) == 2
+    # The first attempt gave up after the request timeout instead of waiting for the slow reply
+    assert stub.requests[1][0] - start < 1.0 + 1.0
+
+
+def test_send_telegram_gives_up_after_repeated_server_errors(telegram):
+    stub = telegram([(502, 0)] * 3)
+    notifier = Notifier(max_retries=2, backoff=0.01, min_interval=0.0, log=lambda message: None)
+    notifier.notify("Sweep Crashed")
+    notifier.close()
+    assert (notifier.sent, notifier.failed) == (0, 1)
+    assert len(stub.requests) == 3
+
+
+def test_send_telegram_without_credentials_is_not_retried(telegram, monkeypatch):
+    stub = telegram()
+    monkeypatch.delenv("TELEGRAM_BOT_TOKEN")
+    messages = []
+    notifier = Notifier(min_interval=0.0, log=messages.append)
+    notifier.notify("Sweep Finished")
+    notifier.close()
+    assert (notifier.sent, notifier.failed) == (0, 1)
+    assert stub.requests == []
+    assert "TELEGRAM_BOT_TOKEN" in messages[0]
@@ -0,0 +1,90 @@
+import json
+from contextlib import closing
+
+import numpy as np
+import optuna
+import pytest
+from catboost import Pool
+
+from profiling import StageProfiler
+from sweep_log import open_log, has_config, append_trial, FULL_FIDELITY
+from sweep_parameter import SWEEP_DEFAULTS, STUDY_NAME, fidelity_iterations, halving_fidelities, run_halving
+
+
+SWEEP_CFG = {**SWEEP_DEFAULTS, "n_trials": 9, "configs_per_bracket": 9, "rungs": 3, "reduction_factor": 3,
+             "min_iterations": 50}
+
+
+def suggest_params(trial):
+    return {
+        "iterations": trial.suggest_int("iterations", 100, 1000),
+        "depth": trial.suggest_int("depth", 4, 11),
+        "learning_rate": trial.suggest_float("learning_rate", 0.01, 0.3),
+    }
+
+
+class FakeTrainer:
+    """train_and_log without the fit: same log deduplication, score from the params; raises KeyboardInterrupt after `stop_after` fits."""
+
+    def __init__(self, log_conn, stop_after=None):
+        self.log_conn = log_conn
+        self.stop_after = stop_after
+        self.fits = []
+
+    def __call__(self, trial, params, pool, fidelity):
+        config_hash = json.dumps(params, sort_keys=True)
+        if has_config(self.log_conn, config_hash, fidelity):
+            raise optuna.exceptions.TrialPruned()
+        if self.stop_after is not None and len(self.fits) == self.stop_after:
+            raise KeyboardInterrupt()
+        self.fits.append((config_hash, fidelity, pool.num_row()))
+        score = params["learning_rate"] * fidelity
+        append_trial(self.log_conn, trial.number, config_hash, score, 0.0, 0.0, 0.0, 0.0, "2025-01-01 00:00:00", fidelity)
+        return score
+
+
+@pytest.fixture
+def train_pool():
+    rng = np.random.default_rng(0)
+    return Pool(rng.random((90, 3)), label=np.repeat([0, 1, 2], 30))
+
+
+def halving_sweep(tmp_path, train_pool, stop_after=None):
+    storage = f"sqlite:///{tmp_path / 'optuna_study.db'}"
+    study = optuna.create_study(direction="maximize", study_name=STUDY_NAME, storage=storage, load_if_exists=True,
+                                sampler=optuna.samplers.RandomSampler(seed=0))
+    with closing(open_log(str(tmp_path / "sweep_log.db"), legacy_csv=None)) as log_conn:
+        trainer = FakeTrainer(log_conn, stop_after)
+        try:
+            run_halving(study, SWEEP_CFG, train_pool, suggest_params, trainer, StageProfiler("sweep", enabled=False))
+        finally:
+            rows = log_conn.execute("SELECT config_hash, fidelity FROM trials").fetchall()
+    return study, trainer, rows
+
+
+def test_resumed_halving_sweep_skips_logged_configs(tmp_path, train_pool):
+    with pytest.raises(KeyboardInterrupt):
+        halving_sweep(tmp_path, train_pool, stop_after=4)
+
+    # Same sampler seed, so the resumed bracket samples the same nine configurations
+    study, trainer, rows = halving_sweep(tmp_path, train_pool)
+    fidelities = halving_fidelities(SWEEP_CFG)
+    assert [fidelity for _, fidelity, _ in trainer.fits] == [fidelities[0]] * 5 + [fidelities[1], FULL_FIDELITY]
+    assert len(rows) == len(set(rows)) == 4 + 5 + 1 + 1
+    assert [fidelity for _, fidelity, n_rows in trainer.fits if n_rows == train_pool.num_row()] == [FULL_FIDELITY]
+
+    states = [trial.state for trial in study.trials]
+    assert optuna.trial.TrialState.RUNNING not in states
+    assert states.count(optuna.trial.TrialState.COMPLETE) == 1
+
+
+def test_halving_reports_iteration_budgets_as_steps(tmp_path, train_pool):
+    study, _, _ = halving_sweep(tmp_path, train_pool)
+    fidelities = halving_fidelities(SWEEP_CFG)
+    for trial in study.trials:
+        budgets = {fidelity_iterations(trial.params, fidelity, SWEEP_CFG) for fidelity in fidelities}
+        # Budgets, not rung indices: the same scale as the per-iteration pruning callback
+        assert trial.intermediate_values
+        assert set(trial.intermediate_values) <= budgets
+        if trial.state == optuna.trial.TrialState.COMPLETE:
+            assert set(trial.intermediate_values) == budgets
@@ -10,6 +10,10 @@ import re
 
 load_dotenv()
 
+
+class MissingCredentialsError(ValueError):
+    """Raised when the environment lacks the credentials a sender needs."""
+
 def send_text(subject: str, body: str) -> None:
     email_address = os.getenv("EMAIL_ADDRESS")
     email_password = os.getenv("EMAIL_PASSWORD")
@@ -40,13 +44,15 @@ def escape_markdown_v2(text: str) -> str:
     return re.sub(r'([_*\[\]()~`>#+\-=|{}.!])', r'\\\1', text)
 
 
-def send_telegram(subject: str, body: str, image_path: str = None) -> None:
+def send_telegram(subject: str, body: str, image_path: str = None, timeout: float = 10.0) -> None:
     """Send a formatted Telegram message with optional image attachment."""
     bot_token = os.getenv("TELEGRAM_BOT_TOKEN")
     chat_id = os.getenv("TELEGRAM_CHAT_ID")
+    # Overridable so the notifier can be exercised against a local stub server
+    api_url = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org").rstrip("/")
 
     if not bot_token or not chat_id:
-        raise ValueError("TELEGRAM_BOT_TOKEN or TELEGRAM_CHAT_ID is missing from environment.")
+        raise MissingCredentialsError("TELEGRAM_BOT_TOKEN or TELEGRAM_CHAT_ID is missing from environment.")
 
     # Format timestamp in PST
     tz = pytz.timezone("America/Los_Angeles")
@@ -57,7 +63,7 @@ def send_telegram(subject: str, body: str, image_path: str = None) -> None:
 
 
     if image_path and os.path.isfile(image_path):
-        url = f"https://api.telegram.org/bot{bot_token}/sendPhoto"
+        url = f"{api_url}/bot{bot_token}/sendPhoto"
         with open(image_path, "rb") as img:
             files = {"photo": img}
             data = {
@@ -65,15 +71,15 @@ def send_telegram(subject: str, body: str, image_path: str = None) -> None:
                 "caption": message,
                 "parse_mode": "Markdown"
             }
-            response = requests.post(url, data=data, files=files)
+            response = requests.post(url, data=data, files=files, timeout=timeout)
     else:
-        url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
+        url = f"{api_url}/bot{bot_token}/sendMessage"
         payload = {
             "chat_id": chat_id,
             "text": message,
             "parse_mode": "MarkdownV2"
         }
-        response = requests.post(url, json=payload)
+        response = requests.post(url, json=payload, timeout=timeout)
 
     if not response.ok:
         raise RuntimeError(f"Telegram API error: {response.status_code} - {response.text}")
@@ -3,107 +3,139 @@ import json
 import yaml
 import time
 import datetime
+import hashlib
+import multiprocessing as mp
+from contextlib import closing
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 from catboost import CatBoostClassifier
 from sklearn.metrics import f1_score, accuracy_score
-from sklearn.model_selection import train_test_split
-from text2 import send_telegram as sendText
+from notifier import Notifier
+from profiling import StageProfiler
+from metrics_at_k import evaluate_model_at_ks
+from data_loading import resolve_task_type
+from dataset_cache import prepare_pools, load_pools
+from sweep_log import open_log, top_k
 
 LEADER_MODE = True
 
+MANIFEST_PATH = "final_models/manifest.json"
+SNAPSHOT_DIR = "final_models/snapshots"
+
+TRAINING_DEFAULTS = {
+    "workers": 1,
+    "task_type": "GPU",
+    "threads_per_worker": -1,
+    "snapshot_interval": 300,
+}
+
 def load_config(yaml_path="config.yaml"):
     with open(yaml_path, 'r') as f:
         return yaml.safe_load(f)
 
-def load_dataset(path, feature_cols, label_col):
-    df = pd.read_parquet(path)
-    X = df[feature_cols]
-    y = df[label_col]
-    return X, y
-
-def get_top_k_predictions(proba, k):
-    return np.argsort(proba, axis=1)[:, -k:][:, ::-1]
-
-def compute_precision_recall_f1_at_k(y_true, y_proba, k):
-    top_k_preds = get_top_k_predictions(y_proba, k)
-    precision_list = []
-    recall_list = []
-
-    for true_label, top_preds in zip(y_true, top_k_preds):
-        if true_label in top_preds:
-            precision = 1 / (np.where(top_preds == true_label)[0][0] + 1)
-            recall = 1.0
-        else:
-            precision = 0.0
-            recall = 0.0
-        precision_list.append(precision)
-        recall_list.append(recall)
-
-    avg_precision = np.mean(precision_list)
-    avg_recall = np.mean(recall_list)
-    if avg_precision + avg_recall == 0:
-        f1 = 0.0
-    else:
-        f1 = 2 * (avg_precision * avg_recall) / (avg_precision + avg_recall)
-
-    return avg_precision, avg_recall, f1
-
-def run_top_k_training(k=3):
-    config = load_config("config.yaml")
-    X_train, y_train = load_dataset(config['train_path'], config['feature_columns'], config['label_column'])
-    X_val, y_val = load_dataset(config['val_path'], config['feature_columns'], config['label_column'])
-
-    log_path = "results/sweep_log.csv"
-    os.makedirs("final_models", exist_ok=True)
-    log_exists = os.path.exists(log_path)
-    all_trials = pd.read_csv(log_path) if log_exists else pd.DataFrame()
-
-    if all_trials.empty:
-        print("No trials found in the sweep log.")
-        return
-
-    top_k_trials = all_trials.sort_values(by="score", ascending=False).head(k)
-
-    for idx, row in top_k_trials.iterrows():
-        params = json.loads(row['config_hash'])
-        # Overwrite for extended training
-        params['iterations'] = 10000
-        params['early_stopping_rounds'] = 300
-        params['use_best_model'] = True
-        params['verbose'] = 100
-        params['eval_metric'] = "MultiClass"
-
-        model = CatBoostClassifier(**params)
-        start_time = time.time()
-        model.fit(X_train, y_train, eval_set=(X_val, y_val))
-        duration = time.time() - start_time
-
-        y_pred = model.predict(X_val)
-        y_proba = model.predict_proba(X_val)
+def training_settings(config):
+    training_cfg = {**TRAINING_DEFAULTS, **(config.get("training") or {})}
+    # -1 splits the machine's cores evenly between the workers
+    if training_cfg["threads_per_worker"] == -1:
+        training_cfg["threads_per_worker"] = max(1, (os.cpu_count() or 1) // max(1, training_cfg["workers"]))
+    return training_cfg
+
+def load_manifest(path=MANIFEST_PATH):
+    """Finished models by job id; a job listed here with its model file on disk is not trained again."""
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def save_manifest(manifest, path=MANIFEST_PATH):
+    # Write-then-rename so an interrupted run never leaves a truncated manifest
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+def extended_params(config_hash, task_type):
+    params = json.loads(config_hash)
+    # Overwrite for extended training
+    params['iterations'] = 10000
+    params['early_stopping_rounds'] = 300
+    params['use_best_model'] = True
+    params['verbose'] = 100
+    params['eval_metric'] = "MultiClass"
+    # The device is not part of the swept config (legacy hashes still carry task_type);
+    # GPU falls back to CPU when no GPU is available
+    params['task_type'] = resolve_task_type(task_type)
+    return params
+
+def job_id(params, cache_path):
+    """Stable id of one retraining job: the training params and the pool cache they train on."""
+    key = json.dumps({"params": params, "pools": os.path.basename(cache_path)}, sort_keys=True)
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]
+
+def train_config(job, config, training_cfg):
+    """Train one configuration to completion, resuming from its snapshot file; runs in a worker process."""
+    profiler = StageProfiler.from_config(config, "train_top_k", {"model": f"K{job['rank_id']}"})
+    try:
+        return _train_config(job, config, training_cfg, profiler)
+    finally:
+        profiler.flush()
+
+def _train_config(job, config, training_cfg, profiler):
+    idx, params = job["rank_id"], job["params"]
+    # Pools come from the cache the parent built, so workers only read them
+    with profiler.stage("load_pools"):
+        train_pool, val_pool, y_val = load_pools(config)
+
+    # Thread budget and snapshot settings stay out of params so they do not change the job id
+    runtime_params = {
+        "save_snapshot": True,
+        "snapshot_file": os.path.abspath(os.path.join(SNAPSHOT_DIR, f"{job['job_id']}.cbsnapshot")),
+        "snapshot_interval": training_cfg["snapshot_interval"],
+        "train_dir": os.path.join("catboost_info", job["job_id"]),
+    }
+    if params['task_type'] == "CPU":
+        runtime_params["thread_count"] = training_cfg["threads_per_worker"]
+    os.makedirs(runtime_params["train_dir"], exist_ok=True)
+    if os.path.exists(runtime_params["snapshot_file"]):
+        print(f"Model K={idx}: resuming from {runtime_params['snapshot_file']}")
+
+    model = CatBoostClassifier(**params, **runtime_params)
+    start_time = time.time()
+    with profiler.stage("fit") as fit_stage:
+        model.fit(train_pool, eval_set=val_pool)
+        fit_stage["items"] = model.tree_count_
+    duration = time.time() - start_time
+
+    # One chunked top-30 pass gives @1/@5/@30 and the top-1 predictions (columns mapped through model.classes_)
+    with profiler.stage("predict_at_k", items=len(y_val)):
+        at_k, y_pred = evaluate_model_at_ks(model, val_pool, y_val, ks=(1, 5, 30))
+    with profiler.stage("metrics", items=len(y_val)):
         overall_f1 = f1_score(y_val, y_pred, average='weighted')
         acc = accuracy_score(y_val, y_pred)
 
-        p1, r1, f1_1 = compute_precision_recall_f1_at_k(y_val.values, y_proba, k=1)
-        p5, r5, f1_5 = compute_precision_recall_f1_at_k(y_val.values, y_proba, k=5)
-        p30, r30, f1_30 = compute_precision_recall_f1_at_k(y_val.values, y_proba, k=30)
+    p1, r1, f1_1 = at_k[1]
+    p5, r5, f1_5 = at_k[5]
+    p30, r30, f1_30 = at_k[30]
 
-        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        model_filename = f"final_models/model_K{idx+1}_{timestamp}.cbm"
-        plot_filename = f"final_models/loss_plot_K{idx+1}_{timestamp}.png"
-        metrics_filename = f"final_models/metrics_K{idx+1}_{timestamp}.txt"
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    model_filename = f"final_models/model_K{idx}_{timestamp}.cbm"
+    plot_filename = f"final_models/loss_plot_K{idx}_{timestamp}.png"
+    metrics_filename = f"final_models/metrics_K{idx}_{timestamp}.txt"
 
+    with profiler.stage("save_model"):
         model.save_model(model_filename)
 
-        if hasattr(model, 'get_evals_result'):
-            evals_result = model.get_evals_result()
-            if 'learn' in evals_result and 'Accuracy' in evals_result['learn']:
+    if hasattr(model, 'get_evals_result'):
+        evals_result = model.get_evals_result()
+        if 'learn' in evals_result and 'Accuracy' in evals_result['learn']:
+            with profiler.stage("plot"):
                 plt.figure(figsize=(10, 4))
                 plt.plot(evals_result['learn']['Accuracy'], label='Train Accuracy')
                 if 'validation' in evals_result and 'Accuracy' in evals_result['validation']:
                     plt.plot(evals_result['validation']['Accuracy'], label='Validation Accuracy')
-                plt.title(f"Model K={idx+1} Training Accuracy")
+                plt.title(f"Model K={idx} Training Accuracy")
                 plt.xlabel("Iteration")
                 plt.ylabel("Accuracy")
                 plt.legend()
@@ -111,8 +143,9 @@ def run_top_k_training(k=3):
                 plt.savefig(plot_filename)
                 plt.close()
 
+    with profiler.stage("metrics_write"):
         with open(metrics_filename, 'w') as f:
-            f.write(f"Model K={idx+1} - Trained on {timestamp}\n")
+            f.write(f"Model K={idx} - Trained on {timestamp}\n")
             f.write(f"Duration: {duration:.2f} seconds\n")
             f.write(f"Overall Accuracy: {acc:.4f}\n")
             f.write(f"Overall F1: {overall_f1:.4f}\n")
@@ -120,13 +153,98 @@ def run_top_k_training(k=3):
             f.write(f"Precision@5: {p5:.4f}\nRecall@5: {r5:.4f}\nF1@5: {f1_5:.4f}\n")
             f.write(f"Precision@30: {p30:.4f}\nRecall@30: {r30:.4f}\nF1@30: {f1_30:.4f}\n")
 
+    # The saved model supersedes the checkpoint
+    if os.path.exists(runtime_params["snapshot_file"]):
+        os.remove(runtime_params["snapshot_file"])
+
+    return {
+        "rank_id": int(idx),
+        "config_hash": job["config_hash"],
+        "model_path": model_filename,
+        "metrics_path": metrics_filename,
+        "plot_path": plot_filename if os.path.exists(plot_filename) else None,
+        "duration": duration,
+        "accuracy": acc,
+        "f1": overall_f1,
+        "f1_at_1": f1_1,
+        "f1_at_5": f1_5,
+        "f1_at_30": f1_30,
+        "finished_at": timestamp,
+    }
+
+def run_top_k_training(k=3):
+    config = load_config("config.yaml")
+    training_cfg = training_settings(config)
+    profiler = StageProfiler.from_config(config, "train_top_k")
+    # Same quantized pools as the sweep (validation restricted to labels seen in training), built once here
+    with profiler.stage("prepare_pools"):
+        cache_path = prepare_pools(config)
+    profiler.flush()
+
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    # Only full-fidelity trials: subset scores from a halving sweep are not comparable
+    with closing(open_log()) as log_conn:
+        top_k_trials = top_k(log_conn, k).set_index("rank_id")
+
+    if top_k_trials.empty:
+        print("No trials found in the sweep log.")
+        return
+
+    # Index is the trial's 1-based row in the log, so models keep their K<row> names
+    manifest = load_manifest()
+    jobs = []
+    for idx, row in top_k_trials.iterrows():
+        params = extended_params(row['config_hash'], training_cfg["task_type"])
+        job = {"rank_id": idx, "config_hash": row['config_hash'], "params": params,
+               "job_id": job_id(params, cache_path)}
+        finished = manifest.get(job["job_id"])
+        if finished and os.path.exists(finished["model_path"]):
+            print(f"Model K={idx} already trained: {finished['model_path']}")
+            continue
+        jobs.append(job)
+
+    if not jobs:
+        return
+
+    # Telegram updates are sent from a background thread so a slow endpoint never delays training
+    notifier = Notifier()
+
+    def record(job, result):
+        # Only the parent writes the manifest, one finished model at a time
+        with profiler.stage("manifest_write", model=f"K{result['rank_id']}"):
+            manifest[job["job_id"]] = result
+            save_manifest(manifest)
         if LEADER_MODE:
             message = (
-                f"✅ Model K={idx+1} Training Complete\n"
-                f"Overall F1: {overall_f1:.4f}, Acc: {acc:.4f}\n"
-                f"F1@1: {f1_1:.4f}, F1@5: {f1_5:.4f}, F1@30: {f1_30:.4f}"
+                f"✅ Model K={result['rank_id']} Training Complete\n"
+                f"Overall F1: {result['f1']:.4f}, Acc: {result['accuracy']:.4f}\n"
+                f"F1@1: {result['f1_at_1']:.4f}, F1@5: {result['f1_at_5']:.4f}, F1@30: {result['f1_at_30']:.4f}"
             )
-            sendText("Model Training Update", message, plot_filename)
+            with profiler.stage("notify", model=f"K{result['rank_id']}"):
+                notifier.notify("Model Training Update", message, result['plot_path'], key=f"model_K{result['rank_id']}")
+        profiler.flush()
+
+    workers = min(training_cfg["workers"], len(jobs))
+    try:
+        if workers <= 1:
+            for job in jobs:
+                record(job, train_config(job, config, training_cfg))
+            return
+
+        print(f"Training {len(jobs)} models on {workers} workers x {training_cfg['threads_per_worker']} threads...")
+        # Spawned workers, as in the sweep
+        with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn")) as pool:
+            futures = {pool.submit(train_config, job, config, training_cfg): job for job in jobs}
+            for future in as_completed(futures):
+                job = futures[future]
+                try:
+                    record(job, future.result())
+                except Exception as err:
+                    # The snapshot is kept, so the next run resumes this model
+                    print(f"Model K={job['rank_id']} failed: {err}")
+                    notifier.notify("Model Training Failed", f"Model K={job['rank_id']} failed: {str(err)[:240]}")
+    finally:
+        notifier.close()
 
 if __name__ == "__main__":
     run_top_k_training(k=3)